@@ -0,0 +1,71 @@
+"""
+Benchmarks interface_localDB._formatpxHistory on a synthetic 1min table
+
+    python benchmarks/bench_formatpxHistory.py [numRows]
+
+Compares the vectorized formatter against the previous per-row implementation and prints rows/second. 
+"""
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+from interface import interface_localDB as db
+
+pd.options.mode.chained_assignment = None
+
+def _remove_timezone_from_datestring(datestring):
+    if len(datestring) > 19:
+        return datestring[:19]
+    else:
+        return datestring
+
+""" previous implementation, kept here as the baseline """
+def _formatpxHistory_legacy(pxHistory):
+    pxHistory.reset_index(drop=True, inplace=True)
+    if pxHistory['interval'][1] == '1day':
+        pxHistory['date'] = pxHistory['date'].str[:10]
+    else: 
+        pxHistory['formatted_date'] = pxHistory['date'].apply(_remove_timezone_from_datestring)
+        pxHistory.drop(columns=['date'], inplace=True)
+        pxHistory.rename(columns={'formatted_date':'date'}, inplace=True)
+    pxHistory = pxHistory[~pxHistory['date'].duplicated()]
+    if pxHistory['interval'][1] == '1day':
+        pxHistory.loc[:,'date'] = pd.to_datetime(pxHistory['date'], format='%Y-%m-%d')
+    else:
+        pxHistory.loc[:,'date'] = pd.to_datetime(pxHistory['date'], format='%Y-%m-%d %H:%M:%S')
+    pxHistory['date'] = pd.to_datetime(pxHistory['date'])
+    pxHistory = pxHistory.sort_values(by='date')
+    return pxHistory
+
+""" returns a px history frame shaped like a raw 1min table read from sqlite """
+def _makeRawHistory(numRows):
+    dates = pd.date_range('2014-01-02 09:30', periods=numRows, freq='min')
+    close = 15 + np.cumsum(np.random.normal(0, 0.01, numRows))
+    return pd.DataFrame({
+        'date': dates.strftime('%Y-%m-%d %H:%M:%S') + '-05:00',
+        'open': close, 'high': close, 'low': close, 'close': close,
+        'volume': np.zeros(numRows),
+        'symbol': 'VIX', 'interval': '1min'})
+
+def _time(func, raw, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        frame = raw.copy()
+        start = time.perf_counter()
+        func(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == '__main__':
+    numRows = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    raw = _makeRawHistory(numRows)
+
+    t_legacy = _time(_formatpxHistory_legacy, raw, repeat=1)
+    t_vectorized = _time(lambda frame: db._formatpxHistory(frame, '1min'), raw)
+
+    print('rows: %d'%(numRows))
+    print('legacy     : %8.3fs  %12.0f rows/s'%(t_legacy, numRows/t_legacy))
+    print('vectorized : %8.3fs  %12.0f rows/s  (%.1fx)'%(t_vectorized, numRows/t_vectorized, t_legacy/t_vectorized))
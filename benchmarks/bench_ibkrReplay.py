@@ -0,0 +1,82 @@
+"""
+Benchmarks the historical fetcher and bar streaming against interface_ibkrReplay on a synthetic db
+
+    python benchmarks/bench_ibkrReplay.py [numSymbols] [latency]
+
+Prints fetcher throughput with one request in flight vs several, and how far streamed bars lag the replay clock at 1000x.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+from interface import interface_ibkr as ib
+from interface import interface_localDB as db
+from interface import interface_ibkrFetcher as fetcher
+from interface.interface_ibkrReplay import ReplayIB
+
+numDays = 4
+
+""" writes numSymbols 1min tables covering numDays days, shaped like tables saved from IBKR """
+def _makeDB(dbname, numSymbols):
+    dates = pd.date_range('2024-01-02 00:00', periods=numDays * 1440, freq='min')
+    with sqlite3.connect(dbname) as conn:
+        for i in range(numSymbols):
+            close = 15 + np.cumsum(np.random.normal(0, 0.01, len(dates)))
+            pd.DataFrame({
+                'date': dates.strftime('%Y-%m-%d %H:%M:%S') + '-05:00',
+                'open': close, 'high': close, 'low': close, 'close': close,
+                'volume': np.zeros(len(dates)),
+                'symbol': 'SYM%d'%(i), 'interval': '1min'}).to_sql('SYM%d_stock_1min'%(i), conn, index=False)
+
+def _fetch(dbname, numSymbols, latency, maxInFlight):
+    ibkr = ReplayIB(dbname, start='2024-01-06', latency=latency, enforcePacing=False).connect()
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxInFlight=maxInFlight)
+    for i in range(numSymbols):
+        for day in range(1, numDays):
+            historicalFetcher.submit(fetcher.BarRequest('SYM%d'%(i), '1 D', '1 min', endDate=pd.Timestamp('2024-01-02') + pd.Timedelta(days=day)))
+    start = time.perf_counter()
+    results = historicalFetcher.run()
+    elapsed = time.perf_counter() - start
+    return len(results), sum(len(bars) for bars in results.values()), elapsed
+
+def _stream(dbname, numSymbols, speed=1000, seconds=3):
+    ibkr = ReplayIB(dbname, start='2024-01-03 09:30', speed=speed, enforcePacing=False).connect()
+    lags = []
+    def _onBar(symbol, bar):
+        # the bar was complete once the replay clock passed its end
+        lags.append((ibkr.now() - (pd.Timestamp(bar.date).tz_localize(None) + pd.Timedelta(minutes=1))).total_seconds() / speed)
+
+    streams = [ib.BarStream('SYM%d'%(i), '1 min', '1 D', capacity=5000) for i in range(numSymbols)]
+    for stream in streams:
+        stream.subscribe(_onBar)
+        stream.ensureStarted(ibkr)
+    ibkr.sleep(seconds)
+    return len(lags), np.mean(lags) * 1000, np.max(lags) * 1000
+
+if __name__ == '__main__':
+    numSymbols = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    tmpdir = tempfile.mkdtemp()
+    # interface_localDB copied config.dir_pxHistoryCache at import, point its own copy at the scratch dir
+    db.dir_pxHistoryCache = tmpdir
+    dbname = os.path.join(tmpdir, 'replay.db')
+    try:
+        _makeDB(dbname, numSymbols)
+        print('symbols: %d, request latency: %.3fs'%(numSymbols, latency))
+        baseline = None
+        for maxInFlight in (1, 6):
+            numRequests, numBars, elapsed = _fetch(dbname, numSymbols, latency, maxInFlight)
+            baseline = baseline or elapsed
+            print('fetch, %d in flight : %8.3fs  %8.1f requests/s  %10.0f bars/s  (%.1fx)'%(maxInFlight, elapsed, numRequests/elapsed, numBars/elapsed, baseline/elapsed))
+
+        numBars, meanLag, maxLag = _stream(dbname, numSymbols)
+        print('stream, 1000x       : %d bars, lag mean %.1fms max %.1fms (wall clock)'%(numBars, meanLag, maxLag))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
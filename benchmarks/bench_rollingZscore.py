@@ -0,0 +1,67 @@
+"""
+Benchmarks the rolling z-score kernels in core/indicators on a synthetic 1min series
+
+    python benchmarks/bench_rollingZscore.py [numRows]
+
+Compares indicators.rolling_zscore against the previous O(n*w) numba kernel and the rolling().apply lambda
+used by Strategy._calc_zscore and realtime_monitor._calc_zscore, and prints rows/second per window.
+The rolling().apply baseline is timed on the first 100k rows only.
+"""
+import os
+import sys
+import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import pandas as pd
+from numba import njit
+from core import indicators
+
+applyRows = 100000
+
+""" previous implementation, kept here as the baseline """
+@njit
+def _rolling_zscore_legacy(values, rollingWindow):
+    n = len(values)
+    zscores = np.empty(n)
+    zscores[:] = np.nan
+
+    for i in range(rollingWindow - 1, n):
+        window = values[i - rollingWindow + 1:i + 1]
+        mean = np.mean(window)
+        std = np.std(window)
+        zscores[i] = (values[i] - mean) / std
+
+    return zscores
+
+def _rolling_zscore_apply(series, rollingWindow):
+    return series.rolling(rollingWindow).apply(lambda x: (x[-1] - x.mean()) / x.std(), raw=True)
+
+def _time(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == '__main__':
+    numRows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    dates = pd.date_range('2020-01-01', periods=numRows, freq='min')
+    close = pd.Series(15 + np.cumsum(np.random.normal(0, 0.01, numRows)), index=dates)
+    values = close.to_numpy()
+
+    # compile both kernels outside the timings
+    _rolling_zscore_legacy(values[:1000], 10)
+    indicators.rolling_zscore(values[:1000], 10)
+
+    print('rows: %d'%(numRows))
+    for rollingWindow in (252, 1215):
+        new, elapsed = _time(indicators.rolling_zscore, values, rollingWindow)
+        print('window %4d, kernel          : %8.3fs  %12.0f rows/s'%(rollingWindow, elapsed, numRows/elapsed))
+
+        legacy, legacyElapsed = _time(_rolling_zscore_legacy, values, rollingWindow)
+        print('window %4d, O(n*w) kernel   : %8.3fs  %12.0f rows/s  (%.1fx)'%(rollingWindow, legacyElapsed, numRows/legacyElapsed, legacyElapsed/elapsed))
+
+        applied, applyElapsed = _time(_rolling_zscore_apply, close.iloc[:applyRows], rollingWindow)
+        rows = min(applyRows, numRows)
+        print('window %4d, rolling().apply : %8.3fs  %12.0f rows/s  (%.1fx)'%(rollingWindow, applyElapsed, rows/applyElapsed, (applyElapsed/rows)/(elapsed/numRows)))
+
+        print('            max abs diff vs O(n*w) kernel: %.2e'%(np.nanmax(np.abs(new - legacy))))
@@ -2,10 +2,27 @@
 
 dbname_stock = '/workbench/historicalData/venv/saveHistoricalData/data/historicalData_index.db'
 dbname_termstructure = '/workbench/historicalData/venv/saveHistoricalData/data/termstructure.db'
+dir_pxHistoryCache = '/workbench/historicalData/venv/saveHistoricalData/data/pxHistoryCache'
+dir_barStore = '/workbench/historicalData/venv/saveHistoricalData/data/barStore'
+dbname_contractCache = '/workbench/historicalData/venv/saveHistoricalData/data/contractCache.db'
 release_dates_pce = '/workbench/historicalData/venv/saveHistoricalData/data/release_dates_PCE.xls'
 #dbname_analysisOptimizations = '/workbench/historicalData/venv/analysisOptimizations.db'
 dbname_analysisOptimizations = 'analysisOptimizations.db'
 
+############### Local DB
+
+use_pxHistoryCache = True # serve repeat px history loads from the columnar cache
+ohlc_schemaVersion = 2 # layout for new ohlc tables, 1: text dates + symbol/interval per row, 2: int64 epoch dates, typed columns
+use_derivedColumns = True # materialize returns, true range, session id, business day of month beside the bars on write
+
+############### IBKR
+
+ibkr_host = '127.0.0.1'
+ibkr_port = 7496
+ibkr_clientId = 10 # first client id handed out by the session manager, later sessions count up from here
+contractCache_ttlDays = 7 # contract details and head timestamps are re-requested from IBKR after this many days
+ibkr_replay = None # e.g. {'start': '2024-04-01 09:30', 'speed': 60} to serve sessions from the local db, see interface_ibkrReplay
+
 ############### Reference Lists
 
 _indexList = ['VIX', 'VIX3M', 'VVIX', 'SPX', 'VIX1D', 'TSX']
@@ -42,6 +59,27 @@ currency_mapping = {
     'ZT': 'USD'
 }
 
+# US/Eastern time the trading session opens, for symbols that don't trade midnight to midnight
+# resampled bars are anchored here so a session isn't split at midnight; sessions opening after noon belong to the next day's date
+session_start = {
+    'CL': '18:00',
+    'ES': '18:00',
+    'FV': '18:00',
+    'GC': '18:00',
+    'HG': '18:00',
+    'NQ': '18:00',
+    'SI': '18:00',
+    'TN': '18:00',
+    'TY': '18:00',
+    'UB': '18:00',
+    'US': '18:00',
+    'VX': '18:00',
+    'ZB': '18:00',
+    'ZF': '18:00',
+    'ZN': '18:00',
+    'ZT': '18:00'
+}
+
 exchange_mapping = {
     'CL': 'NYMEX',
     'DXJ': 'ARCA',
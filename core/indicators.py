@@ -18,43 +18,222 @@ def exponentially_weighted_moving_average(values, length, alpha):
         arr: array of prices
         length: lookback period
         alpha: smoothing factor for calculating weights. lower alpha gives more weight to recent prices
+    result[i] averages the length values before i with weights (1 - alpha) * alpha ** k, k = 0 for values[i-1]; NaN for i < length
+    or when the window holds a NaN. The weighted sum is updated recursively, O(1) per row, and recomputed every length rows.
     """
-    weights = np.array([(1 - alpha) * (alpha ** i) for i in range(length)])[::-1]
-    # print(weights)
-    result = np.empty(len(values))
+    n = len(values)
+    result = np.full(n, np.nan)
+    weights = alpha ** np.arange(length)
+    weightSum = weights.sum() # the (1 - alpha) factor cancels out
+    decay = alpha ** length
+
+    total = 0.0 # sum of alpha ** k * values[i-1-k]
+    nans = 0
+    for i in range(1, n + 1):
+        # values[i-1] enters the window of result[i], values[i-1-length] leaves it
+        x = values[i - 1]
+        if x != x:
+            nans += 1
+        if i > length and values[i - 1 - length] != values[i - 1 - length]:
+            nans -= 1
+
+        if i > length and (i - 1) % length == 0:
+            total = 0.0
+            for k in range(length):
+                if values[i - 1 - k] == values[i - 1 - k]:
+                    total += weights[k] * values[i - 1 - k]
+        else:
+            total *= alpha
+            if x == x:
+                total += x
+            if i > length:
+                old = values[i - 1 - length]
+                if old == old:
+                    total -= decay * old
+
+        if i < n and i >= length and nans == 0:
+            result[i] = total / weightSum
+
+    return result
+
+@njit
+def weighted_moving_average(values, length):
+    """
+    Calculates the linearly weighted moving average of a series, weights 1..length with the current value weighted length.
+    Same as rolling(length).apply(lambda x: np.dot(x, weights) / weights.sum()), NaN while the window is not full or holds a NaN.
+    The weighted and plain window sums are updated in O(1) per row and recomputed every length rows.
+    """
+    n = len(values)
+    result = np.full(n, np.nan)
+    weightSum = length * (length + 1) / 2
 
-    for i in range(len(result)):
-        # print(values[i])
-        # print last 10 values in values 
-        if i < length:
-            result[i] = np.nan
+    weighted = 0.0 # sum of (length - k) * values[i-k]
+    total = 0.0    # sum of values[i-k]
+    nans = 0
+    for i in range(n):
+        x = values[i]
+        if x != x:
+            nans += 1
+        if i >= length and values[i - length] != values[i - length]:
+            nans -= 1
+
+        if i >= length and i % length == 0:
+            weighted = 0.0
+            total = 0.0
+            for k in range(length):
+                if values[i - k] == values[i - k]:
+                    weighted += (length - k) * values[i - k]
+                    total += values[i - k]
         else:
-            # print(values[i-length:i])
-            result[i] = np.dot(values[i-length:i], weights) / weights.sum()
-    
-    # print('\n')
-    # print(weights) 
-    # print(len(values))
-    
+            weighted -= total
+            if x == x:
+                weighted += length * x
+                total += x
+            if i >= length:
+                old = values[i - length]
+                if old == old:
+                    total -= old
+
+        if i >= length - 1 and nans == 0:
+            result[i] = weighted / weightSum
+
     return result
 
+@njit
+def _sorted_quantile(buffer, count, prob):
+    """
+        Quantile of the first count values of a sorted buffer, interpolated exactly like np.percentile's 'linear' method.
+    """
+    virtual = (count - 1) * prob
+    if virtual >= count - 1:
+        return buffer[count - 1]
+    lo = int(np.floor(virtual))
+    gamma = virtual - lo
+    diff = buffer[lo + 1] - buffer[lo]
+    if gamma >= 0.5:
+        return buffer[lo + 1] - diff * (1 - gamma)
+    return buffer[lo] + diff * gamma
+
+@njit
+def _rolling_order_stats(values, window, probs, edgeProbs, min_periods):
+    """
+        One pass over values keeping the window in a sorted buffer, located by binary search as values enter and leave.
+        Returns per row:
+            cuts: quantiles of the window at probs
+            ntiles: bucket of the current value for pd.qcut(window, len(edgeProbs) - 1, labels=False, duplicates='drop'), skipped if edgeProbs is empty
+            pctRanks: average rank of the current value in the window / number of values, like rolling().rank(pct=True)
+        NaNs are left out of the window; rows with fewer than min_periods values (0 uses window) are NaN.
+    """
+    n = len(values)
+    cuts = np.full((n, len(probs)), np.nan)
+    ntiles = np.full(n, np.nan)
+    pctRanks = np.full(n, np.nan)
+    if min_periods <= 0:
+        min_periods = window
+    dropDuplicates = len(edgeProbs) != 2 # pandas keeps duplicate edges for a single bucket
+
+    buffer = np.empty(window)
+    count = 0
+    for i in range(n):
+        if i >= window:
+            old = values[i - window]
+            if old == old:
+                pos = np.searchsorted(buffer[:count], old)
+                for j in range(pos, count - 1):
+                    buffer[j] = buffer[j + 1]
+                count -= 1
+
+        x = values[i]
+        if x == x:
+            pos = np.searchsorted(buffer[:count], x)
+            for j in range(count, pos, -1):
+                buffer[j] = buffer[j - 1]
+            buffer[pos] = x
+            count += 1
+
+        if count == 0 or count < min_periods:
+            continue
+        for k in range(len(probs)):
+            cuts[i, k] = _sorted_quantile(buffer, count, probs[k])
+        if x != x:
+            continue
+
+        less = np.searchsorted(buffer[:count], x)
+        lessOrEqual = np.searchsorted(buffer[:count], x, side='right')
+        pctRanks[i] = (less + (lessOrEqual - less + 1) / 2) / count
+
+        if len(edgeProbs) > 0:
+            # qcut: bucket = number of unique edges below x - 1, the lowest edge belongs to the first bucket
+            numEdges = 0
+            below = 0
+            first = np.nan
+            last = np.nan
+            for k in range(len(edgeProbs)):
+                edge = _sorted_quantile(buffer, count, edgeProbs[k])
+                if k == 0:
+                    first = edge
+                elif dropDuplicates and edge == last:
+                    continue
+                numEdges += 1
+                if edge < x:
+                    below += 1
+                last = edge
+            if x == first:
+                below = 1
+            if 0 < below < numEdges:
+                ntiles[i] = below - 1
+
+    return cuts, ntiles, pctRanks
+
+def rolling_order_stats(values, window, probs=(), numBuckets=0, min_periods=0):
+    """
+        Rolling quantile cut points, ntile and percentile rank of a column in one pass.
+        Params:
+            values: np.array or pd.Series column
+            window: int rolling window
+            probs: quantiles (0-1) to return cut points for
+            numBuckets: int number of buckets for the ntile, matching pd.qcut(window, numBuckets, labels=False, duplicates='drop')[-1]. 0 skips it
+            min_periods: int minimum number of non NaN values in the window. 0 uses window
+        Returns:
+            cuts (n x len(probs)), ntiles (n), pctRanks (n)
+    """
+    values = np.asarray(values, dtype='float64')
+    probs = np.asarray(probs, dtype='float64').reshape(-1)
+    # qcut hands np.percentile percentages, which it divides by 100 again; the round trip changes some edges in the last bit
+    edgeProbs = np.linspace(0, 1, numBuckets + 1) * 100 / 100 if numBuckets > 0 else np.empty(0)
+    return _rolling_order_stats(values, window, probs, edgeProbs, min_periods)
+
+def rolling_quantiles(values, window, probs, min_periods=0):
+    """
+        Rolling quantiles of a column, same as rolling(window).quantile(p) for each p in probs. Returns an n x len(probs) array.
+    """
+    return rolling_order_stats(values, window, probs=probs, min_periods=min_periods)[0]
+
+def rolling_ntile(values, window, numBuckets, min_periods=0):
+    """
+        Rolling ntile of a column, same as rolling(window).apply(lambda x: pd.qcut(x, numBuckets, labels=False, duplicates='drop')[-1])
+    """
+    return rolling_order_stats(values, window, numBuckets=numBuckets, min_periods=min_periods)[1]
+
+def rolling_percentile_rank(values, window, min_periods=0):
+    """
+        Rolling percentile rank of a column, same as rolling(window).rank(pct=True)
+    """
+    return rolling_order_stats(values, window, min_periods=min_periods)[2]
+
 @njit 
 def compute_deciles_with_rank(values, window_size):   
     """
         Calculate the deciles of a series of values.
     """
-    windows = sliding_window_view(values, window_size)
-
-    rolling_deciles = np.empty((windows.shape[0], 9))
+    cuts = _rolling_order_stats(values, window_size, np.arange(10, 100, 10) / 100, np.empty(0), 0)[0]
+    rolling_deciles = cuts[window_size - 1:]
     decile_ranks = np.empty(len(values))
-    for i in range(windows.shape[0]):
-        # deciles[i, :] = compute_deciles(windows[i])
-        rolling_deciles[i, :] = np.percentile(windows[i], np.arange(10, 100, 10))
+    for i in range(rolling_deciles.shape[0]):
         current_value = values[i + window_size - 1]
         decile_ranks[i + window_size - 1] = find_decile(current_value, rolling_deciles[i])
 
     decile_ranks[:window_size - 1] = np.nan
-    # return np.percentile(values, window, np.arange(10, 100, 10))
     return rolling_deciles, decile_ranks
 
 @njit
@@ -101,19 +280,129 @@ def momentum2(prices, lookback):
     return momo
 
 @njit
-def rolling_zscore(values, rollingWindow):
+def _rolling_moments(values, window, min_periods=0, ddof=0):
+    """
+    Rolling mean and standard deviation in one O(n) pass, updating the window moments with Welford's method as values enter and leave.
+    NaNs are skipped; a row is NaN until the window holds at least min_periods values (0 uses window, like pandas).
+    The moments are recomputed from the window every window rows so rounding errors cannot build up over long series,
+    and a window of identical values returns exactly that value and a std of 0.
+    """
     n = len(values)
-    zscores = np.empty(n)
-    zscores[:] = np.nan  # Initialize with NaNs
+    means = np.full(n, np.nan)
+    stds = np.full(n, np.nan)
+    if min_periods <= 0:
+        min_periods = window
+
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    sameRun = 0 # trailing rows equal to the last value
+    lastValue = np.nan
+    for i in range(n):
+        x = values[i]
+        if x == x:
+            count += 1
+            delta = x - mean
+            mean += delta / count
+            m2 += delta * (x - mean)
+            sameRun = sameRun + 1 if x == lastValue else 1
+            lastValue = x
+        else:
+            sameRun = 0
+            lastValue = np.nan
+
+        if i >= window:
+            y = values[i - window]
+            if y == y:
+                count -= 1
+                if count == 0:
+                    mean = 0.0
+                    m2 = 0.0
+                else:
+                    delta = y - mean
+                    mean -= delta / count
+                    m2 -= delta * (y - mean)
+
+            if i % window == 0 and count > 0:
+                total = 0.0
+                for j in range(i - window + 1, i + 1):
+                    if values[j] == values[j]:
+                        total += values[j]
+                mean = total / count
+                m2 = 0.0
+                for j in range(i - window + 1, i + 1):
+                    if values[j] == values[j]:
+                        m2 += (values[j] - mean) ** 2
+
+        if count >= min_periods and count > 0:
+            if sameRun >= count:
+                means[i] = lastValue
+                if count > ddof:
+                    stds[i] = 0.0
+            else:
+                means[i] = mean
+                if count > ddof:
+                    stds[i] = np.sqrt(max(m2, 0.0) / (count - ddof))
+
+    return means, stds
+
+@njit
+def rolling_mean(values, window, min_periods=0):
+    """
+    Calculate the rolling mean of a column in O(n).
+    Params: 
+        values: np.array column to calculate the rolling mean on
+        window: int rolling window 
+        min_periods: int minimum number of non NaN values in the window. 0 uses window
+    """
+    return _rolling_moments(values, window, min_periods, 0)[0]
 
-    for i in range(rollingWindow - 1, n):
-        window = values[i - rollingWindow + 1:i + 1]
-        mean = np.mean(window)
-        std = np.std(window)
-        zscores[i] = (values[i] - mean) / std
+@njit
+def rolling_std(arr, window, ddof=0, min_periods=0):
+    """
+    Calculate the rolling standard deviation of a column in O(n).
+    Params: 
+        arr: np.array column to calculate rolling std on
+        window: int rolling window 
+        ddof: int delta degrees of freedom, 0 like np.std, 1 like pandas .std()
+        min_periods: int minimum number of non NaN values in the window. 0 uses window
+    """
+    return _rolling_moments(arr, window, min_periods, ddof)[1]
 
+@njit
+def rolling_zscore(values, rollingWindow, ddof=0, min_periods=0):
+    """
+    Calculate the rolling z-score of a column in O(n): (value - rolling mean) / rolling std.
+    Params: 
+        values: np.array column to calculate the z-score on
+        rollingWindow: int rolling window 
+        ddof: int delta degrees of freedom of the std, 0 like np.std
+        min_periods: int minimum number of non NaN values in the window. 0 uses rollingWindow
+    Rows with a NaN value, too few values or a std of 0 are NaN.
+    """
+    means, stds = _rolling_moments(values, rollingWindow, min_periods, ddof)
+    zscores = np.full(len(values), np.nan)
+    for i in range(len(values)):
+        if stds[i] > 0:
+            zscores[i] = (values[i] - means[i]) / stds[i]
     return zscores
 
+@njit
+def rescale(values, min=0.0, max=1.0):
+    """
+    Linearly maps values from [nanmin, nanmax] onto [min, max], same as ffn.rescale. NaNs stay NaN.
+    """
+    low = np.nanmin(values)
+    high = np.nanmax(values)
+    result = np.full(len(values), np.nan)
+    for i in range(len(values)):
+        if values[i] == values[i]:
+            if high > low:
+                result[i] = min + (values[i] - low) * (max - min) / (high - low)
+            else:
+                result[i] = max
+    return result
+
 @njit
 def zscore(values, rollingWindow=252, rescale=False):
     """
@@ -135,19 +424,110 @@ def zscore(values, rollingWindow=252, rescale=False):
     return zscores
 
 @njit
-def rolling_std(arr, window):
+def rolling_ols(values, window):
     """
-    Calculate the rolling standard deviation of a column.
-    Params: 
-        arr: np.array column to calculate rolling std on
-        window: int rolling window 
+    Rolling least squares fit of values against their position in the window (0 = oldest row), like np.polyfit(np.arange(window), x, 1).
+    Keeps running sums of y, x*y and y*y, shifting x by one as the window slides, so each row is O(1); the sums are taken relative to
+    the window mean and recomputed from the window every window rows to keep rounding errors small.
+    Returns slope, intercept (fit at the oldest row), r2 and residual std (ddof 2) arrays, NaN until the window is full or while it holds a NaN.
+    """
+    n = len(values)
+    slopes = np.full(n, np.nan)
+    intercepts = np.full(n, np.nan)
+    r2s = np.full(n, np.nan)
+    residualStds = np.full(n, np.nan)
+    if window < 2:
+        return slopes, intercepts, r2s, residualStds
+
+    sx = window * (window - 1) / 2
+    sxx = (window - 1) * window * (2 * window - 1) / 6
+    denom = window * sxx - sx * sx
+
+    ref = 0.0 # y offset the sums are taken relative to
+    sy = 0.0
+    sxy = 0.0
+    syy = 0.0
+    nans = 0
+    for i in range(n):
+        y = values[i]
+        if y != y:
+            nans += 1
+        if i >= window and values[i - window] != values[i - window]:
+            nans -= 1
+        if i < window - 1:
+            continue
+
+        start = i - window + 1
+        if start % window == 0:
+            ref = 0.0
+            count = 0
+            for k in range(window):
+                if values[start + k] == values[start + k]:
+                    ref += values[start + k]
+                    count += 1
+            ref = ref / count if count > 0 else 0.0
+            sy = 0.0
+            sxy = 0.0
+            syy = 0.0
+            for k in range(window):
+                if values[start + k] == values[start + k]:
+                    d = values[start + k] - ref
+                    sy += d
+                    sxy += k * d
+                    syy += d * d
+        else:
+            old = values[i - window] - ref if values[i - window] == values[i - window] else 0.0
+            new = y - ref if y == y else 0.0
+            sxy += (window - 1) * new - (sy - old)
+            sy += new - old
+            syy += new * new - old * old
+
+        if nans > 0:
+            continue
+        slope = (window * sxy - sx * sy) / denom
+        slopes[i] = slope
+        intercepts[i] = ref + (sy - slope * sx) / window
+        ssTot = syy - sy * sy / window
+        ssRes = max(ssTot - slope * slope * denom / window, 0.0)
+        if ssTot > 0:
+            r2s[i] = 1 - ssRes / ssTot
+        if window > 2:
+            residualStds[i] = np.sqrt(ssRes / (window - 2))
+
+    return slopes, intercepts, r2s, residualStds
+
+@njit
+def _rolling_ols_columns(values, window):
+    """
+    rolling_ols for every column of a 2d array, returns an array of shape (4, n, numColumns): slope, intercept, r2, residual std
     """
-    result = np.empty(len(arr))
-    result[:] = np.nan  # Initialize with NaNs
-    for i in range(window - 1, len(arr)):
-        result[i] = np.std(arr[i - window + 1:i])
+    result = np.empty((4, values.shape[0], values.shape[1]))
+    for j in range(values.shape[1]):
+        slopes, intercepts, r2s, residualStds = rolling_ols(values[:, j].copy(), window)
+        result[0, :, j] = slopes
+        result[1, :, j] = intercepts
+        result[2, :, j] = r2s
+        result[3, :, j] = residualStds
     return result
 
+def rolling_regression(df, colnames, lookbacks, stats=('slope', 'intercept', 'r2', 'residual_std')):
+    """
+    Adds columns colname_<stat>_<lookback> with rolling_ols results for every column and lookback. 
+    inputs:
+        df: dataframe with price history
+        colnames: column names to fit
+        lookbacks: lookback periods
+        stats: any of 'slope', 'intercept', 'r2', 'residual_std'
+    """
+    statIndex = {'slope': 0, 'intercept': 1, 'r2': 2, 'residual_std': 3}
+    values = df[list(colnames)].to_numpy(dtype='float64')
+    for lookback in lookbacks:
+        result = _rolling_ols_columns(values, lookback)
+        for j, colname in enumerate(colnames):
+            for stat in stats:
+                df['%s_%s_%s'%(colname, stat, lookback)] = result[statIndex[stat], :, j]
+    return df
+
 def slope(df, colname, lookback_periods=10):
     """
     Calculates the slope of a given column over a lookback period. 
@@ -156,7 +536,7 @@ def slope(df, colname, lookback_periods=10):
         colname: column name to calculate the slope on
         lookback_periods: lookback period
     """
-    df['%s_slope'%(colname)] = df[colname].rolling(window=lookback_periods).apply(lambda x: np.polyfit(np.arange(len(x)), x, 1)[0], raw=True)
+    df['%s_slope'%(colname)] = rolling_ols(df[colname].to_numpy(dtype='float64'), lookback_periods)[0]
     return df
 
 def intra_day_cumulative_signal(pxhistory, colname, lookback_period=10, intraday_reset=False):
@@ -183,6 +563,86 @@ def intra_day_cumulative_signal(pxhistory, colname, lookback_period=10, intraday
         pxhistory[cumsum_col_name] = pxhistory[colname].rolling(window=lookback_period, min_periods=1).sum()
     return pxhistory
 
+@njit
+def _lag_matrix(prices, lags, kind, shift, groups, out):
+    """
+    Fills out (n x len(lags)) in one pass over prices. kind 0: momentum prices[i] / prices[i-lag] - 1, 1: pct forward returns
+    prices[i+lag] / prices[i] - 1, 2: log forward returns log(prices[i+lag] / prices[i]), 3: log returns log(prices[i] / prices[i-lag]).
+    Row i is computed at row i - shift, like .shift(shift) on the result. Rows whose inputs fall outside the series or into
+    another group are NaN.
+    """
+    n = len(prices)
+    for i in range(n):
+        b = i - shift
+        for j in range(len(lags)):
+            lag = lags[j]
+            start = b - lag if kind == 0 or kind == 3 else b
+            end = b if kind == 0 or kind == 3 else b + lag
+            if start < 0 or end >= n or b < 0 or b >= n or groups[start] != groups[i] or groups[end] != groups[i]:
+                out[i, j] = np.nan
+            elif kind == 0 or kind == 1:
+                out[i, j] = prices[end] / prices[start] - 1
+            else:
+                out[i, j] = np.log(prices[end] / prices[start])
+    return out
+
+class ReturnMatrix:
+    """
+    Dense n x k matrix of momentum / forward returns for a vector of lags with just enough labels to pick columns by lag or name.
+        values: np.array (n x k)
+        lags: lags of the columns
+        labels: column names, e.g. momo3, fwdReturns5
+        index: index of the price series the matrix was built from
+    """
+    def __init__(self, values, lags, labels, index):
+        self.values = values
+        self.lags = list(lags)
+        self.labels = list(labels)
+        self.index = index
+
+    def __len__(self):
+        return len(self.lags)
+
+    def _position(self, key):
+        return self.labels.index(key) if isinstance(key, str) else self.lags.index(key)
+
+    def __getitem__(self, key):
+        """ column for a lag or label as np.array """
+        return self.values[:, self._position(key)]
+
+    def series(self, key):
+        """ column for a lag or label as pd.Series on the price index """
+        position = self._position(key)
+        return pd.Series(self.values[:, position], index=self.index, name=self.labels[position])
+
+    def frame(self, keys=None):
+        """ DataFrame of the selected lags or labels, all columns if keys is None """
+        positions = range(len(self.lags)) if keys is None else [self._position(key) for key in keys]
+        return pd.DataFrame(self.values[:, positions], index=self.index, columns=[self.labels[p] for p in positions])
+
+_returnKinds = {'momentum': (0, 'momo'), 'fwdReturns': (1, 'fwdReturns'), 'logFwdReturns': (2, 'logFwdReturns'), 'logReturns': (3, 'logReturn')}
+
+def return_matrix(prices, lags, kind='momentum', shift=0, groups=None, dtype='float64', labels=None):
+    """
+    Momentum or forward returns of a price series for every lag in one pass.
+    inputs:
+        prices: pd.Series or np.array of prices
+        lags: list of lookback / forward periods
+        kind: 'momentum' (pct change over the last lag rows), 'fwdReturns' (pct change over the next lag rows, same as pct_change(lag).shift(-lag)),
+            'logFwdReturns' or 'logReturns'
+        shift: (optional) number of rows to shift the result, e.g. 1 for lagged momo
+        groups: (optional) symbol per row; returns never span two symbols. rows of a symbol must be contiguous and sorted by date
+        dtype: 'float64' or 'float32'
+        labels: (optional) column names, defaults to <prefix><lag>, e.g. momo3, fwdReturns5
+    """
+    code, prefix = _returnKinds[kind]
+    index = prices.index if isinstance(prices, pd.Series) else pd.RangeIndex(len(prices))
+    values = np.asarray(prices, dtype='float64')
+    lags = np.asarray(lags, dtype='int64').reshape(-1)
+    groupCodes = np.zeros(len(values), dtype='int64') if groups is None else pd.factorize(np.asarray(groups))[0].astype('int64')
+    out = _lag_matrix(values, lags, code, shift, groupCodes, np.empty((len(values), len(lags)), dtype=dtype))
+    return ReturnMatrix(out, lags.tolist(), labels if labels is not None else ['%s%s'%(prefix, lag) for lag in lags], index)
+
 def momentum_factor(df, colname, lag=1, shift=1, lag_momo=False, use_absolute_values=False):
     """
     Calculates momentum factor for a given pxhistory, lag, and shift 
@@ -193,18 +653,14 @@ def momentum_factor(df, colname, lag=1, shift=1, lag_momo=False, use_absolute_va
     """
     
     if use_absolute_values: 
-        df['%s_abs'%(colname)] = df[colname].abs
+        df['%s_abs'%(colname)] = df[colname].abs()
         colname = '%s_abs'%(colname)
 
-    returns = df.groupby('symbol', group_keys=False).apply(lambda group: (
-    group.sort_values(by='date')
-         .assign(momo=lambda x: (x[colname] / x[colname].shift(lag)) - 1,
-                 lagmomo=lambda x: x['momo'].shift(shift))
-        )
-    ).reset_index(drop=True)
-
-    if lag_momo == False:
-        returns.drop(columns=['lagmomo'], inplace=True)
+    # per symbol, sorted by date, same row order as groupby('symbol').apply(sort_values)
+    returns = df[df['symbol'].notna()].sort_values(by=['symbol', 'date'], kind='stable').reset_index(drop=True)
+    returns['momo'] = return_matrix(returns[colname], [lag], groups=returns['symbol'])[lag]
+    if lag_momo:
+        returns['lagmomo'] = return_matrix(returns[colname], [lag], shift=shift, groups=returns['symbol'])[lag]
     return returns
 
 def weighted_moving_average_returnsSeries(px_series, length):
@@ -214,8 +670,8 @@ def weighted_moving_average_returnsSeries(px_series, length):
         px_series: series of prices
         length: lookback period
     """
-    weights = np.arange(1, length + 1)
-    return pd.Series(px_series).rolling(window=length).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True)
+    px_series = pd.Series(px_series)
+    return pd.Series(weighted_moving_average(px_series.to_numpy(dtype='float64'), length), index=px_series.index)
 
 def moving_average_crossover(df, colname_long, colname_short):
     """
@@ -238,8 +694,7 @@ def moving_average_weighted(df, colname, length):
         colname: column name to calculate WMA on
         length: lookback period
     """
-    weights = np.arange(1, length + 1)
-    df['%s_wma'%(colname)] = df[colname].rolling(window=length).apply(lambda x: np.dot(x, weights) / weights.sum(), raw=True)
+    df['%s_wma'%(colname)] = weighted_moving_average(df[colname].to_numpy(dtype='float64'), length)
     return df
 
 def relative_volatility_index(df, colname, length):
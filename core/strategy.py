@@ -25,22 +25,25 @@ class Strategy:
 
         Args:
             symbol (str): The symbol of the asset.
+            pxhistory (dataframe): [optional] preloaded price history, e.g. from db.getPriceHistories. Loaded from the db if not set.
 
         Attributes:
             pxHistory (dataframe): The price history of the asset with all desired signals or indicators.
 
     """
-    def __init__(self, name, symbol, interval='1day', signal_name='close'):
+    def __init__(self, name, symbol, interval='1day', signal_name='close', pxhistory=None):
         self.name = name 
         self.symbol = symbol
         self.interval = interval
         self.signal_name = signal_name
-        self.pxhistory = self._load_pxhistory(symbol=self.symbol, interval=self.interval)
+        if pxhistory is None:
+            pxhistory = self._load_pxhistory(symbol=self.symbol, interval=self.interval)
+        self.pxhistory = pxhistory
         self._calc_zscore('close')
 
     # load underlying history from db 
     def _load_pxhistory(self, symbol, interval):
-        with db.sqlite_connection(config.dbname_stock) as conn:
+        with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
              return db.getPriceHistory(conn, symbol, interval)
     
     ######### COLUMN CALCULATION FUNCTIONS 
@@ -76,7 +79,7 @@ class Strategy:
         self.pxhistory.rename(columns={'%s_ntile'%(colname): '%s_decile'%(colname)}, inplace=True)
 
     def _calc_rolling_percentile_for_col(self, target_col_name = 'close', rollingWindow=252):
-        self.pxhistory['%s_percentile'%(target_col_name)] = self.pxhistory[target_col_name].rolling(rollingWindow).apply(lambda x: pd.qcut(x, 10, labels=False, duplicates='drop')[-1], raw=True)
+        self.pxhistory['%s_percentile'%(target_col_name)] = indicators.rolling_ntile(self.pxhistory[target_col_name], rollingWindow, 10)
         self._calc_zscore('%s_percentile'%(target_col_name))
 
     def _calc_zscore(self, colname, rollingWindow=252, _pxHistory = None, rescale = False): 
@@ -91,12 +94,12 @@ class Strategy:
             if rollingWindow == 0:
                 self.pxhistory['%s_zscore'%(colname)] = self.pxhistory[colname] - self.pxhistory[colname].mean() / self.pxhistory[colname].std()
             else: 
-                self.pxhistory['%s_zscore'%(colname)] = self.pxhistory[colname].rolling(rollingWindow).apply(lambda x: (x[-1] - x.mean()) / x.std(), raw=True)
+                self.pxhistory['%s_zscore'%(colname)] = indicators.rolling_zscore(self.pxhistory[colname].to_numpy(dtype='float64'), rollingWindow)
         else:
             _pxHistory['%s_zscore'%(colname)] = _pxHistory[colname] - _pxHistory[colname].mean() / _pxHistory[colname].std()
         
         if rescale:
-            self.pxhistory['%s_zscore'%(colname)] = ffn.rescale(self.pxhistory['%s_zscore'%(colname)],-1,1)
+            self.pxhistory['%s_zscore'%(colname)] = indicators.rescale(self.pxhistory['%s_zscore'%(colname)].to_numpy(dtype='float64'), -1, 1)
     
     # @njit
     # def calculate_percentiles(data, numBuckets):
@@ -137,22 +140,8 @@ class Strategy:
     ########### august 1 impl
 
     def rolling_deciles(self, pxhistory, colname, rollingWindow):
-        
-        @jit 
-        def compute_deciles(window):   
-            return np.percentile(window, np.arange(10, 100, 10))
-        
-        values = pxhistory[colname].values
-        windows = sliding_window_view(values, rollingWindow)
-
-        deciles = np.empty((windows.shape[0], 9))
-        for i in range(windows.shape[0]):
-            deciles[i, :] = compute_deciles(windows[i])
-        
-        # since there is a rolling window, append NaNs to the beginning of the deciles array
-        deciles = np.concatenate((np.full((rollingWindow-1, 9), np.nan), deciles), axis=0)
-
-        return deciles 
+        # rows before the first full window are NaN
+        return indicators.rolling_quantiles(pxhistory[colname], rollingWindow, np.arange(10, 100, 10) / 100)
 
     @jit
     def _calc_ntile_optimized(self, numBuckets, colname, _pxHistory=None, rollingWindow=252):
@@ -173,27 +162,27 @@ class Strategy:
             data = _pxHistory
 
         if rollingWindow > 0:
-            data['%s_ntile' % colname] = data[colname].rolling(rollingWindow).apply(lambda x: pd.qcut(x, numBuckets, labels=False, duplicates='drop').iloc[-1], raw=False)
+            data['%s_ntile' % colname] = indicators.rolling_ntile(data[colname], rollingWindow, numBuckets)
         else:
             data['%s_ntile' % colname] = pd.qcut(data[colname], numBuckets, labels=False, duplicates='drop')
     
     def _calc_percentiles(self, colname, _pxHistory = None, lookback=252):
         if _pxHistory is None:
-            self.pxhistory['%s_percentile'%(colname)] = self.pxhistory[colname].rolling(lookback).apply(lambda x: pd.qcut(x, 100, labels=False, duplicates='drop')[-1], raw=True)
+            self.pxhistory['%s_percentile'%(colname)] = indicators.rolling_ntile(self.pxhistory[colname], lookback, 100)
         else:
-            _pxHistory['%s_percentile'%(colname)] = _pxHistory[colname].rolling(lookback).apply(lambda x: pd.qcut(x, 100, labels=False, duplicates='drop')[-1], raw=True)
+            _pxHistory['%s_percentile'%(colname)] = indicators.rolling_ntile(_pxHistory[colname], lookback, 100)
 
     def _calc_log_fwd_return(self, maxperiod=20, colname='close'):
-        for i in range(1, maxperiod+1):
-            if '%s_fwdReturns%s'%(colname, i) in self.pxhistory.columns:
-                continue
-            self.pxhistory['%s_logFwdReturns%s'%(colname, i)] = self.pxhistory[colname].pct_change(i).shift(-i).apply(lambda x: np.log(1+x))
+        periods = [i for i in range(1, maxperiod+1) if '%s_logFwdReturns%s'%(colname, i) not in self.pxhistory.columns]
+        if periods:
+            fwdReturns = indicators.return_matrix(self.pxhistory[colname], periods, kind='logFwdReturns', labels=['%s_logFwdReturns%s'%(colname, i) for i in periods])
+            self.pxhistory[fwdReturns.labels] = fwdReturns.values
 
     def _calc_fwd_returns(self, maxperiod_fwdreturns=20, colname='close'):
-        for i in range (1, maxperiod_fwdreturns+1):
-            if '%s_fwdReturns%s'%(colname, i) in self.pxhistory.columns:
-                continue
-            self.pxhistory['%s_fwdReturns%s'%(colname, i)] = self.pxhistory[colname].pct_change(i).shift(-i)
+        periods = [i for i in range(1, maxperiod_fwdreturns+1) if '%s_fwdReturns%s'%(colname, i) not in self.pxhistory.columns]
+        if periods:
+            fwdReturns = indicators.return_matrix(self.pxhistory[colname], periods, kind='fwdReturns', labels=['%s_fwdReturns%s'%(colname, i) for i in periods])
+            self.pxhistory[fwdReturns.labels] = fwdReturns.values
 
     ######### These function return a plot object  #########
     
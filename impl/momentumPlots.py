@@ -6,6 +6,7 @@ import sys
 sys.path.append('..')
 
 import config
+from core import indicators
 from core import momentum
 
 import statsmodels.api as sm 
@@ -177,23 +178,15 @@ def plotMomoScatter(pxhistory, momPeriod1=10, momPeriod2=30, forwardReturnsPerio
 """
 def plotMomoQuintiles(pxHistory, momoPeriods=[], fwdReturnPeriods=[], **kwargs):
     num_bins = kwargs.get('num_bins', 15) # number of bins to use
-    # get momo for each ? in momoPeriods
-    for period in momoPeriods:
-        # skip if momo already in pxHistory
-        if 'momo%s'%(period) not in pxHistory.columns:
-            pxHistory = momentum.calcMomoFactor(pxHistory, lag=period)
-            pxHistory.rename(columns={'momo': 'momo%s'%(period)}, inplace=True)
-
-    # get forward returns for each ? in fwdReturnPeriods
-    for period in fwdReturnPeriods:
-        pxHistory['fwdReturns%s'%(period)] = pxHistory['close'].pct_change(period).shift(-period)
+    # momo for each period in momoPeriods, unless already in pxHistory, and forward returns for each period in fwdReturnPeriods
+    momo = indicators.return_matrix(pxHistory['close'], momoPeriods, kind='momentum')
+    fwdReturns = indicators.return_matrix(pxHistory['close'], fwdReturnPeriods, kind='fwdReturns')
 
-    # put momo in 5 quintiles
-    """
-        TODO: move this to previous for loop
-    """
+    # put momo in num_bins quantiles
+    quintiles = {}
     for period in momoPeriods:
-        pxHistory['momo%sQuintile'%(period)] = pd.qcut(pxHistory['momo%s'%(period)], num_bins, labels=False)
+        momoSeries = pxHistory['momo%s'%(period)] if 'momo%s'%(period) in pxHistory.columns else momo.series(period)
+        quintiles[period] = pd.qcut(momoSeries, num_bins, labels=False)
     
     # set numColumns to the length of fwdreturnperiods
     numColumns = max(1, len(fwdReturnPeriods))
@@ -208,8 +201,8 @@ def plotMomoQuintiles(pxHistory, momoPeriods=[], fwdReturnPeriods=[], **kwargs):
     #sns.set()
     for row in range(numRows):
         for column in range(numColumns):
-            # select subset of pxhistory 
-            pxHistory_ = pxHistory[['momo%sQuintile'%(momoPeriods[row]), 'fwdReturns%s'%(fwdReturnPeriods[column])]]
+            # select quintiles and fwd returns for this cell
+            pxHistory_ = pd.DataFrame({'momo%sQuintile'%(momoPeriods[row]): quintiles[momoPeriods[row]], 'fwdReturns%s'%(fwdReturnPeriods[column]): fwdReturns.series(fwdReturnPeriods[column])})
             # group by quantile calculating mean of fwdreturns
             pxHistory_ = pxHistory_.groupby('momo%sQuintile'%(momoPeriods[row])).mean().reset_index()
             # barplot of quintile vs mean of fwdreturns for that quintile
@@ -225,16 +218,10 @@ def plotMomoQuintiles(pxHistory, momoPeriods=[], fwdReturnPeriods=[], **kwargs):
 
 def plotMomoPairplot(pxhistory, momoPeriods=[3,5,8,13,21,34], forwardReturnsPeriods=[3,5,8,13,21,34]):
     
-    # get momo for each ? in momoPeriods
-    for period in momoPeriods:
-        pxhistory = momentum.calcMomoFactor(pxhistory, lag=period)
-        pxhistory.rename(columns={'momo': 'momo%s'%(period), 'lagmomo': 'lagMomo%s'%(period)}, inplace=True)
-
-    # get forward returns for each ? in forwardReturnsPeriods
-    _n=1
-    for period in forwardReturnsPeriods:
-        pxhistory['fwdReturns%s'%(_n)] = pxhistory['close'].pct_change(period).shift(-period)
-        _n+=1
+    # momo for each period in momoPeriods, forward returns for each period in forwardReturnsPeriods labelled fwdReturns1..n
+    momo = indicators.return_matrix(pxhistory['close'], momoPeriods, kind='momentum')
+    fwdReturns = indicators.return_matrix(pxhistory['close'], forwardReturnsPeriods, kind='fwdReturns', labels=['fwdReturns%s'%(n) for n in range(1, len(forwardReturnsPeriods)+1)])
+    pxhistory = pd.concat([pxhistory, momo.frame(), fwdReturns.frame()], axis=1)
     
     # fig axis 
     fig, ax = plt.subplots(2,3, figsize=(20, 10), sharex=True, sharey=True)
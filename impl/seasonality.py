@@ -110,7 +110,7 @@ def logReturns_overview_of_seasonality(symbol, restrictTradingHours=False, ytdli
     - fig (matplotlib.figure.Figure): The generated figure with subplots showing the seasonality of log returns.
     """
     # get px history from db
-    with db.sqlite_connection(dbname_stock) as conn:
+    with db.sqlite_connection(dbname_stock, readonly=True) as conn:
         pxHistory_htf = db.getPriceHistory(conn, symbol, '1day', withpctChange=True)
         pxHistory_ltf = db.getPriceHistory(conn, symbol, '30mins', withpctChange=True)
 
@@ -228,7 +228,7 @@ def legReturn_seasonality_ltf_dashboard(symbol, restrictTradingHours = False, yt
         plots a dashboard (4x4) of ltf = [1min, 5min, 15min] seasonality for a given symbol
     """
     # get px history from db
-    with db.sqlite_connection(dbname_stock) as conn:
+    with db.sqlite_connection(dbname_stock, readonly=True) as conn:
         pxHistory_1min = db.getPriceHistory(conn, symbol, '1min', withpctChange=True)
         pxHistory_5min = db.getPriceHistory(conn, symbol, '5min', withpctChange=True)
         pxHistory_15min = db.getPriceHistory(conn, symbol, '15min', withpctChange=True)
@@ -0,0 +1,197 @@
+"""
+Append-only, memory-mapped columnar store for intraday bar history. 
+
+    - one directory per symbol/interval holding fixed width date/open/high/low/close/volume files 
+      and a small json header with the committed record count
+    - view() returns zero-copy numpy arrays over the files, directly usable by the numba kernels in core/indicators
+    - append() only writes past the end of the files, existing records are never rewritten
+      (the last record may be overwritten in place when ibkr sends an updated version of the still-forming bar)
+    - appends are serialized per directory, so any number of BarStore objects in a process can share one store 
+    - ib.BarStream(..., store=BarStore(...)) persists streamed bars and seeds its ring buffer from them on restart 
+
+Usage: 
+    store = BarStore('VIX', '1min')
+    syncFromDB(conn, store)                     # catch up with the local sqlite db
+    store.append(ib.getBars(ibkr, 'VIX', ...))  # or append bars straight from ibkr
+    bars = store.view(start='2024-01-01')       # {'date': int64 ns, 'close': float64, ...}
+    indicators.rolling_zscore(bars['close'], 390)
+"""
+
+import json
+import os
+import threading
+import config
+import numpy as np
+import pandas as pd
+
+from interface import interface_localDB as db
+
+""" Global vars """
+dir_barStore = config.dir_barStore
+
+# column name, dtype; dates are int64 nanoseconds since epoch (tz naive, same as getPriceHistory)
+_columns = [('date', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')]
+
+_pathLocks = {}                 # {store directory: lock serializing appends to it}
+_pathLocksLock = threading.Lock()
+
+"""
+Returns the lock for a store directory, shared by every BarStore object pointing at it 
+"""
+def _getPathLock(path):
+    path = os.path.realpath(path)
+    with _pathLocksLock:
+        if path not in _pathLocks:
+            _pathLocks[path] = threading.Lock()
+        return _pathLocks[path]
+
+class BarStore:
+    """
+        Append-only bar store for one symbol and interval. 
+
+        Args:
+            symbol (str): symbol of the bars, e.g. VIX
+            interval (str): interval of the bars in local db format, e.g. 1min
+            root (str): [optional] parent directory of all stores, defaults to config.dir_barStore
+
+        Attributes:
+            path (str): directory holding the column files and header
+    """
+    _header_version = 1
+
+    def __init__(self, symbol, interval, root=dir_barStore):
+        self.symbol = symbol.upper()
+        self.interval = interval
+        self.path = os.path.join(root, '%s_%s'%(self.symbol, self.interval))
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = _getPathLock(self.path)
+
+    def _column_path(self, colname):
+        return os.path.join(self.path, '%s.bin'%(colname))
+
+    def _read_header(self):
+        try:
+            with open(os.path.join(self.path, 'header.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': self._header_version, 'symbol': self.symbol, 'interval': self.interval, 'count': 0, 'columns': _columns}
+
+    def _write_header(self, header):
+        # atomic replace, readers see either the old or the new count 
+        tmpfile = os.path.join(self.path, 'header.json.%s'%(os.getpid()))
+        with open(tmpfile, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmpfile, os.path.join(self.path, 'header.json'))
+
+    def __len__(self):
+        return self._read_header()['count']
+
+    def last_date(self):
+        """
+            Returns the date of the last stored bar as pd.Timestamp, None if the store is empty
+        """
+        count = len(self)
+        if count == 0:
+            return None
+        with open(self._column_path('date'), 'rb') as f:
+            f.seek((count - 1) * 8)
+            return pd.Timestamp(int(np.frombuffer(f.read(8), dtype='<i8')[0]))
+
+    def view(self, start=None, end=None, columns=None):
+        """
+            Returns {column: np.ndarray} zero-copy, read-only views over the stored bars. 
+            Params: 
+                start, end: [optional] inclusive date bounds, resolved with a binary search on date 
+                columns: [optional] list of columns to map, date is always included
+        """
+        count = len(self)
+        colnames = [name for name, _ in _columns if columns is None or name == 'date' or name in columns]
+        if count == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in _columns if name in colnames}
+        
+        bars = {}
+        for name, dtype in _columns:
+            if name in colnames:
+                # asarray drops the memmap subclass so numba sees a plain ndarray, the buffer is still the mapping
+                bars[name] = np.asarray(np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(count,)))
+        
+        first, last = 0, count
+        if start is not None:
+            first = np.searchsorted(bars['date'], pd.Timestamp(start).value, side='left')
+        if end is not None:
+            last = np.searchsorted(bars['date'], pd.Timestamp(end).value, side='right')
+        return {name: values[first:last] for name, values in bars.items()}
+
+    def to_frame(self, start=None, end=None):
+        """
+            Returns stored bars as a dataframe in the same shape as db.getPriceHistory (without returns columns)
+        """
+        bars = self.view(start=start, end=end)
+        pxHistory = pd.DataFrame(bars)
+        pxHistory['date'] = pxHistory['date'].values.astype('datetime64[ns]')
+        pxHistory['symbol'] = self.symbol
+        pxHistory['interval'] = self.interval
+        return pxHistory
+
+    def append(self, bars):
+        """
+            Appends bars newer than the last stored bar. 
+            A bar with the same date as the last stored bar replaces it in place, older bars are ignored. 
+            Params: 
+                bars: dataframe with date, open, high, low, close, volume columns (e.g. from ib.getBars or db.getPriceHistory)
+            Returns number of bars written
+        """
+        if bars is None or len(bars) == 0:
+            return 0
+        
+        with self._lock:
+            header = self._read_header()
+            count = header['count']
+            
+            dates = pd.to_datetime(bars['date']).values.astype('datetime64[ns]').astype('int64')
+            order = np.argsort(dates, kind='stable')
+            dates = dates[order]
+            
+            # drop everything at or before the last stored bar, except a refresh of the last bar itself
+            lastDate = self.last_date()
+            replaceLast = False
+            if lastDate is not None:
+                keep = dates >= lastDate.value
+                replaceLast = bool(keep.any()) and dates[keep][0] == lastDate.value
+                order, dates = order[keep], dates[keep]
+            
+            if len(dates) == 0:
+                return 0
+            # keep the last copy of any date repeated within the batch
+            isLast = np.append(dates[1:] != dates[:-1], True)
+            order, dates = order[isLast], dates[isLast]
+            
+            for name, dtype in _columns:
+                if name == 'date':
+                    values = dates.astype(dtype)
+                elif name in bars.columns:
+                    values = bars[name].to_numpy(dtype='float64')[order].astype(dtype)
+                else:
+                    values = np.full(len(dates), np.nan, dtype=dtype)
+                
+                with open(self._column_path(name), 'ab+') as f:
+                    # a crashed append can leave bytes past the committed count, drop them 
+                    f.truncate(count * np.dtype(dtype).itemsize)
+                with open(self._column_path(name), 'r+b') as f:
+                    offset = count - 1 if replaceLast else count
+                    f.seek(offset * np.dtype(dtype).itemsize)
+                    f.write(values.tobytes())
+            
+            numWritten = len(dates)
+            header['count'] = count + numWritten - (1 if replaceLast else 0)
+            self._write_header(header)
+            return numWritten
+
+"""
+Appends any bars in the local sqlite db that are newer than the last bar in the store 
+    returns number of bars appended 
+"""
+def syncFromDB(conn, store):
+    lastDate = store.last_date()
+    pxHistory = db.getPriceHistory(conn, store.symbol, store.interval, withpctChange=False, start=lastDate, columns=['open', 'high', 'low', 'close', 'volume'])
+    return store.append(pxHistory)
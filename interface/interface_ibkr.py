@@ -2,13 +2,16 @@ from symtable import Symbol
 from ib_insync import *
 from rich import print
 
+import numpy as np
 import pandas as pd
 
 import ib_insync.wrapper
+import asyncio
 import datetime
 import sqlite3
 import sys
 import time
+from contextlib import closing
 import config
 
 #global list of index symbols
@@ -23,36 +26,193 @@ exchange_mapping = config.exchange_mapping
 ##
 # IBKR API reference: https://interactivebrokers.github.io/tws-api/historical_bars.html
 
+"""
+Long-lived, shared IBKR connection with heartbeat checks and automatic reconnect 
+    - one IB instance per session, reused across refresh cycles instead of a handshake per call 
+    - ensureConnected() reconnects with exponential backoff; while backing off it returns None right away, 
+      so callers skip a cycle instead of blocking or exiting 
+    - a client id that is already in use moves the session to the next free id 
+    - the connection is pinged with reqCurrentTime when it has been idle for heartbeatInterval seconds, 
+      a ping that gets no answer within heartbeatTimeout seconds counts as a dead connection 
+
+Usage: 
+    session = ib.getSession('realtime_monitor')
+    ibkr = session.ensureConnected()
+    if ibkr is not None: 
+        bars = ib.getBars(ibkr, ...)
+"""
+class IBKRSession:
+    _clientIdsInUse = set() # across sessions in this process
+
+    def __init__(self, host=config.ibkr_host, port=config.ibkr_port, clientId=config.ibkr_clientId, heartbeatInterval=30, heartbeatTimeout=5, maxAttempts=3, maxBackoff=60, connectTimeout=4, ibFactory=None):
+        self.host = host
+        self.port = port
+        self.clientId = clientId
+        self.heartbeatInterval = heartbeatInterval
+        self.heartbeatTimeout = heartbeatTimeout
+        self.maxAttempts = maxAttempts
+        self.maxBackoff = maxBackoff
+        self.connectTimeout = connectTimeout
+        self.ibFactory = ibFactory or _defaultIBFactory
+        self.ib = self.ibFactory()
+        self.ib.disconnectedEvent += self._onDisconnected
+        self._lastHeartbeat = 0
+        self._failures = 0
+        self._nextAttempt = 0
+        self._claimedClientId = None
+
+    def _onDisconnected(self):
+        print('%s: [yellow]IBKR session %s disconnected[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), self.clientId))
+        self._lastHeartbeat = 0
+
+    def _claimClientId(self):
+        if self._claimedClientId == self.clientId:
+            return
+        while self.clientId in IBKRSession._clientIdsInUse:
+            self.clientId += 1
+        IBKRSession._clientIdsInUse.add(self.clientId)
+        self._claimedClientId = self.clientId
+
+    def _connect(self):
+        """ single connection attempt, moves to the next client id if ours is taken """
+        self._claimClientId()
+        try:
+            print('%s: [yellow]Connecting with IBKR (client id %s)...[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), self.clientId))
+            self.ib.connect(self.host, self.port, clientId=self.clientId, timeout=self.connectTimeout)
+            print('%s: [green]  Success![/green]'%(datetime.datetime.now().strftime('%H:%M:%S')))
+            return True
+        except Exception as e:
+            if self.ib.isConnected():
+                self.ib.disconnect()
+            if '326' in str(e) or 'already in use' in str(e):
+                # taken by another process, leave it reserved and move on to the next id
+                self.clientId += 1
+            print('[red]  Could not connect with IBKR![/red] %s'%(e))
+            return False
+
+    def heartbeat(self):
+        """ returns True if the connection answers a reqCurrentTime within heartbeatTimeout seconds """
+        # a half-open socket never answers, without a RequestTimeout (0 = wait forever) the ping would hang the caller 
+        requestTimeout = getattr(self.ib, 'RequestTimeout', 0)
+        self.ib.RequestTimeout = self.heartbeatTimeout
+        try:
+            self.ib.reqCurrentTime()
+            self._lastHeartbeat = time.monotonic()
+            return True
+        except (asyncio.TimeoutError, TimeoutError):
+            print('%s: [yellow]IBKR heartbeat timed out after %ss, treating the connection as lost[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), self.heartbeatTimeout))
+            self.ib.disconnect()
+            return False
+        except Exception as e:
+            print('%s: [yellow]IBKR heartbeat failed: %s[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), e))
+            return False
+        finally:
+            self.ib.RequestTimeout = requestTimeout
+
+    def isHealthy(self):
+        if not self.ib.isConnected():
+            return False
+        if time.monotonic() - self._lastHeartbeat < self.heartbeatInterval:
+            return True
+        return self.heartbeat()
+
+    def ensureConnected(self):
+        """ returns the connected IB object, or None if IBKR can't be reached right now """
+        if self.isHealthy():
+            return self.ib
+        if time.monotonic() < self._nextAttempt:
+            return None # still backing off, degrade instead of blocking the caller
+        
+        if self.ib.isConnected():
+            self.ib.disconnect() # connected but not answering
+        for attempt in range(self.maxAttempts):
+            if self._connect():
+                self._failures = 0
+                self._nextAttempt = 0
+                self._lastHeartbeat = time.monotonic()
+                return self.ib
+            self._failures += 1
+            if attempt < self.maxAttempts - 1:
+                self.ib.sleep(min(2 ** (self._failures - 1), self.maxBackoff)) # keeps the event loop running, unlike time.sleep
+        
+        self._nextAttempt = time.monotonic() + min(2 ** self._failures, self.maxBackoff)
+        print('%s: [red]IBKR unavailable, retrying in %ss[/red]'%(datetime.datetime.now().strftime('%H:%M:%S'), round(self._nextAttempt - time.monotonic())))
+        return None
+
+    def reconnect(self):
+        if self.ib.isConnected():
+            self.ib.disconnect()
+        self._nextAttempt = 0
+        return self.ensureConnected()
+
+    def close(self):
+        if self.ib.isConnected():
+            self.ib.disconnect()
+        IBKRSession._clientIdsInUse.discard(self._claimedClientId)
+        self._claimedClientId = None
+
+_sessions = {}
+
+"""
+Returns a new IB object, or a ReplayIB over the local db when config.ibkr_replay is set 
+"""
+def _defaultIBFactory():
+    if getattr(config, 'ibkr_replay', None):
+        from interface.interface_ibkrReplay import ReplayIB
+        return ReplayIB(**config.ibkr_replay)
+    return IB()
+
+"""
+Returns the shared session registered under name, creating it on first use 
+    sessions get their own client id, counting up from config.ibkr_clientId 
+"""
+def getSession(name='default', **kwargs):
+    if name not in _sessions:
+        _sessions[name] = IBKRSession(**kwargs)
+    return _sessions[name]
+
 """
 Setup connection to ibkr
 ###
 --
-Returns ibkr connection object 
+Returns the default session's connected ibkr object, None if ibkr can't be reached 
 """
 def setupConnection():
-    ## connect with IBKR
-    try:
-        print('%s: [yellow]Connecting with IBKR...[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S')))
-        ibkr = IB() 
-        ibkr.connect('127.0.0.1', 7496, clientId = 10)
-        # ibkr.connectAsync('127.0.0.1', 7496, clientId = 10)
-        print('%s: [green]  Success![/green]'%(datetime.datetime.now().strftime('%H:%M:%S')))
-    except Exception as e:
-        print('[red]  Could not connect with IBKR![/red]\n')
-        print(e)
-        exit()
-    
-    return ibkr
+    return getSession().ensureConnected()
 
 def refreshConnection(ibkr):
     print('%s: [yellow]Refreshing IBKR connection...[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S')))
-    #if ibkr.isConnected():
+    for session in _sessions.values():
+        if session.ib is ibkr:
+            return session.reconnect()
+    # not a session connection, reconnect it in place
     clientid = ibkr.client.clientId
     ibkr.disconnect()
-    ibkr = ibkr.connect('127.0.0.1', 7496, clientId = clientid)
+    ibkr.connect(config.ibkr_host, config.ibkr_port, clientId = clientid)
     print('%s:[green]   Success![/green]'%(datetime.datetime.now().strftime('%H:%M:%S')))
     return ibkr
 
+"""
+Returns the ib_insync contract for a symbol: Index for symbols in the index list, Future when lastTradeDate is set, Stock otherwise 
+    currency is taken from the config mapping when the symbol is listed there 
+    exchange falls back to the config mapping (then SMART) only when none is given, so fetcher requests can route explicitly 
+    futures include expired contracts, like _getHistoricalBars_futures, since backfills reach past expiry 
+    getEarliestTimeStamp_m builds its own contract and keeps its original mapping rules 
+"""
+def _buildContract(symbol, currency='USD', lastTradeDate='', exchange=''):
+    if symbol in currency_mapping:
+        currency = currency_mapping[symbol]
+    
+    # set exchange
+    if not exchange:
+        exchange = exchange_mapping.get(symbol, 'SMART')
+    
+    if symbol in _index:
+        return Index(symbol, exchange, currency)
+    elif lastTradeDate:
+        return Future(symbol=symbol, lastTradeDateOrContractMonth=lastTradeDate, exchange=exchange, currency=currency, includeExpired=True)
+    return Stock(symbol, exchange, currency)
+
 """ 
     Formats the contract history returned from ibkr 
 """
@@ -88,17 +248,8 @@ def _getHistoricalBars(ibkrObj, symbol, currency, endDate, lookback, interval, w
     
     keepUpToDate = kwargs.get('keepUpToDate', False)
 
-    # set exchange
-    if symbol in exchange_mapping:
-        exchange = exchange_mapping[symbol]
-    else:
-        exchange = 'SMART'
-
     # define contract 
-    if symbol in _index:
-        contract = Index(symbol, exchange, currency)
-    else:
-        contract = Stock(symbol, exchange, currency) 
+    contract = _buildContract(symbol, currency)
     
     # make sure endDate is tzaware
     if endDate:
@@ -126,6 +277,178 @@ def _getHistoricalBars(ibkrObj, symbol, currency, endDate, lookback, interval, w
 
     return contractHistory_df
 
+"""
+Fixed-size ring buffer of closed bars for one symbol, oldest bars are overwritten once it is full 
+    columns are preallocated numpy arrays: date (int64 ns, tz naive), open, high, low, close, volume 
+"""
+class BarRingBuffer:
+    columns = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._dates = np.zeros(capacity, dtype='int64')
+        self._values = np.full((len(self.columns), capacity), np.nan)
+        self._end = 0   # next write position
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def last_date(self):
+        """ date of the newest bar as pd.Timestamp, None if empty """
+        if self._count == 0:
+            return None
+        return pd.Timestamp(int(self._dates[(self._end - 1) % self.capacity]))
+
+    def append(self, date, open_, high, low, close, volume):
+        """ adds a closed bar, bars at or before the newest stored bar are ignored """
+        date = pd.Timestamp(date)
+        if date.tzinfo is not None:
+            date = date.tz_localize(None)
+        if self._count and date.value <= self._dates[(self._end - 1) % self.capacity]:
+            return False
+        self._dates[self._end] = date.value
+        self._values[:, self._end] = (open_, high, low, close, volume)
+        self._end = (self._end + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def extend(self, bars):
+        """ adds closed bars from an iterable of ib_insync BarData """
+        for bar in bars:
+            self.append(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
+
+    def _order(self):
+        # positions of the stored bars, oldest first
+        return (np.arange(self._count) + self._end - self._count) % self.capacity
+
+    def values(self, column):
+        """ returns a chronological copy of one column as a numpy array """
+        order = self._order()
+        if column == 'date':
+            return self._dates[order].view('datetime64[ns]')
+        return self._values[self.columns.index(column), order]
+
+    def to_frame(self, last_n=0):
+        """ returns stored bars oldest first, same columns as getBars """
+        order = self._order()[-last_n:] if last_n else self._order()
+        bars = pd.DataFrame(self._values[:, order].T, columns=self.columns)
+        bars.insert(0, 'date', self._dates[order].view('datetime64[ns]'))
+        return bars
+
+"""
+Streaming subscription to one symbol's bars 
+    - subscribes once with reqHistoricalData(keepUpToDate=True), seeded with lookback of history 
+    - closed bars go into a BarRingBuffer, the still-forming bar is kept in .forming 
+    - subscribers are called as callback(symbol, bar) every time a bar closes 
+    - a dropped connection marks the stream inactive, ensureStarted() re-subscribes and fills the gap 
+    - with a store (interface_barStore.BarStore), closed bars are persisted; on start the buffer is seeded from the store 
+      and only the gap since its last bar is requested, capped at lookback 
+
+Usage: 
+    stream = ib.BarStream('VIX', lookback='7 D', store=BarStore('VIX', '1min'))
+    stream.subscribe(lambda symbol, bar: print(symbol, bar.close))
+    stream.ensureStarted(session.ensureConnected())
+    stream.buffer.to_frame()
+"""
+class BarStream:
+    def __init__(self, symbol, interval='1 min', lookback='1 D', capacity=10000, whatToShow='TRADES', currency='USD', store=None):
+        self.symbol = symbol
+        self.interval = interval
+        self.lookback = lookback
+        self.whatToShow = whatToShow
+        self.contract = _buildContract(symbol, currency)
+        self.buffer = BarRingBuffer(capacity)
+        self.store = store
+        self.forming = None
+        self._subscribers = []
+        self._bars = None
+        self._ibkr = None
+        self._listening = False
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def isActive(self):
+        return self._bars is not None and self._ibkr is not None and self._ibkr.isConnected()
+
+    def ensureStarted(self, ibkr):
+        """ (re)subscribes if needed, returns True if the stream is live """
+        if ibkr is None:
+            return False
+        if self.isActive() and self._ibkr is ibkr:
+            return True
+        self.stop()
+        
+        if self.store is not None and len(self.buffer) == 0:
+            stored = self.store.to_frame().tail(self.buffer.capacity)
+            for bar in stored.itertuples(index=False):
+                self.buffer.append(bar.date, bar.open, bar.high, bar.low, bar.close, bar.volume)
+        
+        self._ibkr = ibkr
+        self._bars = ibkr.reqHistoricalData(
+            self.contract,
+            endDateTime='',
+            durationStr=self._duration(),
+            barSizeSetting=self.interval,
+            whatToShow=self.whatToShow,
+            useRTH=False,
+            formatDate=1,
+            keepUpToDate=True)
+        if not self._bars:
+            self._bars = None
+            print('%s: [red]Could not start streaming %s[/red]'%(datetime.datetime.now().strftime('%H:%M:%S'), self.symbol))
+            return False
+        
+        # the last bar is still forming, everything before it is closed; bars already buffered are skipped
+        self.buffer.extend(self._bars[:-1])
+        self._store(self._bars[:-1])
+        self.forming = self._bars[-1]
+        self._bars.updateEvent += self._onUpdate
+        ibkr.disconnectedEvent += self._onDisconnected
+        self._listening = True
+        return True
+
+    def _onUpdate(self, bars, hasNewBar):
+        self.forming = bars[-1]
+        if not hasNewBar or len(bars) < 2:
+            return
+        closed = bars[-2]
+        if self.buffer.append(closed.date, closed.open, closed.high, closed.low, closed.close, closed.volume):
+            self._store([closed])
+            for callback in self._subscribers:
+                callback(self.symbol, closed)
+
+    def _duration(self):
+        """ lookback, or just enough whole days to cover the gap since the newest buffered bar """
+        lastDate = self.buffer.last_date()
+        if lastDate is None:
+            return self.lookback
+        n, unit = self.lookback.split()
+        lookbackDays = int(n) * {'S': 1/86400, 'D': 1, 'W': 7, 'M': 31, 'Y': 365}[unit]
+        gapDays = (pd.Timestamp.now(tz='US/Eastern').tz_localize(None) - lastDate) / pd.Timedelta(days=1)
+        return self.lookback if gapDays + 1 >= lookbackDays else '%d D'%(int(gapDays) + 1)
+
+    def _store(self, bars):
+        """ persists closed bars, dates are stored tz naive like the ring buffer """
+        if self.store is None or not bars:
+            return
+        self.store.append(pd.DataFrame({
+            'date': [pd.Timestamp(bar.date).tz_localize(None) for bar in bars],
+            'open': [bar.open for bar in bars], 'high': [bar.high for bar in bars], 'low': [bar.low for bar in bars],
+            'close': [bar.close for bar in bars], 'volume': [bar.volume for bar in bars]}))
+
+    def _onDisconnected(self):
+        self._bars = None
+
+    def stop(self):
+        if self._listening:
+            self._ibkr.disconnectedEvent -= self._onDisconnected
+            self._listening = False
+            if self._bars is not None and self._ibkr.isConnected():
+                self._ibkr.cancelHistoricalData(self._bars)
+        self._bars = None
+
 """
 Returns dataframe of historical data for futures
     by default, returns data for NG futures
@@ -223,10 +546,146 @@ def _getHistoricalBars_futures_withContract(ibkrObj, contract, endDate, lookback
 
     return contractHistory_df
 
+"""
+Persistent cache of static contract metadata, so repeated runs don't spend IBKR round trips (and pacing) on it 
+    - contract details per lookup (symbol, type, currency) and head timestamps per contract, re-requested after ttlDays 
+    - lookups that found no contract are cached as well, failed requests are not 
+    - currency_mapping is applied before the lookup; exchange_mapping is applied when reading, so config changes take effect right away 
+    - kept in memory after the first read, stats counts the requests that went to IBKR 
+"""
+class ContractCache:
+    _contractFields = ['conId', 'symbol', 'secType', 'lastTradeDateOrContractMonth', 'multiplier', 'exchange', 'primaryExchange', 'currency', 'localSymbol', 'tradingClass']
+    _detailFields = ['longName', 'minTick', 'timeZoneId']
+
+    def __init__(self, dbname=config.dbname_contractCache, ttlDays=config.contractCache_ttlDays):
+        self.dbname = dbname
+        self.ttl = ttlDays * 86400
+        self._details = {}      # lookup key: (updated, [stored rows])
+        self._heads = {}        # contract key: (updated, earliest timestamp)
+        self._initialized = False
+        self.stats = {'hits': 0, 'requests': 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.dbname)
+        if not self._initialized:
+            conn.execute('CREATE TABLE IF NOT EXISTS lookups (lookup TEXT PRIMARY KEY, updated REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS contracts (lookup TEXT, %s)'%(', '.join(self._contractFields + self._detailFields)))
+            conn.execute('CREATE INDEX IF NOT EXISTS contracts_lookup ON contracts (lookup)')
+            conn.execute('CREATE TABLE IF NOT EXISTS headTimestamps (contract TEXT PRIMARY KEY, earliestTimestamp TEXT, updated REAL)')
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def _isFresh(self, updated):
+        return updated is not None and time.time() - updated < self.ttl
+
+    def _toDetails(self, row):
+        contract = Contract.create(**dict(zip(self._contractFields, row[:len(self._contractFields)])))
+        contract.exchange = exchange_mapping.get(contract.symbol, contract.exchange)
+        return ContractDetails(contract=contract, **dict(zip(self._detailFields, row[len(self._contractFields):])))
+
+    def getDetails(self, symbol, type, currency, request):
+        """ cached contract details for the lookup, request() is only called when they are missing or stale; empty answers are not cached """
+        lookup = '|'.join([symbol, type, currency])
+        updated = self._details.get(lookup, (None, None))[0]
+        if not self._isFresh(updated):
+            with closing(self._connect()) as conn:
+                row = conn.execute('SELECT updated FROM lookups WHERE lookup = ?', (lookup,)).fetchone()
+                if row is not None and self._isFresh(row[0]):
+                    updated = row[0]
+                    rows = conn.execute('SELECT %s FROM contracts WHERE lookup = ?'%(', '.join(self._contractFields + self._detailFields)), (lookup,)).fetchall()
+                    self._details[lookup] = (updated, rows)
+        if self._isFresh(updated):
+            self.stats['hits'] += 1
+            return [self._toDetails(row) for row in self._details[lookup][1]]
+
+        self.stats['requests'] += 1
+        details = request()
+        if not details:
+            return details # a timeout or disconnect answers [], don't remember it as "no such contract" 
+        updated = time.time()
+        rows = [tuple([getattr(d.contract, field) for field in self._contractFields] + [getattr(d, field) for field in self._detailFields]) for d in details]
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM contracts WHERE lookup = ?', (lookup,))
+            conn.executemany('INSERT INTO contracts VALUES (%s)'%(', '.join(['?'] * (1 + len(self._contractFields) + len(self._detailFields)))), [(lookup,) + row for row in rows])
+            conn.execute('INSERT OR REPLACE INTO lookups VALUES (?, ?)', (lookup, updated))
+            conn.commit()
+        self._details[lookup] = (updated, rows)
+        return [self._toDetails(row) for row in rows]
+
+    def getEarliestTimestamp(self, contract, request):
+        """ cached head timestamp for the contract, request() is only called when it is missing or stale; empty answers are not cached """
+        key = '|'.join([contract.symbol, contract.secType, contract.lastTradeDateOrContractMonth, contract.exchange, contract.currency])
+        if getattr(contract, 'includeExpired', False):
+            key += '|expired' # IBKR only answers for expired contracts when asked to include them
+        updated, timestamp = self._heads.get(key, (None, None))
+        if not self._isFresh(updated):
+            with closing(self._connect()) as conn:
+                row = conn.execute('SELECT earliestTimestamp, updated FROM headTimestamps WHERE contract = ?', (key,)).fetchone()
+            if row is not None and self._isFresh(row[1]):
+                timestamp, updated = pd.Timestamp(row[0]), row[1]
+                self._heads[key] = (updated, timestamp)
+        if self._isFresh(updated):
+            self.stats['hits'] += 1
+            return timestamp
+
+        self.stats['requests'] += 1
+        timestamp = request()
+        if isinstance(timestamp, pd.Timestamp) and not pd.isnull(timestamp):
+            updated = time.time()
+            with closing(self._connect()) as conn:
+                conn.execute('INSERT OR REPLACE INTO headTimestamps VALUES (?, ?, ?)', (key, timestamp.isoformat(), updated))
+                conn.commit()
+            self._heads[key] = (updated, timestamp)
+        return timestamp
+
+    def invalidate(self, symbol=None):
+        """ drops cached metadata for symbol, or everything """
+        pattern = '%s|%%'%(symbol) if symbol else '%'
+        with closing(self._connect()) as conn:
+            conn.execute('DELETE FROM lookups WHERE lookup LIKE ?', (pattern,))
+            conn.execute('DELETE FROM contracts WHERE lookup LIKE ?', (pattern,))
+            conn.execute('DELETE FROM headTimestamps WHERE contract LIKE ?', (pattern,))
+            conn.commit()
+        self._details = {key: value for key, value in self._details.items() if symbol and not key.startswith(symbol + '|')}
+        self._heads = {key: value for key, value in self._heads.items() if symbol and not key.startswith(symbol + '|')}
+
+_contractCache = None
+
+"""
+Returns the shared contract cache, created on first use 
+"""
+def getContractCache():
+    global _contractCache
+    if _contractCache is None:
+        _contractCache = ContractCache()
+    return _contractCache
+
+"""
+Returns True if lookups through ibkr may use the contract cache 
+    replay sessions answer from the local db (no contract details, head timestamps are the first stored bar), 
+    which must never stand in for IBKR's answers in the shared cache 
+"""
+def _usesContractCache(ibkr, useCache=True):
+    return useCache and not getattr(ibkr, 'isReplay', False)
+
+"""
+Returns the head timestamp of contract as reported by IBKR, served from the contract cache unless useCache=False 
+    cached as returned (tz aware) so each caller keeps its own timezone handling 
+"""
+def _getHeadTimestamp(ibkr, contract, useCache=True):
+    def _request():
+        earliestTS = ibkr.reqHeadTimeStamp(contract, useRTH=False, whatToShow='TRADES')
+        return pd.to_datetime(earliestTS)
+
+    if _usesContractCache(ibkr, useCache):
+        return getContractCache().getEarliestTimestamp(contract, _request)
+    return _request()
+
 """
 Returns [datetime] of earliest datapoint available for index and stock 
 """
-def getEarliestTimeStamp_m(ibkr, symbol='SPY', currency='USD', lastTradeDate='', exchange='SMART'):
+def getEarliestTimeStamp_m(ibkr, symbol='SPY', currency='USD', lastTradeDate='', exchange='SMART', useCache=True):
     # set currency 
     if symbol in currency_mapping:
         currency = currency_mapping[symbol]
@@ -242,18 +701,17 @@ def getEarliestTimeStamp_m(ibkr, symbol='SPY', currency='USD', lastTradeDate='',
         contract = Future(symbol=symbol, lastTradeDateOrContractMonth=lastTradeDate, exchange=exchange, currency=currency)
     else:
         contract = Stock(symbol, exchange, currency)
-    earliestTS = ibkr.reqHeadTimeStamp(contract, useRTH=False, whatToShow='TRADES')
-    return pd.to_datetime(earliestTS)
+    return _getHeadTimestamp(ibkr, contract, useCache=useCache)
 
 """
 Returns [datetime] of earliest datapoint available for index and stock, requires Contract object as input
+    served from the contract cache unless useCache=False
 """
-def getEarliestTimeStamp(ibkr, contract):
+def getEarliestTimeStamp(ibkr, contract, useCache=True):
     # check if symbol is in currency mapping
     if contract.symbol in currency_mapping:
         contract.currency = currency_mapping[contract.symbol]
-    earliestTS = ibkr.reqHeadTimeStamp(contract, useRTH=False, whatToShow='TRADES')
-    timestamp = pd.to_datetime(earliestTS)
+    timestamp = _getHeadTimestamp(ibkr, contract, useCache=useCache)
     # make sure timestamp is tzaware 
     timestamp = timestamp.tz_localize(None)
 
@@ -263,8 +721,8 @@ def getEarliestTimeStamp(ibkr, contract):
 """
 Returns just the contract portion of contract details for a given symbol and type 
 """
-def getContract(ibkr, symbol, type='stock', currency='USD'):
-    conDetails = getContractDetails(ibkr, symbol, type, currency)
+def getContract(ibkr, symbol, type='stock', currency='USD', useCache=True):
+    conDetails = getContractDetails(ibkr, symbol, type, currency, useCache=useCache)
     if len(conDetails) == 0: # contract not found 
         return Contract()
     else:
@@ -278,8 +736,9 @@ def getContract(ibkr, symbol, type='stock', currency='USD'):
         [optional]
         type = 'stock' | 'future' | 'index'
         currency = 'USD' | 'CAD'
+        useCache = False to skip the contract cache 
 """
-def getContractDetails(ibkr, symbol, type = 'stock', currency='USD'):
+def getContractDetails(ibkr, symbol, type = 'stock', currency='USD', useCache=True):
     # set currency 
     
     if symbol in currency_mapping:
@@ -291,14 +750,18 @@ def getContractDetails(ibkr, symbol, type = 'stock', currency='USD'):
             type = 'index'
 			
     # grab contract details from IBKR 
-    try:
+    def _request():
         if type == 'future':
-            contracts = ibkr.reqContractDetails(Future(symbol))
-            print('e')
+            return ibkr.reqContractDetails(Future(symbol))
         elif type == 'index':
-            contracts = ibkr.reqContractDetails(Index(symbol, currency=currency))
-        else: 
-            contracts = ibkr.reqContractDetails(Stock(symbol, currency=currency))
+            return ibkr.reqContractDetails(Index(symbol, currency=currency))
+        return ibkr.reqContractDetails(Stock(symbol, currency=currency))
+
+    try:
+        if _usesContractCache(ibkr, useCache):
+            contracts = getContractCache().getDetails(symbol, type, currency, _request)
+        else:
+            contracts = _request()
     except Exception as e:
         print(e)
         print('\nCould not retrieve contract details for...%s!'%(symbol))
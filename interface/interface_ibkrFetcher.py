@@ -0,0 +1,296 @@
+"""
+Concurrent, pacing-aware historical bar fetcher for IBKR.
+
+    - keeps several reqHistoricalDataAsync requests in flight on the ib_insync event loop
+    - a PacingGuard holds requests back until they satisfy IBKR's historical data pacing rules
+        https://interactivebrokers.github.io/tws-api/historical_limitations.html
+    - requests are served from a priority queue (lower number first), failed requests are retried with backoff
+    - ib_insync answers a failed request with an empty bar list; the fetcher reads the error behind it from errorEvent, 
+      so pacing violations and other transient errors are retried, and only IBKR's 'no data' answer comes back as empty bars
+    - finished requests are passed to an optional callback as they complete, e.g. to save them to the local db
+
+Usage:
+    ibkr = ib.setupConnection()
+    fetcher = HistoricalFetcher(ibkr, onResult=lambda request, bars, error: ...)
+    fetcher.submit(BarRequest('VIX', '10 D', '1 min'))
+    fetcher.submit(BarRequest('VX', '1 M', '1 day', lastTradeDate='202408'), priority=1)
+    results = fetcher.run() # {BarRequest: DataFrame}
+"""
+
+import asyncio
+import datetime
+import inspect
+import itertools
+import time
+from collections import defaultdict, deque
+
+import pandas as pd
+from ib_insync import RequestError, util
+from rich import print
+
+from interface import interface_ibkr as ib
+
+"""
+One historical data request, identified by everything IBKR uses to decide if two requests are identical
+
+    symbol, lastTradeDate, currency, exchange: passed to interface_ibkr._buildContract, or pass a ready contract
+    lookback: durationStr, e.g. '10 D', '1 Y'
+    interval: barSizeSetting, e.g. '1 min', '1 day'
+    endDate: '' for now, otherwise a tz naive US/Eastern datetime
+"""
+class BarRequest:
+    def __init__(self, symbol, lookback, interval, endDate='', lastTradeDate='', whatToShow='TRADES', useRTH=False, currency='USD', exchange='', contract=None):
+        self.symbol = symbol
+        self.lookback = lookback
+        self.interval = interval
+        self.endDate = pd.Timestamp(endDate) if endDate else ''
+        self.lastTradeDate = lastTradeDate
+        self.whatToShow = whatToShow
+        self.useRTH = useRTH
+        self.contract = contract if contract is not None else ib._buildContract(symbol, currency=currency, lastTradeDate=lastTradeDate, exchange=exchange)
+        self.attempts = 0
+
+    def contract_key(self):
+        """ requests for the same contract, exchange and tick type share the per-contract pacing limit """
+        return (self.contract.symbol, self.contract.secType, self.contract.lastTradeDateOrContractMonth, self.contract.exchange, self.whatToShow)
+
+    def key(self):
+        """ identical requests may not be repeated within the cooldown """
+        return self.contract_key() + (str(self.endDate), self.lookback, self.interval, self.useRTH)
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __eq__(self, other):
+        return isinstance(other, BarRequest) and self.key() == other.key()
+
+    def __repr__(self):
+        return 'BarRequest(%s %s, %s x %s, end=%s)'%(self.symbol, self.lastTradeDate, self.lookback, self.interval, self.endDate or 'now')
+
+# error codes worth retrying: pacing violations, HMDS query errors, 'not connected' and connectivity drops
+_transientErrorCodes = {162, 165, 322, 366, 504, 1100, 1101, 1102, 10182}
+
+"""
+Raised for a historical data request IBKR answered with an error
+    retryable is False for errors a retry won't fix, e.g. missing market data permissions or an unknown contract
+"""
+class HistoricalDataError(Exception):
+    def __init__(self, code, message, retryable=True):
+        super().__init__('Error %s: %s'%(code, message))
+        self.code = code
+        self.message = message
+        self.retryable = retryable
+
+""" 
+Returns 'noData' for IBKR's answer that there are no bars, 'retry' for pacing and transient errors, 'fail' for everything else 
+    162 covers all three: 'HMDS query returned no data', 'pacing violation', 'No market data permissions'
+"""
+def _classifyError(code, message):
+    message = message.lower()
+    if code == 162 and 'returned no data' in message:
+        return 'noData'
+    if 'permission' in message:
+        return 'fail'
+    return 'retry' if code in _transientErrorCodes else 'fail'
+
+"""
+Tracks sent requests and returns how long a new request has to wait to stay within IBKR pacing rules
+    - no identical request within identicalCooldown seconds
+    - at most maxRequests per window seconds; IBKR only enforces this for bars of 30 secs or less
+    - fewer than six requests for the same contract, exchange and tick type within contractWindow seconds
+    defaults add a margin over IBKR's 15s / 2s rules, since IBKR timestamps a request when it arrives, not when it is sent
+"""
+class PacingGuard:
+    def __init__(self, maxRequests=60, window=600, identicalCooldown=16, maxPerContract=5, contractWindow=2.5, smallBarsOnly=True, clock=time.monotonic):
+        self.maxRequests = maxRequests
+        self.window = window
+        self.identicalCooldown = identicalCooldown
+        self.maxPerContract = maxPerContract
+        self.contractWindow = contractWindow
+        self.smallBarsOnly = smallBarsOnly
+        self.clock = clock
+        self._sent = deque()                    # send times of requests counted against maxRequests
+        self._identical = {}                    # request key: last send time
+        self._perContract = defaultdict(deque)  # contract key: send times
+
+    def _countsAgainstWindow(self, request):
+        # bar sizes of 30 secs or less are the only ones subject to the 10 minute limit
+        return not self.smallBarsOnly or request.interval.split()[-1].startswith('sec')
+
+    def wait_time(self, request):
+        """ seconds until request can be sent, 0 if it can be sent now """
+        now = self.clock()
+        wait = 0
+
+        lastIdentical = self._identical.get(request.key())
+        if lastIdentical is not None:
+            wait = max(wait, lastIdentical + self.identicalCooldown - now)
+
+        sentContract = self._perContract[request.contract_key()]
+        while sentContract and sentContract[0] <= now - self.contractWindow:
+            sentContract.popleft()
+        if len(sentContract) >= self.maxPerContract:
+            wait = max(wait, sentContract[len(sentContract) - self.maxPerContract] + self.contractWindow - now)
+
+        if self._countsAgainstWindow(request):
+            while self._sent and self._sent[0] <= now - self.window:
+                self._sent.popleft()
+            if len(self._sent) >= self.maxRequests:
+                wait = max(wait, self._sent[len(self._sent) - self.maxRequests] + self.window - now)
+
+        return max(wait, 0)
+
+    def record(self, request):
+        now = self.clock()
+        self._identical[request.key()] = now
+        self._perContract[request.contract_key()].append(now)
+        if self._countsAgainstWindow(request):
+            self._sent.append(now)
+
+        # forget identical keys once their cooldown has passed
+        if len(self._identical) > 10000:
+            self._identical = {key: sent for key, sent in self._identical.items() if sent > now - self.identicalCooldown}
+
+    async def acquire(self, request):
+        """ waits until request can be sent and records it; check and record happen without yielding """
+        while True:
+            wait = self.wait_time(request)
+            if wait <= 0:
+                self.record(request)
+                return
+            await asyncio.sleep(wait)
+
+"""
+Fetches historical bars for many requests concurrently on the ib_insync event loop
+
+    Args:
+        ibkr: connected ib_insync IB object (or anything with the same reqHistoricalDataAsync)
+        maxInFlight (int): number of requests waiting on IBKR at the same time
+        maxRetries (int): retries for a request that raised or timed out
+        timeout (float): seconds to wait for a single request
+        onResult (callable): [optional] called as onResult(request, bars, error) when a request is done, may be async
+            bars is a formatted DataFrame, empty only when IBKR answered that it has no data; 
+            None when the request failed, error is then the last exception, otherwise None
+        timeout is passed on to ib_insync, which cancels a request that times out so it stops counting against pacing; 
+        the fetcher retries it like any other failed request
+        pacing (PacingGuard): [optional] shared pacing state, e.g. across fetchers on the same connection
+
+    Attributes:
+        callbackErrors (dict): {request: exception} for requests whose onResult raised, the other requests carry on 
+"""
+class HistoricalFetcher:
+    def __init__(self, ibkr, maxInFlight=6, maxRetries=3, timeout=120, retryDelay=2, onResult=None, pacing=None):
+        self.ibkr = ibkr
+        self.maxInFlight = maxInFlight
+        self.maxRetries = maxRetries
+        self.timeout = timeout
+        self.retryDelay = retryDelay
+        self.onResult = onResult
+        self.pacing = pacing if pacing is not None else PacingGuard()
+        self._queue = []
+        self._seq = itertools.count()
+        self._errors = {} # reqId: (errorCode, errorString) reported by errorEvent
+        self.callbackErrors = {} # request: exception raised by onResult for it
+
+    def _onError(self, reqId, errorCode, errorString, contract=None):
+        if reqId is not None and reqId >= 0 and not 2100 <= errorCode < 2200: # 21xx are farm status notices
+            self._errors[reqId] = (errorCode, errorString)
+
+    def submit(self, request, priority=0):
+        """ queues a request, lower priority numbers are fetched first, ties in submission order """
+        self._queue.append((priority, next(self._seq), request))
+
+    async def _fetch(self, request):
+        endDate = request.endDate
+        if endDate != '' and endDate.tzinfo is None:
+            endDate = endDate.tz_localize('US/Eastern')
+
+        # ib_insync's timeout cancels the request with IBKR, an asyncio.wait_for around it could not since only ib_insync knows the reqId 
+        sent = time.monotonic()
+        try:
+            bars = await self.ibkr.reqHistoricalDataAsync(
+                request.contract,
+                endDateTime=endDate,
+                durationStr=request.lookback,
+                barSizeSetting=request.interval,
+                whatToShow=request.whatToShow,
+                useRTH=request.useRTH,
+                formatDate=1,
+                timeout=self.timeout)
+        except RequestError as e: # the IB object has RaiseRequestErrors set
+            bars, error = None, (e.code, e.message)
+        else:
+            error = self._errors.pop(getattr(bars, 'reqId', None), None)
+
+        if error is not None:
+            kind = _classifyError(*error)
+            if kind != 'noData':
+                raise HistoricalDataError(*error, retryable=kind == 'retry')
+            return pd.DataFrame()
+        if not bars:
+            # ib_insync returns an empty list after cancelling a request that timed out
+            if time.monotonic() - sent >= self.timeout:
+                raise asyncio.TimeoutError('no answer within %ss, request cancelled'%(self.timeout))
+            return pd.DataFrame()
+        bars = ib._formatContractHistory(util.df(bars))
+        bars['symbol'] = request.symbol
+        bars['interval'] = request.interval.replace(' ', '') # local db interval format, e.g. 1min
+        return bars
+
+    async def _worker(self, queue, results):
+        while True:
+            try:
+                _, _, request = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            bars, error = None, None
+            while True:
+                await self.pacing.acquire(request)
+                request.attempts += 1
+                try:
+                    bars, error = await self._fetch(request), None
+                    break
+                except Exception as e:
+                    error = e
+                    if isinstance(e, HistoricalDataError) and not e.retryable:
+                        print('%s: [red]Giving up on %s: %s[/red]'%(datetime.datetime.now().strftime('%H:%M:%S'), request, e))
+                        break
+                    if request.attempts > self.maxRetries:
+                        print('%s: [red]Giving up on %s after %s attempts: %s[/red]'%(datetime.datetime.now().strftime('%H:%M:%S'), request, request.attempts, repr(e)))
+                        break
+                    await asyncio.sleep(self.retryDelay * 2 ** (request.attempts - 1))
+
+            results[request] = bars
+            if self.onResult is not None:
+                # a failing callback is this request's problem, it must not cancel the others through gather 
+                try:
+                    callbackResult = self.onResult(request, bars, error)
+                    if inspect.isawaitable(callbackResult):
+                        await callbackResult
+                except Exception as e:
+                    self.callbackErrors[request] = e
+                    print('%s: [red]onResult failed for %s: %s[/red]'%(datetime.datetime.now().strftime('%H:%M:%S'), request, repr(e)))
+
+    async def runAsync(self):
+        """ fetches every queued request, returns {request: DataFrame or None if it failed} """
+        queue = asyncio.PriorityQueue()
+        for item in self._queue:
+            queue.put_nowait(item)
+        self._queue = []
+
+        results = {}
+        self.ibkr.errorEvent += self._onError
+        workers = [asyncio.ensure_future(self._worker(queue, results)) for _ in range(min(self.maxInFlight, queue.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.ibkr.errorEvent -= self._onError
+            self._errors = {}
+        return results
+
+    def run(self):
+        """ blocking version of runAsync for scripts, runs on the ib_insync event loop """
+        return util.run(self.runAsync())
@@ -0,0 +1,281 @@
+"""
+Replays the local db as a stand-in for a live TWS / IB Gateway connection.
+
+    - ReplayIB answers the subset of the ib_insync IB API used in this repo: reqHistoricalData(Async) incl. keepUpToDate
+      streaming, reqHeadTimeStamp, reqCurrentTime, connect/disconnect/isConnected/sleep and the connection events
+    - bars come from the local db (stored or resampled intervals), the replay clock runs speed times faster than the wall clock
+    - latency, pacing violations and disconnects can be injected to exercise retry and reconnect paths
+
+Usage:
+    # point every session at the replay, e.g. in config.py; realtime_monitor and ingestion jobs run unchanged
+    ibkr_replay = {'start': '2024-04-01 09:30', 'speed': 60, 'latency': 0.05}
+
+    # or build one directly
+    ibkr = ReplayIB(start='2024-04-01 09:30', speed=600, latency=0.05, pacingViolationRate=0.01)
+    bars = ibkr.reqHistoricalData(Index('VIX', 'CBOE', 'USD'), endDateTime='', durationStr='1 D', barSizeSetting='1 min', ...)
+"""
+
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+import config
+import pandas as pd
+from ib_insync import BarData, BarDataList, Event, RequestError
+
+from interface import interface_ingestion as ingestion
+from interface import interface_localDB as db
+from interface.interface_ibkrFetcher import BarRequest, PacingGuard
+
+_timezone = 'US/Eastern' # stored bars are tz naive US/Eastern
+
+"""
+Mock ib_insync IB object serving history and streaming bars from the local db
+
+    Args:
+        dbname (str): db to replay
+        start (datetime): replay clock at connect time; defaults to one day before the last stored bar of the first table requested
+        speed (float): replay seconds per wall clock second, 1 to 1000
+        latency (float): seconds added to every request, plus up to latencyJitter seconds at random
+            a request slower than its timeout is dropped and returns no bars, like ib_insync does after cancelling it
+        pacingViolationRate (float): share of historical requests answered with error 162
+        enforcePacing (bool): also answer with error 162 when a request breaks IBKR's pacing rules
+            like ib_insync, error 162 returns no bars, or raises RequestError if RaiseRequestErrors is set
+        disconnectAfter (float): [optional] wall clock seconds after connect when the connection drops
+        connectFailures (int): number of connect attempts that fail before one succeeds
+        seed (int): [optional] seed for the injected randomness
+"""
+class ReplayIB:
+    RaiseRequestErrors = False
+    isReplay = True # answers come from the local db, interface_ibkr keeps them out of the contract cache
+
+    def __init__(self, dbname=config.dbname_stock, start=None, speed=1, latency=0.0, latencyJitter=0.0, pacingViolationRate=0.0, enforcePacing=True, disconnectAfter=None, connectFailures=0, seed=None):
+        self.dbname = dbname
+        self.speed = speed
+        self.latency = latency
+        self.latencyJitter = latencyJitter
+        self.pacingViolationRate = pacingViolationRate
+        self.disconnectAfter = disconnectAfter
+        self.connectFailures = connectFailures
+        self._random = random.Random(seed)
+        self._pacing = PacingGuard(identicalCooldown=15, contractWindow=2) if enforcePacing else None
+
+        self.client = SimpleNamespace(clientId=None)
+        self.connectedEvent = Event('connectedEvent')
+        self.disconnectedEvent = Event('disconnectedEvent')
+        self.errorEvent = Event('errorEvent')
+
+        self._start = pd.Timestamp(start) if start is not None else None
+        self._wallStart = time.monotonic()
+        self._connected = False
+        self._connectedAt = None
+        self._reqId = 0
+        self._streams = []      # (bars, pending bars)
+        self._pumpTask = None
+        self.stats = {'requests': 0, 'bars': 0, 'violations': 0, 'timeouts': 0, 'disconnects': 0, 'streamedBars': 0}
+
+    """ connection """
+    def connect(self, host='127.0.0.1', port=7496, clientId=1, timeout=4, **kwargs):
+        if self.connectFailures > 0:
+            self.connectFailures -= 1
+            raise ConnectionRefusedError('Replay: connect refused (injected)')
+        self.client.clientId = clientId
+        self._connected = True
+        self._connectedAt = time.monotonic()
+        self.connectedEvent.emit()
+        return self
+
+    async def connectAsync(self, *args, **kwargs):
+        return self.connect(*args, **kwargs)
+
+    def isConnected(self):
+        self._checkDisconnect()
+        return self._connected
+
+    def disconnect(self):
+        if self._connected:
+            self._connected = False
+            self._streams = []
+            self.disconnectedEvent.emit()
+
+    def injectDisconnect(self):
+        """ drops the connection as if TWS went away """
+        self.stats['disconnects'] += 1
+        self.disconnect()
+
+    def _checkDisconnect(self):
+        if self._connected and self.disconnectAfter is not None and time.monotonic() - self._connectedAt >= self.disconnectAfter:
+            self.injectDisconnect()
+
+    def _requireConnection(self):
+        if not self.isConnected():
+            raise ConnectionError('Replay: not connected')
+
+    """ replay clock """
+    def now(self):
+        """ current replay time, tz naive US/Eastern """
+        if self._start is None:
+            return None
+        return self._start + pd.Timedelta(seconds=(time.monotonic() - self._wallStart) * self.speed)
+
+    def _ensureClock(self, tablename):
+        if self._start is None:
+            lastDate = db.getLastRecordDate(db._getReadConnection(self.dbname), tablename)
+            self._start = (lastDate or pd.Timestamp.now().normalize()) - pd.Timedelta(days=1)
+            self._wallStart = time.monotonic()
+
+    def reqCurrentTime(self):
+        self._requireConnection()
+        return (self.now() or pd.Timestamp.now()).tz_localize(_timezone).to_pydatetime()
+
+    def sleep(self, secs=0.02):
+        """ like IB.sleep: keeps delivering streamed bars while waiting """
+        loop = asyncio.get_event_loop()
+        end = time.monotonic() + secs
+        while True:
+            self._pump()
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            loop.run_until_complete(asyncio.sleep(min(remaining, 0.02)))
+        return True
+
+    """ history """
+    def _tablename(self, contract, barSizeSetting):
+        interval = barSizeSetting.replace(' ', '')
+        if contract.secType == 'FUT':
+            return '%s_%s_%s'%(contract.symbol, contract.lastTradeDateOrContractMonth[:6], interval)
+        return db._constructTableName(contract.symbol, interval)
+
+    def _loadBars(self, tablename, start, end, barSizeSetting, closed='left'):
+        """ 
+        stored bars between start and end as BarData, dates formatted the way ib_insync does with formatDate=1 
+            closed: 'left' [start, end) like IBKR for an explicit end date, 'both' [start, end], 'right' (start, end] 
+        """
+        conn = db._getReadConnection(self.dbname)
+        try:
+            pxHistory = db.getPriceHistoryWithTablename(conn, tablename, start=start, end=end, columns=['open', 'high', 'low', 'close', 'volume'])
+        except Exception:
+            return [] # no such table, same as IBKR returning no data
+        if closed == 'left':
+            pxHistory = pxHistory[pxHistory['date'] < end]
+        elif closed == 'right':
+            pxHistory = pxHistory[pxHistory['date'] > start]
+
+        isDaily = barSizeSetting.endswith(('day', 'week', 'month'))
+        dates = pxHistory['date'].dt.date if isDaily else pxHistory['date'].dt.tz_localize(_timezone)
+        return [BarData(date=date if isDaily else date.to_pydatetime(), open=o, high=h, low=l, close=c, volume=v, average=c, barCount=0)
+                for date, o, h, l, c, v in zip(dates, pxHistory['open'], pxHistory['high'], pxHistory['low'], pxHistory['close'], pxHistory['volume'])]
+
+    def _isViolation(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH):
+        if self._random.random() < self.pacingViolationRate:
+            return True
+        if self._pacing is None:
+            return False
+        request = BarRequest(contract.symbol, durationStr, barSizeSetting, endDate=endDateTime, whatToShow=whatToShow, useRTH=useRTH, contract=contract)
+        if self._pacing.wait_time(request) > 0:
+            return True
+        self._pacing.record(request)
+        return False
+
+    def _historicalData(self, contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, keepUpToDate):
+        self._requireConnection()
+        self._reqId += 1
+        self.stats['requests'] += 1
+        tablename = self._tablename(contract, barSizeSetting)
+        self._ensureClock(tablename)
+
+        bars = BarDataList()
+        bars.reqId = self._reqId
+        bars.contract = contract
+        bars.barSizeSetting = barSizeSetting
+        bars.keepUpToDate = keepUpToDate
+
+        if self._isViolation(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH):
+            self.stats['violations'] += 1
+            message = 'Historical Market Data Service error message:Historical data request pacing violation'
+            self.errorEvent.emit(self._reqId, 162, message, contract)
+            if self.RaiseRequestErrors:
+                raise RequestError(self._reqId, 162, message)
+            return bars
+
+        end = self.now() if endDateTime in ('', None) else pd.Timestamp(endDateTime)
+        if end.tzinfo is not None:
+            end = end.tz_convert(_timezone).tz_localize(None)
+        # only bars that have started by the replay clock exist yet, the last one is still forming
+        if end < self.now():
+            bars.extend(self._loadBars(tablename, end - ingestion._durationOffset(durationStr), end, barSizeSetting, closed='left'))
+        else:
+            bars.extend(self._loadBars(tablename, end - ingestion._durationOffset(durationStr), self.now(), barSizeSetting, closed='both'))
+        self.stats['bars'] += len(bars)
+        if not bars and not keepUpToDate:
+            self.errorEvent.emit(self._reqId, 162, 'Historical Market Data Service error message:HMDS query returned no data: %s@%s %s'%(contract.symbol, contract.exchange, whatToShow.title()), contract)
+
+        if keepUpToDate:
+            lastDate = pd.Timestamp(bars[-1].date).tz_localize(None) if bars else end
+            pending = self._loadBars(tablename, lastDate, lastDate + pd.Timedelta(days=7), barSizeSetting, closed='right')
+            self._streams.append((bars, pending))
+        return bars
+
+    def _delay(self):
+        return self.latency + self._random.random() * self.latencyJitter
+
+    def _timedOut(self):
+        """ empty answer for a request that timed out """
+        self._requireConnection()
+        self._reqId += 1
+        self.stats['requests'] += 1
+        self.stats['timeouts'] += 1
+        bars = BarDataList()
+        bars.reqId = self._reqId
+        return bars
+
+    def reqHistoricalData(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 min', whatToShow='TRADES', useRTH=False, formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60):
+        delay = self._delay()
+        if timeout and delay >= timeout:
+            time.sleep(timeout)
+            return self._timedOut()
+        time.sleep(delay)
+        return self._historicalData(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, keepUpToDate)
+
+    async def reqHistoricalDataAsync(self, contract, endDateTime='', durationStr='1 D', barSizeSetting='1 min', whatToShow='TRADES', useRTH=False, formatDate=1, keepUpToDate=False, chartOptions=[], timeout=60):
+        delay = self._delay()
+        if timeout and delay >= timeout:
+            await asyncio.sleep(timeout)
+            return self._timedOut()
+        await asyncio.sleep(delay)
+        bars = self._historicalData(contract, endDateTime, durationStr, barSizeSetting, whatToShow, useRTH, keepUpToDate)
+        if keepUpToDate and self._pumpTask is None:
+            self._pumpTask = asyncio.ensure_future(self._pumpForever())
+        return bars
+
+    def cancelHistoricalData(self, bars):
+        self._streams = [stream for stream in self._streams if stream[0] is not bars]
+
+    def reqHeadTimeStamp(self, contract, whatToShow='TRADES', useRTH=False, formatDate=1):
+        self._requireConnection()
+        firstDate = db.getFirstRecordDate(db._getReadConnection(self.dbname), self._tablename(contract, '1 day'))
+        return firstDate.to_pydatetime() if firstDate is not None else []
+
+    def reqContractDetails(self, contract):
+        return []
+
+    """ streaming """
+    def _pump(self):
+        """ appends every pending bar that has started by the replay clock and emits updateEvent(bars, hasNewBar=True) """
+        self._checkDisconnect()
+        now = self.now()
+        if now is None:
+            return
+        for bars, pending in self._streams:
+            while pending and pd.Timestamp(pending[0].date).tz_localize(None) <= now:
+                bars.append(pending.pop(0))
+                self.stats['streamedBars'] += 1
+                bars.updateEvent.emit(bars, True)
+
+    async def _pumpForever(self):
+        while self._streams:
+            self._pump()
+            await asyncio.sleep(0.02)
+        self._pumpTask = None
@@ -0,0 +1,270 @@
+"""
+Keeps the local db up to date with IBKR.
+
+    - sync: for every ohlc table, requests only the bars after its last stored bar (the watermark)
+    - backfill: requests the history between the earliest date IBKR has and the first stored bar, 
+      checkpointing progress in the records lookup table so an interrupted backfill resumes where it stopped
+    - gaps are split into the largest durationStr IBKR accepts for the bar size
+    - requests run through interface_ibkrFetcher, results are written behind them by interface_localDB.HistoryWriter
+
+Usage:
+    python -m interface.interface_ingestion {sync|backfill} [--db path] [--table VIX_index_1min ...]
+"""
+
+import datetime
+import math
+import re
+import sys
+import config
+import pandas as pd
+from rich import print
+
+from interface import interface_ibkr as ib
+from interface import interface_ibkrFetcher as fetcher
+from interface import interface_localDB as db
+
+# longest durationStr IBKR accepts for each bar size
+# https://interactivebrokers.github.io/tws-api/historical_limitations.html#hd_step_sizes
+_maxDuration = {
+    '1 secs': '1800 S', '5 secs': '3600 S', '10 secs': '14400 S', '15 secs': '14400 S', '30 secs': '28800 S',
+    '1 min': '1 D', '2 mins': '2 D', '3 mins': '1 W', '5 mins': '1 W', '10 mins': '1 W', '15 mins': '1 W', '20 mins': '1 W',
+    '30 mins': '1 M', '1 hour': '1 M', '2 hours': '1 M', '3 hours': '1 M', '4 hours': '1 M', '8 hours': '1 M',
+    '1 day': '1 Y', '1 week': '1 Y', '1 month': '1 Y'
+}
+
+_durationUnits = {'S': 'seconds', 'D': 'days', 'W': 'weeks', 'M': 'months', 'Y': 'years'}
+
+"""
+Converts a local db interval to an IBKR bar size, e.g. 1min -> 1 min, 5mins -> 5 mins, 1day -> 1 day
+"""
+def _toBarSize(interval):
+    match = re.fullmatch(r'(\d+)\s*([a-z]+)', interval.strip().lower())
+    if not match:
+        raise ValueError('Unsupported interval: %s'%(interval))
+    return '%s %s'%(match.group(1), match.group(2))
+
+"""
+Returns the offset a durationStr covers, e.g. '1 W' -> pd.DateOffset(weeks=1)
+"""
+def _durationOffset(durationStr):
+    n, unit = durationStr.split()
+    return pd.DateOffset(**{_durationUnits[unit]: int(n)})
+
+"""
+Returns the shortest durationStr that covers delta for barSize
+    seconds for intraday gaps under a day, whole days otherwise
+"""
+def _coveringDuration(delta, barSize):
+    if _maxDuration[barSize].endswith('S') or (delta <= pd.Timedelta(days=1) and not barSize.endswith(('day', 'week', 'month'))):
+        return '%d S'%(max(60, math.ceil(delta.total_seconds())))
+    days = max(1, math.ceil(delta / pd.Timedelta(days=1)))
+    return '%d D'%(days) if days <= 365 else '1 Y' # IBKR wants years past 365 days
+
+"""
+Splits [start, end] into (endDate, durationStr) chunks of at most the largest duration IBKR allows for barSize, newest first
+    the oldest chunk is shortened to just cover start
+
+Params
+===========
+start, end - [datetime] tz naive, US/Eastern
+barSize - [str] IBKR bar size, e.g. '1 min'
+"""
+def planChunks(start, end, barSize):
+    maxDuration = _maxDuration[barSize]
+    step = _durationOffset(maxDuration)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+    chunks = []
+    while end > start:
+        chunkStart = end - step
+        if chunkStart <= start:
+            chunks.append((end, _coveringDuration(end - start, barSize)))
+            break
+        chunks.append((end, maxDuration))
+        end = chunkStart
+    return chunks
+
+"""
+Returns symbol, lastTradeDate ('' for stocks and indexes), interval parsed from an ohlc tablename
+    e.g. VIX_index_1min -> VIX, '', 1min; VX_202408_1day -> VX, 202408, 1day
+"""
+def _parseTablename(tablename):
+    symbol, kind, interval = tablename.split('_')
+    lastTradeDate = '' if kind in ('stock', 'index') else kind
+    return symbol, lastTradeDate, interval
+
+"""
+Returns the list of BarRequests that bring tablename up to now, starting at its watermark
+    the last stored bar is requested again so a bar that was still forming gets overwritten
+    empty tables are left to the backfill, expired futures are never synced
+"""
+def planSync(conn, tablename, now=None):
+    now = pd.Timestamp.now(tz='US/Eastern').tz_localize(None) if now is None else pd.Timestamp(now)
+    symbol, lastTradeDate, interval = _parseTablename(tablename)
+    if lastTradeDate and lastTradeDate[:6] < now.strftime('%Y%m'):
+        return []
+
+    watermark = db.getLastRecordDate(conn, tablename)
+    if watermark is None:
+        return []
+
+    barSize = _toBarSize(interval)
+    requests = []
+    for i, (endDate, durationStr) in enumerate(planChunks(watermark, now, barSize)):
+        # the newest chunk ends at IBKR's 'now'
+        requests.append(fetcher.BarRequest(symbol, durationStr, barSize, endDate='' if i == 0 else endDate, lastTradeDate=lastTradeDate))
+    return requests
+
+"""
+Brings every ohlc table in the db (or just tablenames) up to date with IBKR
+    results are handed to a HistoryWriter as they arrive, which batches them per table on its own thread, 
+    so writes overlap with the requests still in flight and an interrupted sync keeps what was written 
+
+Params
+===========
+ibkr - connected ib_insync IB object
+dbname - [str] path to the sqlite db
+tablenames - [list] optional, only sync these tables
+maxInFlight - [int] concurrent requests
+"""
+def sync(ibkr, dbname=config.dbname_stock, tablenames=None, now=None, maxInFlight=6):
+    with db.HistoryWriter(dbname) as writer:
+        tableOf = {}
+
+        # runs on the fetcher's event loop, so it must not block on a full writer queue
+        async def _save(request, bars, error):
+            if bars is None or bars.empty:
+                return
+            await writer.putAsync(bars, tablename=tableOf[request])
+
+        historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxInFlight=maxInFlight, onResult=_save)
+        with db.sqlite_connection(dbname, readonly=True) as conn:
+            tablenames = tablenames or db._listOhlcTables(conn)
+            for tablename in tablenames:
+                for request in planSync(conn, tablename, now=now):
+                    tableOf[request] = tablename
+                    historicalFetcher.submit(request)
+
+        print('%s: [yellow]Syncing %s tables with %s requests...[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), len(tablenames), len(tableOf)))
+        results = historicalFetcher.run()
+    numBars = sum(len(bars) for bars in results.values() if bars is not None)
+    print('%s: [green]  Synced %s bars[/green]'%(datetime.datetime.now().strftime('%H:%M:%S'), numBars))
+    return results
+
+"""
+Returns the earliest date IBKR has for the contract behind request 
+    falls back to the records lookup table (firstRecordDate - numMissingBusinessDays) if the head timestamp request fails; 
+    ib_insync answers a failed request with [] rather than raising, so anything but a Timestamp counts as failed 
+"""
+def _getEarliestTimestamp(ibkr, conn, tablename, request):
+    try:
+        earliestTimestamp = ib.getEarliestTimeStamp(ibkr, request.contract)
+        if isinstance(earliestTimestamp, pd.Timestamp) and not pd.isnull(earliestTimestamp):
+            return earliestTimestamp
+        reason = 'empty answer'
+    except Exception as e:
+        reason = e
+    print('%s: [yellow]No head timestamp for %s (%s), using the lookup table[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), tablename, reason))
+    record = conn.execute('SELECT firstRecordDate, numMissingBusinessDays FROM \'00-lookup_symbolRecords\' WHERE name = ?', (tablename,)).fetchone()
+    if record is None or record[0] is None:
+        return None
+    return pd.Timestamp(record[0]) - pd.offsets.BDay(int(record[1] or 0))
+
+"""
+Returns [(BarRequest, chunkStart)] that backfill tablename from its frontier back to earliest, newest chunk first 
+    the frontier is the backfill checkpoint if one is stored, else the first stored bar (now for empty tables) 
+"""
+def planBackfill(conn, tablename, earliest, now=None):
+    now = pd.Timestamp.now(tz='US/Eastern').tz_localize(None) if now is None else pd.Timestamp(now)
+    symbol, lastTradeDate, interval = _parseTablename(tablename)
+    barSize = _toBarSize(interval)
+    
+    frontier = db.getBackfillCheckpoint(conn, tablename) or db.getFirstRecordDate(conn, tablename) or now
+    earliest = pd.Timestamp(earliest)
+    
+    chunks = []
+    for endDate, durationStr in planChunks(earliest, frontier, barSize):
+        request = fetcher.BarRequest(symbol, durationStr, barSize, endDate=endDate, lastTradeDate=lastTradeDate)
+        chunks.append((request, max(endDate - _durationOffset(durationStr), earliest)))
+    return chunks
+
+"""
+Backfills history for every ohlc table in the db (or tablenames) back to the earliest date IBKR has 
+    - chunks of every table run concurrently through the fetcher, newest chunks first 
+    - after each chunk the checkpoint advances over the contiguous run of finished chunks, 
+      so chunks that finish out of order or fail never leave a hole behind the checkpoint 
+      (it is held at the frontier until the newest chunk is in, older rows alone don't make the table's first date a resume point) 
+    - a chunk counts as finished once it returned bars or IBKR confirmed it has no data for it (e.g. holidays); 
+      chunks that errored (pacing, timeouts, permissions) are recorded as failed and stay pending, the next run fetches them again 
+    - chunks are written by a HistoryWriter, the checkpoint is stored in the same transaction as the chunk that completes it 
+
+Params
+===========
+ibkr - connected ib_insync IB object
+dbname - [str] path to the sqlite db
+tablenames - [list] optional, tables to backfill; tables that don't exist yet are created 
+earliest - [dict] optional, {tablename: earliest date} instead of asking IBKR 
+maxInFlight - [int] concurrent requests
+"""
+def backfill(ibkr, dbname=config.dbname_stock, tablenames=None, earliest=None, now=None, maxInFlight=6):
+    with db.HistoryWriter(dbname) as writer:
+        historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxInFlight=maxInFlight)
+        plans, chunkOf = {}, {}
+        
+        with db.sqlite_connection(dbname, readonly=True) as conn:
+            tablenames = tablenames or db._listOhlcTables(conn)
+            for tablename in tablenames:
+                symbol, lastTradeDate, interval = _parseTablename(tablename)
+                earliestTimestamp = (earliest or {}).get(tablename)
+                if earliestTimestamp is None:
+                    earliestTimestamp = _getEarliestTimestamp(ibkr, conn, tablename, fetcher.BarRequest(symbol, '1 D', _toBarSize(interval), lastTradeDate=lastTradeDate))
+                if earliestTimestamp is None:
+                    continue
+                
+                chunks = planBackfill(conn, tablename, earliestTimestamp, now=now)
+                plans[tablename] = {'chunks': chunks, 'done': set(), 'failed': set(), 'next': 0, 'earliest': earliestTimestamp}
+                for i, (request, _) in enumerate(chunks):
+                    chunkOf[request] = (tablename, i)
+                    historicalFetcher.submit(request, priority=i)
+        
+        async def _save(request, bars, error):
+            tablename, i = chunkOf[request]
+            plan = plans[tablename]
+            if bars is None or error is not None:
+                plan['failed'].add(i)
+                return # the checkpoint stops before this chunk and the next run resumes from it
+            
+            plan['done'].add(i)
+            while plan['next'] in plan['done']:
+                plan['next'] += 1
+            # until the newest chunk is in, pin the checkpoint at the frontier so older chunks written first don't move it
+            checkpoint = plan['chunks'][plan['next'] - 1][1] if plan['next'] else plan['chunks'][0][0].endDate
+            afterWrite = lambda conn: db.setBackfillCheckpoint(conn, tablename, checkpoint, earliestTimestamp=plan['earliest'])
+            await writer.putAsync(bars, tablename=tablename, afterWrite=afterWrite)
+        
+        historicalFetcher.onResult = _save
+        print('%s: [yellow]Backfilling %s tables with %s requests...[/yellow]'%(datetime.datetime.now().strftime('%H:%M:%S'), len(plans), len(chunkOf)))
+        results = historicalFetcher.run()
+    
+    with db.sqlite_connection(dbname, readonly=True) as conn:
+        for tablename, plan in plans.items():
+            status = 'complete' if plan['next'] == len(plan['chunks']) else 'stopped at %s, re-run to resume'%(db.getBackfillCheckpoint(conn, tablename))
+            failed = ', %s chunks failed'%(len(plan['failed'])) if plan['failed'] else ''
+            print('%s:   %s: %s/%s chunks%s, %s'%(datetime.datetime.now().strftime('%H:%M:%S'), tablename, plan['next'], len(plan['chunks']), failed, status))
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Sync or backfill the local db from IBKR')
+    parser.add_argument('command', choices=['sync', 'backfill'])
+    parser.add_argument('--db', default=config.dbname_stock, help='path to the sqlite db')
+    parser.add_argument('--table', nargs='*', default=None, help='only sync these tables')
+    args = parser.parse_args()
+
+    ibkr = ib.setupConnection()
+    if ibkr is None:
+        sys.exit('Could not connect with IBKR')
+    if args.command == 'sync':
+        sync(ibkr, dbname=args.db, tablenames=args.table)
+    elif args.command == 'backfill':
+        backfill(ibkr, dbname=args.db, tablenames=args.table)
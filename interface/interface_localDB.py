@@ -8,12 +8,27 @@ This module simplifies interacting with the local database of historical ohlc da
     - save historical data to local db 
     - retrieve historical data for symbol and interval 
     - automatically clears duplicates if any
+    - caches formatted px history as columnar .npy files for fast repeat loads
+    - pools connections: per-thread read-only readers, one serialized writer per db (WAL mode)
+    - resamples coarser intervals (e.g. 15mins, 2hour, 1day) on demand from the finest stored bars
+    - materializes derived columns (returns, true range, session, business day) in a side table on write
 
 """
 
+import asyncio
+import atexit
+import hashlib
+import json
+import functools
+import os
+import queue
+import re
 import sqlite3
 import sys
+import threading
 import config
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 sys.path.append('..')
 from utils import utils as ut
@@ -25,19 +40,146 @@ dbname_index = config.dbname_stock
 
 index_list = config._indexList # global reference list of index symbols, this is some janky ass shit .... 
 
-""" implements contextmanager for db connection """
+dir_pxHistoryCache = config.dir_pxHistoryCache
+
+""" Connection pool """
+_pool_lock = threading.Lock()
+_pool_readers = threading.local()   # per thread {db_name: read-only connection}
+_pool_writers = {}                  # {db_name: (connection, lock)}
+_pool_all = []                      # every pooled connection, closed at exit
+_pool_readerThreads = {}            # {read-only connection: thread that opened it}
+_pool_executors = {}                # {max workers: ThreadPoolExecutor} shared by getPriceHistories
+_pool_walEnabled = set()
+
+# pragmas for read-only connections: 64MB page cache, 256MB memory map
+_readPragmas = ['PRAGMA query_only = ON', 'PRAGMA cache_size = -65536', 'PRAGMA mmap_size = 268435456', 'PRAGMA temp_store = MEMORY']
+
+"""
+Switches the db to WAL journaling (persistent) so readers don't block on, or get blocked by, a writer 
+"""
+def _enableWal(db_name):
+    with _pool_lock:
+        if db_name in _pool_walEnabled:
+            return
+        _pool_walEnabled.add(db_name)
+    try:
+        conn = sqlite3.connect(db_name)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.close()
+    except sqlite3.OperationalError as e:
+        print('Could not enable WAL on %s: %s'%(db_name, e))
+
+"""
+Closes the read-only connections of threads that have exited, call with _pool_lock held 
+    threading.local drops their dict but _pool_all would keep the connections (and their fds) open until exit 
+"""
+def _reapReadConnections():
+    for conn, thread in list(_pool_readerThreads.items()):
+        if not thread.is_alive():
+            del _pool_readerThreads[conn]
+            _pool_all.remove(conn)
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+"""
+Returns this thread's pooled read-only connection to db_name
+"""
+def _getReadConnection(db_name):
+    connections = getattr(_pool_readers, 'connections', None)
+    if connections is None:
+        connections = _pool_readers.connections = {}
+    
+    if db_name not in connections:
+        _enableWal(db_name)
+        conn = sqlite3.connect('file:%s?mode=ro'%(os.path.abspath(db_name)), uri=True, check_same_thread=False)
+        for pragma in _readPragmas:
+            conn.execute(pragma)
+        connections[db_name] = conn
+        with _pool_lock:
+            _reapReadConnections()
+            _pool_all.append(conn)
+            _pool_readerThreads[conn] = threading.current_thread()
+    
+    return connections[db_name]
+
+"""
+Returns the pooled writer connection to db_name, and the lock that serializes its use across threads 
+"""
+def _getWriteConnection(db_name):
+    with _pool_lock:
+        if db_name not in _pool_writers:
+            conn = sqlite3.connect(db_name, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            _pool_writers[db_name] = (conn, threading.RLock())
+            _pool_walEnabled.add(db_name)
+            _pool_all.append(conn)
+        return _pool_writers[db_name]
+
+"""
+Returns the long-lived loader pool for getPriceHistories 
+    its threads, and so their pooled read-only connections, are reused across calls instead of opened per call 
+"""
+def _getLoadExecutor(maxWorkers):
+    with _pool_lock:
+        if maxWorkers not in _pool_executors:
+            _pool_executors[maxWorkers] = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='pxHistoryLoader')
+        return _pool_executors[maxWorkers]
+
+"""
+Closes every pooled connection and shuts down the loader pools, registered to run at exit 
+"""
+def closeConnections():
+    with _pool_lock:
+        executors = list(_pool_executors.values())
+        _pool_executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+    
+    with _pool_lock:
+        for conn in _pool_all:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        _pool_all.clear()
+        _pool_readerThreads.clear()
+        _pool_writers.clear()
+    _pool_readers.connections = {}
+
+atexit.register(closeConnections)
+
+""" 
+implements contextmanager for db connection 
+    readonly=True hands out this thread's pooled read-only connection, nothing is committed 
+    readonly=False hands out the db's single pooled writer; commits on success, rolls back on error 
+"""
 class sqlite_connection(object): 
     
-    def __init__(self, db_name):
+    def __init__(self, db_name, readonly=False):
         self.db_name = db_name
+        self.readonly = readonly
     
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_name)
+        if self.readonly:
+            self.conn = _getReadConnection(self.db_name)
+        else:
+            self.conn, self.lock = _getWriteConnection(self.db_name)
+            self.lock.acquire()
         return self.conn
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.conn.commit()
-        self.conn.close()
+        if self.readonly:
+            return
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.lock.release()
 
 """
 Establishes a connection to the appropriate DB based on type of symbol passed in. 
@@ -69,23 +211,127 @@ def _constructTableName(symbol, interval):
 
 """
 utility - permanently remove duplicate records from ohlc table
+    full table scan, only needed once per table before the unique date index is added 
 
 Params
 ==========
+conn - [sqlite3 connection]
 tablename - [str]
 """
-def _removeDuplicates(tablename):
-    conn = _connectToDb() # connect to DB
-
+def _removeDuplicates(conn, tablename):
     ## construct SQL qeury that will group on 'date' column and
     ## select the min row ID of each group; then delete all the ROWIDs from 
     ## the table that not in this list
-    sql_selectMinId = 'DELETE FROM %s WHERE ROWID NOT IN (SELECT MIN(ROWID) FROM %s GROUP BY date)'%(tablename, tablename)
+    sql_selectMinId = 'DELETE FROM "%s" WHERE ROWID NOT IN (SELECT MIN(ROWID) FROM "%s" GROUP BY date)'%(tablename, tablename)
 
     ## run the query 
     cursor = conn.cursor()
     cursor.execute(sql_selectMinId)
 
+"""
+Returns True if tablename exists in the db 
+"""
+def _tableExists(conn, tablename):
+    return conn.execute('SELECT 1 FROM sqlite_master WHERE type = \'table\' AND name = ?', (tablename,)).fetchone() is not None
+
+"""
+Returns list of ohlc tablenames in the db, i.e. everything except the lookup tables 
+"""
+def _listOhlcTables(conn):
+    tables = conn.execute('SELECT name FROM sqlite_master WHERE type = \'table\' ORDER BY name').fetchall()
+    return [table[0] for table in tables if not table[0].startswith('00-') and not table[0].endswith('__derived')]
+
+"""
+Returns the layout of an ohlc table 
+    1: text dates, REAL/TEXT columns, symbol and interval repeated on every row 
+    2: INTEGER PRIMARY KEY epoch-second dates, REAL ohlc, INTEGER volume; symbol and interval live in the lookup table 
+"""
+def _getTableLayout(conn, tablename):
+    for col in conn.execute('PRAGMA table_info("%s")'%(tablename)).fetchall():
+        # table_info: cid, name, type, notnull, dflt_value, pk
+        if col[1] == 'date':
+            return 2 if col[2].upper() == 'INTEGER' else 1
+    return 1
+
+"""
+Creates an empty ohlc table in the v2 layout 
+    date is the rowid, so it is unique and ordered without a separate index 
+"""
+def _createTableV2(conn, tablename):
+    conn.execute('CREATE TABLE "%s" (date INTEGER PRIMARY KEY, open REAL, high REAL, low REAL, close REAL, volume INTEGER)'%(tablename))
+
+"""
+Returns symbol, interval parsed from an ohlc tablename, e.g. VIX_index_1day or VX_202408_1day 
+"""
+def _parseTableName(tablename):
+    parts = tablename.split('_')
+    return parts[0], parts[-1]
+
+"""
+Converts dates to the key stored in the table: epoch seconds for v2, 'YYYY-MM-DD HH:MM:SS' text for v1 
+"""
+def _toDateKey(dates, layout):
+    if layout == 2:
+        if np.isscalar(dates) or isinstance(dates, (str, pd.Timestamp)):
+            return int(pd.Timestamp(dates).value // 10**9)
+        return pd.to_datetime(dates).to_numpy(dtype='datetime64[s]').astype('int64')
+    if np.isscalar(dates) or isinstance(dates, (str, pd.Timestamp)):
+        return pd.Timestamp(dates).strftime('%Y-%m-%d %H:%M:%S')
+    return pd.to_datetime(dates).dt.strftime('%Y-%m-%d %H:%M:%S')
+
+"""
+Converts stored date keys back to tz-naive datetimes, the inverse of _toDateKey 
+    v1 text may carry a timezone suffix, which is dropped the same way _formatpxHistory does 
+"""
+def _fromDateKey(keys, layout):
+    if layout == 2:
+        return pd.to_datetime(keys, unit='s')
+    return pd.to_datetime(pd.Series(keys).astype(str).str[:19], format='ISO8601')
+
+"""
+Bumps the version counter of a table, part of the data-version stamp used by the px history cache 
+    upserts can rewrite existing rows without changing max rowid or row count 
+"""
+def _bumpTableVersion(conn, tablename):
+    conn.execute('CREATE TABLE IF NOT EXISTS \'00-lookup_tableVersions\' (name TEXT PRIMARY KEY, version INTEGER)')
+    conn.execute('INSERT INTO \'00-lookup_tableVersions\' (name, version) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET version = version + 1', (tablename,))
+
+"""
+Writes history into tablename as a bulk upsert on date 
+    new dates are inserted, existing dates are overwritten with the latest values (e.g. a bar that was still forming) 
+    creates the table and its unique date index on first write 
+"""
+def _upsertHistory(conn, tablename, history):
+    if not _tableExists(conn, tablename):
+        if config.ohlc_schemaVersion == 2:
+            _createTableV2(conn, tablename)
+        else:
+            history.head(0).to_sql(f"{tablename}", conn, index=False)
+    layout = _getTableLayout(conn, tablename)
+    
+    history = history.copy()
+    if layout == 2:
+        # symbol and interval are implied by the table, only typed ohlcv is stored
+        history = history[[col for col in ['date', 'open', 'high', 'low', 'close', 'volume'] if col in history.columns]]
+        history['date'] = _toDateKey(history['date'], layout)
+    else:
+        _createDateIndex(conn, tablename)
+        # match the text format pandas.to_sql uses for dates 
+        if pd.api.types.is_datetime64_any_dtype(history['date']):
+            history['date'] = _toDateKey(history['date'], layout)
+    
+    columns = list(history.columns)
+    # object dtype turns numpy scalars into python types sqlite can bind, and NaN into NULL
+    records = zip(*[history[col].astype(object).where(history[col].notna(), None).tolist() for col in columns])
+    
+    sql_upsert = 'INSERT INTO "%s" (%s) VALUES (%s) ON CONFLICT(date) DO UPDATE SET %s'%(
+        tablename, 
+        ', '.join('"%s"'%(col) for col in columns), 
+        ', '.join(['?']*len(columns)), 
+        ', '.join('"%s" = excluded."%s"'%(col, col) for col in columns if col != 'date'))
+    conn.executemany(sql_upsert, records)
+    _bumpTableVersion(conn, tablename)
+
 """
 sub to update the symbol record lookup table
 This should be called when local db records are updated 
@@ -100,8 +346,14 @@ def _updateLookup_symbolRecords(conn, tablename, earliestTimestamp, numMissingDa
     lookupTablename = '00-lookup_symbolRecords'
     
     ## get the earliest record date saved for the target symbol 
-    sql_minDate_symbolHistory = 'SELECT MIN(date), symbol, interval FROM %s'%(tablename)
-    minDate_symbolHistory = pd.read_sql(sql_minDate_symbolHistory, conn)
+    if _getTableLayout(conn, tablename) == 2:
+        # v2 tables keep symbol and interval out of the rows, lookup dates stay as text
+        symbol, interval = _parseTableName(tablename)
+        minDate = conn.execute('SELECT MIN(date) FROM "%s"'%(tablename)).fetchone()[0]
+        minDate_symbolHistory = pd.DataFrame({'MIN(date)': [pd.Timestamp(minDate, unit='s').strftime('%Y-%m-%d %H:%M:%S')], 'symbol': [symbol], 'interval': [interval]})
+    else:
+        sql_minDate_symbolHistory = 'SELECT MIN(date), symbol, interval FROM %s'%(tablename)
+        minDate_symbolHistory = pd.read_sql(sql_minDate_symbolHistory, conn)
     
     ## get the earliest date from the lookup table for the matching symbol 
     sql_minDate_recordsTable = 'SELECT firstRecordDate FROM \'%s\' WHERE symbol = \'%s\' and interval = \'%s\''%(lookupTablename, minDate_symbolHistory['symbol'][0], minDate_symbolHistory['interval'][0])
@@ -135,44 +387,521 @@ def _updateLookup_symbolRecords(conn, tablename, earliestTimestamp, numMissingDa
         cursor = conn.cursor()
         cursor.execute(sql_update)
 
-def __remove_timezone_from_datestring(datestring):
-    """
-        lambda function: Remove timezone info from datestring
-    """    
-    if len(datestring) > 19:
-        return datestring[:19]
+""" 
+ensures proper format of px history tables retrieved from db 
+    dates are parsed once, vectorized: the timezone suffix is sliced off (v1) or epoch seconds are 
+    converted (v2), duplicates are dropped (keeping the first stored row) and rows are sorted on the 
+    int64 nanosecond values 
+"""
+def _formatpxHistory(pxHistory, interval=None, layout=1):
+    
+    pxHistory.reset_index(drop=True, inplace=True)
+    if interval is None:
+        interval = pxHistory['interval'].iloc[0]
+    
+    ## Remove unnecessary info in the date string and format to datetime type
+    if layout == 2:
+        dates = pd.to_datetime(pxHistory['date'].to_numpy(dtype='int64'), unit='s')
+    elif interval == '1day':
+        dates = pd.to_datetime(pxHistory['date'].str[:10], format='%Y-%m-%d', cache=True)
     else:
-        return datestring
+        dates = pd.to_datetime(pxHistory['date'].str[:19], format='%Y-%m-%d %H:%M:%S', cache=True)
+    dates = dates.to_numpy(dtype='datetime64[ns]')
+    
+    # stable sort keeps the first stored row at the head of each run of duplicates
+    dates_ns = dates.view('int64')
+    order = np.argsort(dates_ns, kind='stable')
+    isFirst = np.empty(len(order), dtype=bool)
+    isFirst[:1] = True
+    isFirst[1:] = dates_ns[order[1:]] != dates_ns[order[:-1]]
+    order = order[isFirst]
 
-""" ensures proper format of px history tables retrieved from db """
-def _formatpxHistory(pxHistory):
+    pxHistory = pxHistory.iloc[order]
+    pxHistory['date'] = dates[order]
+
+    return pxHistory
+
+"""
+Returns the data-version stamp of a table: [max rowid, table version]
+Appends move max rowid, and every upsert, dedup or date rewrite in this module bumps the version, 
+either invalidates cached copies. Both are seeks, so stamping doesn't scan the table on every load 
+"""
+def _getTableStamp(conn, tablename):
+    maxRowid = conn.execute('SELECT MAX(ROWID) FROM "%s"'%(tablename)).fetchone()[0]
+    try:
+        version = conn.execute('SELECT version FROM \'00-lookup_tableVersions\' WHERE name = ?', (tablename,)).fetchone()
+    except sqlite3.OperationalError:
+        version = None # no table has been saved through _upsertHistory yet
+    return [maxRowid, version[0] if version else 0]
+
+"""
+Returns the path of the db file a connection points to, '' for in-memory dbs 
+"""
+def _getDbFilename(conn):
+    return conn.execute('PRAGMA database_list').fetchone()[2]
+
+"""
+Returns the cache directory for a table, namespaced by the db file the connection points to 
+    keyed on a hash of the absolute path so dbs with the same filename in different directories don't share a cache; 
+    None for in-memory dbs, which aren't cached 
+"""
+def _getCachePath(conn, tablename):
+    dbfile = _getDbFilename(conn)
+    if not dbfile:
+        return None
+    dbfile = os.path.realpath(dbfile)
+    dbname = '%s-%s'%(os.path.splitext(os.path.basename(dbfile))[0], hashlib.sha1(dbfile.encode()).hexdigest()[:12])
+    return os.path.join(dir_pxHistoryCache, dbname, tablename)
+
+"""
+Returns cached px history for tablename if the cache matches stamp, otherwise None 
+    Columns are memory mapped from .npy files so no text parsing happens on a hit. 
+    Filters are applied to the mapped arrays so only the requested slice is copied. 
+"""
+def _readCachedHistory(conn, tablename, stamp, start=None, end=None, last_n=0, columns=None):
+    cachePath = _getCachePath(conn, tablename)
+    if cachePath is None:
+        return None
+    try:
+        with open(os.path.join(cachePath, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        if meta['stamp'] != stamp:
+            return None
+        
+        columns = _selectColumns(meta['columns'], columns)
+        mapped = {}
+        for col in columns:
+            mapped[col] = np.load(os.path.join(cachePath, '%s.npy'%(col)), mmap_mode='r')
+            # a concurrent writer may have replaced some columns already 
+            if len(mapped[col]) != meta['rows']:
+                return None
+    except (OSError, ValueError, KeyError):
+        return None
     
-    pxHistory.reset_index(drop=True, inplace=True)
+    # cached history is sorted by date so bounds are a binary search 
+    first, last = 0, meta['rows']
+    if start is not None:
+        first = np.searchsorted(mapped['date'], np.datetime64(pd.Timestamp(start), 'ns'), side='left')
+    if end is not None:
+        last = np.searchsorted(mapped['date'], np.datetime64(pd.Timestamp(end), 'ns'), side='right')
+    if last_n:
+        first = max(first, last - last_n)
     
-    ## Remove unnecessary info in the date string
-    if pxHistory['interval'][1] == '1day':
-        pxHistory['date'] = pxHistory['date'].str[:10] # remove milliseconds
+    return pd.DataFrame({col: mapped[col][first:last] for col in columns}, columns=columns)
+
+"""
+Writes formatted px history to the columnar cache
+    numeric and datetime columns are stored as typed arrays, everything else as fixed width strings 
+"""
+def _writeCachedHistory(conn, tablename, stamp, pxHistory):
+    cachePath = _getCachePath(conn, tablename)
+    if cachePath is None:
+        return
+    try:
+        os.makedirs(cachePath, exist_ok=True)
+        for col in pxHistory.columns:
+            values = pxHistory[col].to_numpy()
+            if values.dtype == object:
+                values = values.astype(str)
+            tmpfile = os.path.join(cachePath, '%s.npy.%s'%(col, os.getpid()))
+            with open(tmpfile, 'wb') as f:
+                np.save(f, values, allow_pickle=False)
+            os.replace(tmpfile, os.path.join(cachePath, '%s.npy'%(col)))
+        
+        # meta is written last so readers never see a stamp without its columns 
+        meta = {'stamp': stamp, 'rows': len(pxHistory), 'columns': [str(col) for col in pxHistory.columns]}
+        tmpfile = os.path.join(cachePath, 'meta.json.%s'%(os.getpid()))
+        with open(tmpfile, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmpfile, os.path.join(cachePath, 'meta.json'))
+    except OSError as e:
+        # caching is best effort, never fail a load because of it 
+        print('Could not cache %s: %s'%(tablename, e))
+
+"""
+Returns the requested columns in table order, date is always included 
+"""
+def _selectColumns(tableColumns, columns=None):
+    if not columns:
+        return list(tableColumns)
+    return [col for col in tableColumns if col == 'date' or col in columns]
+
+"""
+Returns True if tablename already has a UNIQUE index on date 
+"""
+def _hasUniqueDateIndex(conn, tablename):
+    for index in conn.execute('PRAGMA index_list("%s")'%(tablename)).fetchall():
+        # index_list: seq, name, unique, origin, partial
+        if index[2]:
+            indexColumns = [col[2] for col in conn.execute('PRAGMA index_info("%s")'%(index[1])).fetchall()]
+            if indexColumns == ['date']:
+                return True
+    return False
+
+"""
+Rewrites v1 text dates to the 'YYYY-MM-DD HH:MM:SS' key that _toDateKey writes 
+    older rows may carry a timezone suffix ('2024-01-02 00:00:00-05:00'), a 'T' separator or no time at all; 
+    left as is they never conflict with new writes of the same bar, so upserts on date would insert duplicates. 
+    the suffix is dropped the same way _fromDateKey does; where two rows land on the same key the latest write is kept 
+"""
+_canonicalDateKey = "CASE WHEN length(date) = 10 THEN date || ' 00:00:00' ELSE replace(substr(date, 1, 19), 'T', ' ') END"
+_isCanonicalDateKey = "(typeof(date) <> 'text' OR (length(date) = 19 AND substr(date, 11, 1) = ' '))"
+
+def _canonicalizeDates(conn, tablename):
+    if conn.execute('SELECT 1 FROM "%s" WHERE NOT %s LIMIT 1'%(tablename, _isCanonicalDateKey)).fetchone() is None:
+        return 0
+    conn.execute('DELETE FROM "%s" WHERE ROWID NOT IN (SELECT MAX(ROWID) FROM "%s" GROUP BY %s)'%(tablename, tablename, _canonicalDateKey))
+    numRewritten = conn.execute('UPDATE "%s" SET date = %s WHERE NOT %s'%(tablename, _canonicalDateKey, _isCanonicalDateKey)).rowcount
+    _bumpTableVersion(conn, tablename)
+    # derived rows are keyed on the old text dates
+    if _tableExists(conn, _derivedTablename(tablename)):
+        conn.execute('DROP TABLE "%s"'%(_derivedTablename(tablename)))
+        _updateDerived(conn, tablename)
+    return numRewritten
+
+"""
+Adds a UNIQUE index on the date column of an ohlc table 
+    lets range and last_n reads seek instead of scan, and lets writes upsert on date 
+    dates are canonicalized and existing duplicates removed first; this is a one time full scan per table 
+"""
+def _createDateIndex(conn, tablename):
+    if _hasUniqueDateIndex(conn, tablename):
+        return
+    _canonicalizeDates(conn, tablename)
+    _removeDuplicates(conn, tablename)
+    _bumpTableVersion(conn, tablename)
+    conn.execute('DROP INDEX IF EXISTS "%s_date_idx"'%(tablename)) # superseded non-unique index
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS "%s_date_uidx" ON "%s" (date)'%(tablename, tablename))
+
+"""
+Returns the SELECT statement and params that push date range, last_n, and column filters down to sqlite
+    v1 dates are stored as 'YYYY-MM-DD HH:MM:SS[tz]' text so bounds compare lexically, v2 bounds are epoch seconds 
+"""
+def _constructSelectStatement(conn, tablename, start=None, end=None, last_n=0, columns=None, layout=1):
+    if columns:
+        tableColumns = [col[1] for col in conn.execute('PRAGMA table_info("%s")'%(tablename)).fetchall()]
+        selectColumns = ', '.join('"%s"'%(col) for col in _selectColumns(tableColumns, columns))
+    else:
+        selectColumns = '*'
     
-    else: 
-        pxHistory['formatted_date'] = pxHistory['date'].apply(__remove_timezone_from_datestring)
-        pxHistory.drop(columns=['date'], inplace=True)
-        pxHistory.rename(columns={'formatted_date':'date'}, inplace=True)
-
-    pxHistory = pxHistory[~pxHistory['date'].duplicated()]
-   
-    # format to datetime type 
-    if pxHistory['interval'][1] == '1day':
-        pxHistory.loc[:,'date'] = pd.to_datetime(pxHistory['date'], format='%Y-%m-%d')
+    where = []
+    params = []
+    if start is not None:
+        where.append('date >= ?')
+        params.append(_toDateKey(start, layout))
+    if end is not None:
+        # end is inclusive, +1s keeps v1 rows that carry a timezone suffix 
+        where.append('date < ?')
+        params.append(_toDateKey(pd.Timestamp(end) + pd.Timedelta(seconds=1), layout))
+    
+    sqlStatement = 'SELECT %s FROM "%s"'%(selectColumns, tablename)
+    if where:
+        sqlStatement += ' WHERE ' + ' AND '.join(where)
+    if last_n:
+        sqlStatement = 'SELECT * FROM (%s ORDER BY date DESC LIMIT %d) ORDER BY date ASC'%(sqlStatement, int(last_n))
+    
+    return sqlStatement, params
+
+""" Resampling """
+_intervalUnits = {'min': 60, 'mins': 60, 'hour': 3600, 'hours': 3600, 'day': 86400}
+
+"""
+Returns the length of a db interval in seconds, e.g. 5mins -> 300, 2hour -> 7200, 1day -> 86400 
+    raises ValueError for intervals that can't be resampled to 
+"""
+def _parseInterval(interval):
+    match = re.fullmatch(r'(\d+)\s*([a-z]+)', str(interval).strip().lower())
+    if not match or match.group(2) not in _intervalUnits:
+        raise ValueError('Unsupported interval: %s'%(interval))
+    seconds = int(match.group(1)) * _intervalUnits[match.group(2)]
+    if seconds == 0 or seconds > 86400: # bins never span more than a day
+        raise ValueError('Unsupported interval: %s'%(interval))
+    return seconds
+
+"""
+Returns (tablename, interval) of the finest stored table the target interval can be built from, (None, None) if there is none 
+    candidates share the target's symbol and type/expiry, e.g. VIX_index_1min for VIX_index_15mins 
+"""
+def _findBaseTable(conn, tablename, interval):
+    try:
+        targetSeconds = _parseInterval(interval)
+    except ValueError:
+        return None, None
+    
+    prefix = tablename.rsplit('_', 1)[0] + '_'
+    candidates = conn.execute('SELECT name FROM sqlite_master WHERE type = \'table\' AND substr(name, 1, ?) = ?', (len(prefix), prefix)).fetchall()
+    
+    baseTablename, baseInterval, baseSeconds = None, None, None
+    for (name,) in candidates:
+        candidateInterval = name[len(prefix):]
+        try:
+            seconds = _parseInterval(candidateInterval)
+        except ValueError:
+            continue # not an ohlc table for this symbol, e.g. a side table 
+        # bins never straddle a day, so any intraday base builds a 1day bar 
+        if seconds < targetSeconds and (targetSeconds % seconds == 0 or targetSeconds == 86400):
+            if baseSeconds is None or seconds < baseSeconds:
+                baseTablename, baseInterval, baseSeconds = name, candidateInterval, seconds
+    
+    return baseTablename, baseInterval
+
+"""
+Returns a session open, e.g. '18:00' or a Timedelta, as an offset from midnight 
+"""
+def _toSessionOffset(sessionStart):
+    if isinstance(sessionStart, str):
+        sessionStart = pd.Timestamp(sessionStart) - pd.Timestamp(sessionStart).normalize()
+    return pd.Timedelta(sessionStart)
+
+"""
+Returns the session open of symbol from config.session_start as an offset from midnight, None for midnight sessions 
+"""
+def _getSessionStart(symbol):
+    sessionStart = config.session_start.get(symbol)
+    return _toSessionOffset(sessionStart) if sessionStart else None
+
+"""
+Returns px history resampled to a coarser interval 
+    - bins are aligned to the session open (midnight by default) and never cross a session, so sessions are never merged 
+    - open = first, high = max, low = min, close = last, volume = sum; bars are labelled with the bin start 
+    - 1day bars are labelled with the session's date at midnight, same as the 1day tables; 
+      a session that opens after noon (e.g. 18:00 for Globex) belongs to the next day's date 
+    - pxHistory must be sorted by date, as returned by getPriceHistory 
+
+Params
+===========
+pxHistory - [DataFrame] with date, open, high, low, close, volume columns
+interval - [str] target interval, e.g. 15mins, 2hour, 1day 
+sessionStart - [str|Timedelta] optional, time the session opens e.g. '18:00'; see config.session_start 
+"""
+def resamplePriceHistory(pxHistory, interval, sessionStart=None):
+    width = np.int64(_parseInterval(interval)) * 1_000_000_000
+    day = np.int64(86400) * 1_000_000_000
+    offset = np.int64(_toSessionOffset(sessionStart).value) % day if sessionStart is not None else np.int64(0)
+    
+    dates = pxHistory['date'].to_numpy(dtype='datetime64[ns]').view('int64')
+    dayStart = (dates - offset) // day * day + offset
+    binStart = dayStart + (dates - dayStart) // width * width
+    
+    # data is sorted, so each bin is a contiguous run 
+    first = np.flatnonzero(np.diff(binStart, prepend=binStart[:1] - 1))
+    last = np.append(first[1:], len(dates)) - 1
+    
+    labels = binStart[first]
+    if width == day and offset:
+        # label sessions with their date 
+        labels = (labels + (day if offset >= day // 2 else 0)) // day * day
+    resampled = {'date': labels.view('datetime64[ns]')}
+    if len(dates):
+        for col, reduce in (('open', None), ('high', np.maximum), ('low', np.minimum), ('close', None), ('volume', np.add), ('barCount', np.add)):
+            if col not in pxHistory.columns:
+                continue
+            values = pxHistory[col].to_numpy()
+            if col == 'open':
+                resampled[col] = values[first]
+            elif col == 'close':
+                resampled[col] = values[last]
+            else:
+                resampled[col] = reduce.reduceat(values, first)
+    
+    resampled = pd.DataFrame(resampled)
+    for col in ('symbol', 'interval'):
+        if col in pxHistory.columns:
+            resampled[col] = pxHistory[col].iloc[0] if len(pxHistory) else None
+    if 'interval' in resampled.columns:
+        resampled['interval'] = interval
+    
+    return resampled
+
+"""
+Returns formatted px history for an interval that isn't stored, resampled from the finest stored base table 
+    resampled history is cached under <base>@<interval> with the base table's stamp, 
+    so appending to the base invalidates it 
+"""
+def _loadResampledHistory(conn, tablename, interval, baseTablename, baseInterval, start=None, end=None, last_n=0, columns=None, useCache=config.use_pxHistoryCache):
+    sessionStart = _getSessionStart(_parseTableName(baseTablename)[0])
+    cacheKey = '%s@%s'%(baseTablename, interval)
+    if sessionStart is not None:
+        cacheKey += '@%02d%02d'%(sessionStart.components.hours, sessionStart.components.minutes)
+    if useCache:
+        stamp = _getTableStamp(conn, baseTablename)
+        pxHistory = _readCachedHistory(conn, cacheKey, stamp, start=start, end=end, last_n=last_n, columns=columns)
+        if pxHistory is not None:
+            return pxHistory
+        # resample the whole table once, later reads are cache slices 
+        baseHistory = _loadpxHistory(conn, baseTablename, baseInterval, useCache=useCache)
     else:
-        pxHistory.loc[:,'date'] = pd.to_datetime(pxHistory['date'], format='%Y-%m-%d %H:%M:%S')
+        # widen bounds to whole days so the first and last bins are complete, a day more either side for sessions that span midnight 
+        margin = pd.Timedelta(days=1) if sessionStart is not None else pd.Timedelta(0)
+        baseStart = pd.Timestamp(start).normalize() - margin if start is not None else None
+        baseEnd = pd.Timestamp(end).normalize() + margin + pd.Timedelta(days=1) - pd.Timedelta(seconds=1) if end is not None else None
+        baseHistory = _loadpxHistory(conn, baseTablename, baseInterval, start=baseStart, end=baseEnd, useCache=useCache)
+    
+    pxHistory = resamplePriceHistory(baseHistory, interval, sessionStart=sessionStart)
+    if useCache:
+        _writeCachedHistory(conn, cacheKey, stamp, pxHistory)
+    
+    if start is not None:
+        pxHistory = pxHistory[pxHistory['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        pxHistory = pxHistory[pxHistory['date'] <= pd.Timestamp(end)]
+    if last_n:
+        pxHistory = pxHistory.tail(last_n)
+    if columns:
+        pxHistory = pxHistory[_selectColumns(pxHistory.columns, columns)]
+    
+    return pxHistory.reset_index(drop=True)
+
+"""
+Returns formatted px history for tablename, served from the columnar cache when it is up to date
+    Filtered reads are sliced from the cache on a hit, and pushed down to sqlite on a miss 
+"""
+def _loadpxHistory(conn, tablename, interval, start=None, end=None, last_n=0, columns=None, useCache=config.use_pxHistoryCache):
+    # intervals that aren't stored are built from finer bars when possible 
+    if not _tableExists(conn, tablename):
+        baseTablename, baseInterval = _findBaseTable(conn, tablename, interval)
+        if baseTablename:
+            return _loadResampledHistory(conn, tablename, interval, baseTablename, baseInterval, start=start, end=end, last_n=last_n, columns=columns, useCache=useCache)
+    
+    isFiltered = (start is not None) or (end is not None) or last_n or columns
+    if useCache:
+        stamp = _getTableStamp(conn, tablename)
+        pxHistory = _readCachedHistory(conn, tablename, stamp, start=start, end=end, last_n=last_n, columns=columns)
+        if pxHistory is not None:
+            return pxHistory
+
+    # v1 tables seek on the unique date index once migrateUniqueDateIndex or a write has added it, until then the range is a scan; 
+    # reads never migrate, that would dedup and rewrite rows behind the caller's back 
+    layout = _getTableLayout(conn, tablename)
+    sqlStatement, params = _constructSelectStatement(conn, tablename, start=start, end=end, last_n=last_n, columns=columns, layout=layout)
+    pxHistory = pd.read_sql(sqlStatement, conn, params=params)
+    pxHistory = _formatpxHistory(pxHistory, interval, layout=layout)
+    if layout == 2 and not columns:
+        # restore the per-row columns v1 readers expect
+        symbol, _ = _parseTableName(tablename)
+        pxHistory['symbol'] = symbol
+        pxHistory['interval'] = interval
     
-    # make sure date is datetime type
-    # pxHistory.loc[:,'date'] = pd.to_datetime(pxHistory.loc[:,'date'])
-    pxHistory['date'] = pd.to_datetime(pxHistory['date'])
+    # only complete tables are cached 
+    if useCache and not isFiltered:
+        _writeCachedHistory(conn, tablename, stamp, pxHistory)
+    
+    return pxHistory
+
+""" Derived columns """
+_derivedColumns = ['close_logReturn', 'pctChange', 'trueRange', 'sessionId', 'businessDayOfMonth']
+
+"""
+Returns the name of the side table holding derived columns for an ohlc table 
+"""
+def _derivedTablename(tablename):
+    return '%s__derived'%(tablename)
 
-    # final formatting
-    pxHistory = pxHistory.sort_values(by='date')
+"""
+Returns the session open used for the sessionId of tablename's bars 
+    None for midnight sessions and for daily bars, which are already labelled with their session's date 
+"""
+def _getDerivedSessionStart(tablename):
+    symbol, interval = _parseTableName(tablename)
+    try:
+        if _parseInterval(interval) >= 86400:
+            return None
+    except ValueError:
+        return None
+    return _getSessionStart(symbol)
 
+"""
+Recomputes the derived columns of tablename for bars between firstDate and lastDate (inclusive) 
+    - the bar before firstDate anchors the first return, the bar after lastDate is refreshed since its return depends on lastDate 
+    - without bounds, or when the side table doesn't exist yet, the whole table is computed 
+    - definitions live in utils.calcDerivedColumns 
+"""
+def _updateDerived(conn, tablename, firstDate=None, lastDate=None):
+    derivedTablename = _derivedTablename(tablename)
+    layout = _getTableLayout(conn, tablename)
+    if not _tableExists(conn, derivedTablename):
+        conn.execute('CREATE TABLE "%s" (date %s PRIMARY KEY, close_logReturn REAL, pctChange REAL, trueRange REAL, sessionId INTEGER, businessDayOfMonth INTEGER)'%(
+            derivedTablename, 'INTEGER' if layout == 2 else 'TEXT'))
+        firstDate, lastDate = None, None
+    
+    where, params = [], []
+    if firstDate is not None:
+        firstKey = _toDateKey(firstDate, layout)
+        where.append('date >= COALESCE((SELECT MAX(date) FROM "%s" WHERE date < ?), ?)'%(tablename))
+        params += [firstKey, firstKey]
+    if lastDate is not None:
+        lastKey = _toDateKey(lastDate, layout)
+        where.append('date <= COALESCE((SELECT MIN(date) FROM "%s" WHERE date > ?), ?)'%(tablename))
+        params += [lastKey, lastKey]
+    
+    sqlStatement = 'SELECT date, high, low, close FROM "%s"'%(tablename)
+    if where:
+        sqlStatement += ' WHERE ' + ' AND '.join(where)
+    bars = pd.read_sql(sqlStatement + ' ORDER BY date', conn, params=params)
+    if bars.empty:
+        return
+    
+    keys = bars['date'].to_numpy()
+    bars['date'] = _fromDateKey(bars['date'], layout)
+    derived = ut.calcDerivedColumns(bars, sessionStart=_getDerivedSessionStart(tablename))
+    derived.insert(0, 'date', keys)
+    if firstDate is not None and keys[0] < firstKey:
+        derived = derived.iloc[1:] # the anchor bar is unchanged
+    
+    columns = list(derived.columns)
+    records = zip(*[derived[col].astype(object).where(derived[col].notna(), None).tolist() for col in columns])
+    conn.executemany('INSERT OR REPLACE INTO "%s" (%s) VALUES (%s)'%(derivedTablename, ', '.join('"%s"'%(col) for col in columns), ', '.join(['?']*len(columns))), records)
+
+"""
+Returns stored derived columns aligned row for row with dates, None if the side table is missing or behind the bars 
+    served from the columnar cache under the side table's name, stamped with the ohlc table's stamp 
+    (derived rows are only ever written together with a version bump of the ohlc table) 
+"""
+def _loadDerived(conn, tablename, dates, useCache=config.use_pxHistoryCache):
+    derivedTablename = _derivedTablename(tablename)
+    if len(dates) == 0 or not _tableExists(conn, derivedTablename):
+        return None
+    first, last = dates.iloc[0], dates.iloc[-1]
+    
+    derived = None
+    if useCache:
+        stamp = _getTableStamp(conn, tablename)
+        derived = _readCachedHistory(conn, derivedTablename, stamp, start=first, end=last)
+    if derived is None:
+        layout = _getTableLayout(conn, derivedTablename)
+        if useCache:
+            derived = pd.read_sql('SELECT * FROM "%s" ORDER BY date'%(derivedTablename), conn)
+        else:
+            sqlStatement, params = _constructSelectStatement(conn, derivedTablename, start=first, end=last, layout=layout)
+            derived = pd.read_sql(sqlStatement + ' ORDER BY date', conn, params=params)
+        derived['date'] = _fromDateKey(derived['date'], layout).to_numpy(dtype='datetime64[ns]')
+        if useCache:
+            _writeCachedHistory(conn, derivedTablename, stamp, derived)
+            derived = derived[(derived['date'] >= first) & (derived['date'] <= last)]
+    
+    # every bar needs its derived row, otherwise fall back to computing in memory 
+    derivedDates = derived['date'].to_numpy(dtype='datetime64[ns]')
+    barDates = dates.to_numpy(dtype='datetime64[ns]')
+    positions = np.searchsorted(derivedDates, barDates)
+    if (positions >= len(derivedDates)).any() or (derivedDates[np.minimum(positions, len(derivedDates) - 1)] != barDates).any():
+        return None
+    return derived.iloc[positions].reset_index(drop=True)
+
+"""
+Adds close_logReturn, pctChange (optional) and any other requested derived columns to px history 
+    read from the side table when it covers the bars, computed in memory otherwise (e.g. resampled intervals) 
+"""
+def _addDerivedColumns(conn, tablename, pxHistory, withpctChange=True, derived=None, useCache=config.use_pxHistoryCache):
+    pxHistory = pxHistory.reset_index(drop=True)
+    stored = _loadDerived(conn, tablename, pxHistory['date'], useCache=useCache) if config.use_derivedColumns else None
+    if stored is None:
+        stored = ut.calcDerivedColumns(pxHistory, sessionStart=_getDerivedSessionStart(tablename))
+    
+    if withpctChange:
+        pxHistory['pctChange'] = stored['pctChange'].to_numpy()
+    pxHistory['close_logReturn'] = stored['close_logReturn'].to_numpy()
+    for col in (derived or []):
+        pxHistory[col] = stored[col].to_numpy()
     return pxHistory
 
 """
@@ -185,8 +914,10 @@ history: [DataFrame]
     pandas dataframe with security timeseries data
 conn: [Sqlite3 connection object]
     connection to the local db 
+tablename: [str] optional
+    target table, e.g. VX_202408_1day for futures; defaults to symbol_type_interval 
 """
-def saveHistoryToDB(history, conn, earliestTimestamp=''):
+def saveHistoryToDB(history, conn, earliestTimestamp='', tablename=''):
     
     ## set type to index if the symbol is in the index list 
     if history['symbol'][0] in index_list:
@@ -194,16 +925,141 @@ def saveHistoryToDB(history, conn, earliestTimestamp=''):
     else: 
         type='stock'
     
-    # Write the dataframe to the database with the correctly formatted table name
-    tableName = history['symbol'][0]+'_'+type+'_'+history['interval'][0]
-    history.to_sql(f"{tableName}", conn, index=False, if_exists='append')
-    
-    #make sure there are no duplicates in the resulting table
-    _removeDuplicates(tableName)
+    # Upsert the dataframe into the table with the correctly formatted table name
+    # the unique date index keeps the table free of duplicates
+    tableName = tablename or history['symbol'][0]+'_'+type+'_'+history['interval'][0]
+    _upsertHistory(conn, tableName, history)
+
+    ## refresh derived columns for the written range only
+    if config.use_derivedColumns:
+        dates = pd.to_datetime(history['date'])
+        _updateDerived(conn, tableName, dates.min(), dates.max())
 
     ## make sure the records lookup table is kept updated
     #if earliestTimestamp:
     _updateLookup_symbolRecords(conn, tableName, earliestTimestamp=earliestTimestamp)
+    if _isFuturesTable(tableName):
+        _updateFuturesCatalog(conn, tableName)
+
+"""
+Write-behind queue for px history: producers put formatted frames, a single writer thread saves them 
+    - frames queued for the same table are concatenated and saved with one saveHistoryToDB call in one transaction, 
+      so the upsert, derived columns and lookup table update run once per batch instead of once per frame 
+    - the queue is bounded, put() blocks while maxPending frames are waiting so fetching can't run ahead of the disk; 
+      coroutines use putAsync(), which waits for room in a worker thread so the event loop keeps running 
+    - writes go through the db's pooled writer connection, so sqlite never sees a second writer 
+    - afterWrite callbacks run on the writer thread inside their batch's transaction, e.g. to advance a backfill checkpoint; 
+      they don't run if the batch fails, or for any later batch of a table that failed 
+
+Usage:
+    with HistoryWriter(dbname) as writer:
+        writer.put(history, tablename='VIX_index_1min')             # or: await writer.putAsync(...) inside a coroutine 
+    # leaving the block writes what is queued and stops the writer, the first write error is raised there 
+"""
+class HistoryWriter:
+    _stop = object()
+
+    def __init__(self, dbname, maxPending=64, maxBatchRows=500000):
+        self.dbname = dbname
+        self.maxBatchRows = maxBatchRows
+        self._queue = queue.Queue(maxsize=maxPending)
+        self._thread = None
+        self._asyncLock = None  # (event loop, lock) keeping putAsync calls in order while they wait for room
+        self.errors = []
+        self._failedTables = set()
+        self.stats = {'frames': 0, 'batches': 0, 'rows': 0}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(raiseErrors=exc_type is None)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='HistoryWriter', daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, history, tablename='', earliestTimestamp='', afterWrite=None):
+        """ queues history for tablename (derived from the frame if not given); afterWrite(conn) runs once it is written """
+        self._queue.put((history, tablename, earliestTimestamp, afterWrite))
+
+    async def putAsync(self, history, tablename='', earliestTimestamp='', afterWrite=None):
+        """ put() for coroutines: never blocks the event loop, waits for room in a worker thread when the queue is full """
+        item = (history, tablename, earliestTimestamp, afterWrite)
+        loop = asyncio.get_running_loop()
+        if self._asyncLock is None or self._asyncLock[0] is not loop:
+            self._asyncLock = (loop, asyncio.Lock())
+        async with self._asyncLock[1]:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                await loop.run_in_executor(None, self._queue.put, item)
+
+    def flush(self):
+        """ blocks until everything queued so far is written """
+        self._queue.join()
+
+    def close(self, raiseErrors=True):
+        if self._thread is not None:
+            self._queue.put(self._stop)
+            self._thread.join()
+            self._thread = None
+        if raiseErrors and self.errors:
+            raise self.errors[0]
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            numRows = 0
+            # drain whatever else is waiting into the same batch
+            while items[-1] is not self._stop and numRows < self.maxBatchRows:
+                numRows += len(items[-1][0]) if items[-1][0] is not None else 0
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is self._stop:
+                stopping = True
+                items.pop()
+            
+            try:
+                self._writeBatch(items)
+            finally:
+                for _ in range(len(items) + stopping):
+                    self._queue.task_done()
+
+    def _writeBatch(self, items):
+        batches = {}
+        for history, tablename, earliestTimestamp, afterWrite in items:
+            if not tablename:
+                tablename = _constructTableName(history['symbol'].iloc[0], history['interval'].iloc[0]) if history is not None and not history.empty else ''
+            batch = batches.setdefault(tablename, {'frames': [], 'earliestTimestamp': '', 'afterWrite': []})
+            if history is not None and not history.empty:
+                batch['frames'].append(history)
+            batch['earliestTimestamp'] = batch['earliestTimestamp'] or earliestTimestamp
+            if afterWrite is not None:
+                batch['afterWrite'].append(afterWrite)
+        
+        for tablename, batch in batches.items():
+            try:
+                with sqlite_connection(self.dbname) as conn:
+                    if batch['frames']:
+                        history = pd.concat(batch['frames'], ignore_index=True)
+                        saveHistoryToDB(history, conn, earliestTimestamp=batch['earliestTimestamp'], tablename=tablename)
+                        self.stats['rows'] += len(history)
+                    # a table that failed before may be missing rows the callbacks assume are written
+                    if tablename not in self._failedTables:
+                        for afterWrite in batch['afterWrite']:
+                            afterWrite(conn)
+                self.stats['frames'] += len(batch['frames'])
+                self.stats['batches'] += 1
+            except Exception as e:
+                print('Could not write %s: %s'%(tablename or 'history', repr(e)))
+                self.errors.append(e)
+                self._failedTables.add(tablename)
 
 """
 Returns dataframe of px from database 
@@ -213,34 +1069,81 @@ Params
 symbol - [str]
 interval - [str] 
 lookback - [str] optional 
+start - [str|datetime] optional, earliest date to return (inclusive) 
+end - [str|datetime] optional, latest date to return (inclusive)
+last_n - [int] optional, only return the last n records (within start/end if set)
+columns - [list] optional, columns to return; date is always included 
+useCache - [bool] serve from the columnar cache when it matches the table 
+derived - [list] optional, extra derived columns to add, any of trueRange, sessionId, businessDayOfMonth 
 
 """
-def getPriceHistory(conn, symbol, interval, withpctChange=True, lastTradeMonth=''):
+def getPriceHistory(conn, symbol, interval, withpctChange=True, lastTradeMonth='', start=None, end=None, last_n=0, columns=None, useCache=config.use_pxHistoryCache, derived=None):
     if lastTradeMonth:
         tableName = symbol+'_'+lastTradeMonth+'_'+interval
     else:
         tableName = _constructTableName(symbol, interval)
-    sqlStatement = 'SELECT * FROM '+tableName
-    pxHistory = pd.read_sql(sqlStatement, conn)
     
-    # format the px history
-    pxHistory = _formatpxHistory(pxHistory)
+    # load formatted px history
+    pxHistory = _loadpxHistory(conn, tableName, interval, start=start, end=end, last_n=last_n, columns=columns, useCache=useCache)
 
-    # calc pct change if needed
-    if withpctChange:
-        pxHistory['pctChange'] = pxHistory['close'].pct_change()
+    if 'close' in pxHistory.columns:
+        # add pct change, log returns and requested derived columns 
+        pxHistory = _addDerivedColumns(conn, tableName, pxHistory, withpctChange=withpctChange, derived=derived, useCache=useCache)
+    
+    return pxHistory.reset_index(drop=True)
 
-    # caclulate log returns
-    pxHistory = ut.calcLogReturns(pxHistory, 'close')
+"""
+Returns dataframe of px from database for a fully qualified tablename, e.g. VIX_202408_1day
+    accepts the same start, end, last_n, columns filters as getPriceHistory
+"""
+def getPriceHistoryWithTablename(conn, tablename, start=None, end=None, last_n=0, columns=None, useCache=config.use_pxHistoryCache, derived=None):
+    interval = tablename.split('_')[-1]
+    pxHistory = _loadpxHistory(conn, tablename, interval, start=start, end=end, last_n=last_n, columns=columns, useCache=useCache)
+    if 'close' in pxHistory.columns:
+        pxHistory = _addDerivedColumns(conn, tablename, pxHistory, withpctChange=False, derived=derived, useCache=useCache)
+    return pxHistory.reset_index(drop=True)
+"""
+Returns px history for many symbols in one call, loaded concurrently on a thread pool 
+    each worker reads through its own pooled read-only connection to the same db as conn 
+
+Params
+===========
+symbols - [list] of str
+interval - [str]
+asFrame - [bool] False returns {symbol: df}; True returns one long df with a symbol column, 
+    sorted by symbol, date - ready for groupby('symbol') e.g. indicators.momentum_factor 
+align - [str] 'inner' keeps only dates every symbol has (asFrame only), 'outer' keeps all rows 
+maxWorkers - [int] loader pool size, pools are kept and reused across calls
+remaining params are passed through to getPriceHistory
+"""
+def getPriceHistories(conn, symbols, interval, withpctChange=True, start=None, end=None, last_n=0, columns=None, asFrame=False, align='inner', maxWorkers=8, useCache=config.use_pxHistoryCache):
+    dbfile = _getDbFilename(conn)
     
-    return pxHistory
+    def _load(symbol):
+        # in-memory dbs can't be shared across connections, fall back to the callers connection
+        _conn = _getReadConnection(dbfile) if dbfile else conn
+        return getPriceHistory(_conn, symbol, interval, withpctChange=withpctChange, start=start, end=end, last_n=last_n, columns=columns, useCache=useCache)
+    
+    if dbfile and len(symbols) > 1:
+        histories = dict(zip(symbols, _getLoadExecutor(maxWorkers).map(_load, symbols)))
+    else:
+        histories = {symbol: _load(symbol) for symbol in symbols}
+    
+    if not asFrame:
+        return histories
+    if not histories:
+        return pd.DataFrame(columns=['date', 'symbol']) # nothing to intersect or concat
+
+    if align == 'inner':
+        commonDates = functools.reduce(np.intersect1d, [history['date'].to_numpy() for history in histories.values()])
+        histories = {symbol: history[history['date'].isin(commonDates)] for symbol, history in histories.items()}
+    
+    for symbol, history in histories.items():
+        history['symbol'] = symbol
+    pxHistories = pd.concat(histories.values(), ignore_index=True)
+    
+    return pxHistories.sort_values(by=['symbol', 'date'], kind='stable').reset_index(drop=True)
 
-def getPriceHistoryWithTablename(conn, tablename):
-    sqlStatement = 'SELECT * FROM '+tablename
-    pxHistory = pd.read_sql(sqlStatement, conn)
-    pxHistory = _formatpxHistory(pxHistory)
-    pxHistory = ut.calcLogReturns(pxHistory, 'close')
-    return pxHistory
 """ 
 Returns the lookup table fo records history as df 
 """
@@ -251,6 +1154,62 @@ def getLookup_symbolRecords(conn):
     symbolRecords['firstRecordDate'] = pd.to_datetime(symbolRecords['firstRecordDate'])
     return symbolRecords
 
+"""
+Returns the date of the last stored bar in tablename as a tz naive Timestamp, None if the table is empty or missing 
+    the watermark incremental syncs start from; a seek on the date key, not a scan 
+"""
+def getLastRecordDate(conn, tablename):
+    if not _tableExists(conn, tablename):
+        return None
+    lastDate = conn.execute('SELECT MAX(date) FROM "%s"'%(tablename)).fetchone()[0]
+    if lastDate is None:
+        return None
+    return _fromDateKey([lastDate], _getTableLayout(conn, tablename))[0]
+
+"""
+Returns the date of the first stored bar in tablename as a tz naive Timestamp, None if the table is empty or missing 
+"""
+def getFirstRecordDate(conn, tablename):
+    if not _tableExists(conn, tablename):
+        return None
+    firstDate = conn.execute('SELECT MIN(date) FROM "%s"'%(tablename)).fetchone()[0]
+    if firstDate is None:
+        return None
+    return _fromDateKey([firstDate], _getTableLayout(conn, tablename))[0]
+
+"""
+Adds the backfillCheckpoint column to the records lookup table if it isn't there yet 
+    the checkpoint is the oldest date history is known to be complete from, up to the latest stored bar 
+"""
+def _ensureBackfillCheckpoint(conn):
+    lookupColumns = [col[1] for col in conn.execute('PRAGMA table_info(\'00-lookup_symbolRecords\')').fetchall()]
+    if lookupColumns and 'backfillCheckpoint' not in lookupColumns:
+        conn.execute('ALTER TABLE \'00-lookup_symbolRecords\' ADD COLUMN backfillCheckpoint TEXT')
+
+"""
+Returns the backfill checkpoint of tablename as a Timestamp, None if no backfill has run for it 
+"""
+def getBackfillCheckpoint(conn, tablename):
+    try:
+        checkpoint = conn.execute('SELECT backfillCheckpoint FROM \'00-lookup_symbolRecords\' WHERE name = ?', (tablename,)).fetchone()
+    except sqlite3.OperationalError:
+        return None # no lookup table, or no checkpoint column yet
+    if checkpoint is None or checkpoint[0] is None:
+        return None
+    return pd.Timestamp(checkpoint[0])
+
+"""
+Stores the backfill checkpoint of tablename; numMissingBusinessDays is reduced to what is left before it 
+    earliestTimestamp - [datetime] optional, earliest date available from ibkr 
+"""
+def setBackfillCheckpoint(conn, tablename, checkpoint, earliestTimestamp=None):
+    _ensureBackfillCheckpoint(conn)
+    checkpoint = pd.Timestamp(checkpoint)
+    conn.execute('UPDATE \'00-lookup_symbolRecords\' SET backfillCheckpoint = ? WHERE name = ?', (checkpoint.strftime('%Y-%m-%d %H:%M:%S'), tablename))
+    if earliestTimestamp is not None:
+        numMissingDays = max(len(pd.bdate_range(pd.Timestamp(earliestTimestamp).normalize(), checkpoint.normalize())) - 1, 0)
+        conn.execute('UPDATE \'00-lookup_symbolRecords\' SET numMissingBusinessDays = ? WHERE name = ?', (numMissingDays, tablename))
+
 """
 lists the unique symbols in the lookup table
 """
@@ -259,6 +1218,129 @@ def listSymbols(conn):
     symbols = pd.read_sql(sqlStatement_selectRecordsTable, conn)
     return symbols
 
+"""
+Returns True for futures tables, i.e. symbol_YYYYMM_interval 
+"""
+def _isFuturesTable(tablename):
+    parts = tablename.split('_')
+    return len(parts) == 3 and len(parts[1]) == 6 and parts[1].isdigit()
+
+"""
+Returns catalog rows (name, symbol, lastTradeMonth, interval, firstDate, lastDate, numRecords) for futures tables, 
+    read from the tables themselves; min/max are seeks on the date key 
+"""
+def _scanFuturesCatalog(conn, tablenames):
+    records = []
+    for tablename in tablenames:
+        firstDate, lastDate, numRecords = conn.execute('SELECT MIN(date), MAX(date), COUNT(*) FROM "%s"'%(tablename)).fetchone()
+        if numRecords == 0:
+            continue
+        symbol, lastTradeMonth, interval = tablename.split('_')
+        layout = _getTableLayout(conn, tablename)
+        firstDate, lastDate = pd.Series(_fromDateKey([firstDate, lastDate], layout)).dt.strftime('%Y-%m-%d %H:%M:%S')
+        records.append((tablename, symbol, lastTradeMonth, interval, firstDate, lastDate, numRecords))
+    return records
+
+"""
+Updates the futures catalog entry of tablename, called on every write to a futures table 
+"""
+def _updateFuturesCatalog(conn, tablename):
+    conn.execute('CREATE TABLE IF NOT EXISTS \'00-lookup_futuresContracts\' (name TEXT PRIMARY KEY, symbol TEXT, lastTradeMonth TEXT, interval TEXT, firstDate TEXT, lastDate TEXT, numRecords INTEGER)')
+    conn.executemany('INSERT OR REPLACE INTO \'00-lookup_futuresContracts\' VALUES (?, ?, ?, ?, ?, ?, ?)', _scanFuturesCatalog(conn, [tablename]))
+
+"""
+Rebuilds the futures catalog from every futures table in the db, for dbs written before the catalog existed 
+"""
+def migrateFuturesCatalog(conn):
+    conn.execute('DROP TABLE IF EXISTS \'00-lookup_futuresContracts\'')
+    tablenames = [tablename for tablename in _listOhlcTables(conn) if _isFuturesTable(tablename)]
+    for tablename in tablenames:
+        _updateFuturesCatalog(conn, tablename)
+    print('futures catalog: %s contracts'%(len(tablenames)))
+
+"""
+Returns the catalog of stored futures contracts as a dataframe 
+    columns: name | symbol | lastTradeMonth | interval | firstDate | lastDate | numRecords, sorted by symbol, interval, lastTradeMonth 
+    dbs without a catalog table are scanned on the fly; run migrateFuturesCatalog to store it 
+"""
+def getFuturesCatalog(conn, symbol=None, interval=None):
+    columns = ['name', 'symbol', 'lastTradeMonth', 'interval', 'firstDate', 'lastDate', 'numRecords']
+    if _tableExists(conn, '00-lookup_futuresContracts'):
+        catalog = pd.read_sql('SELECT * FROM \'00-lookup_futuresContracts\'', conn)
+    else:
+        catalog = pd.DataFrame(_scanFuturesCatalog(conn, [tablename for tablename in _listOhlcTables(conn) if _isFuturesTable(tablename)]), columns=columns)
+    if symbol is not None:
+        catalog = catalog[catalog['symbol'] == symbol]
+    if interval is not None:
+        catalog = catalog[catalog['interval'] == interval]
+    catalog = catalog.astype({'lastTradeMonth': str})
+    catalog['firstDate'] = pd.to_datetime(catalog['firstDate'])
+    catalog['lastDate'] = pd.to_datetime(catalog['lastDate'])
+    return catalog.sort_values(['symbol', 'interval', 'lastTradeMonth']).reset_index(drop=True)
+
+"""
+Reads column for many futures contracts of symbol in one UNION ALL query 
+    returns a long dataframe: lastTradeMonth | date | value, limited to start/end when given 
+    column can also be a list, the values are then returned under the column names 
+"""
+def _readFutures(conn, symbol, lastTradeMonths, column='close', interval='1day', start=None, end=None):
+    columns = [column] if isinstance(column, str) else list(column)
+    for col in columns:
+        if not re.fullmatch(r'\w+', col):
+            raise ValueError('Invalid column: %s'%(col))
+    names = ['value'] if isinstance(column, str) else columns
+    tablenames = {lastTradeMonth: '%s_%s_%s'%(symbol, lastTradeMonth, interval) for lastTradeMonth in lastTradeMonths}
+    tablenames = {lastTradeMonth: tablename for lastTradeMonth, tablename in tablenames.items() if _tableExists(conn, tablename)}
+
+    frames = []
+    # sqlite allows 500 terms per compound select
+    items = list(tablenames.items())
+    for i in range(0, len(items), 400):
+        selects, params, layouts = [], [], {}
+        for lastTradeMonth, tablename in items[i:i + 400]:
+            layout = layouts[lastTradeMonth] = _getTableLayout(conn, tablename)
+            where = []
+            if start is not None:
+                where.append('date >= ?')
+                params.append(_toDateKey(pd.Timestamp(start), layout))
+            if end is not None:
+                where.append('date <= ?')
+                params.append(_toDateKey(pd.Timestamp(end), layout))
+            selects.append('SELECT \'%s\' AS lastTradeMonth, date, %s FROM "%s"%s'%(lastTradeMonth, ', '.join('"%s" AS "%s"'%(col, name) for col, name in zip(columns, names)), tablename, ' WHERE ' + ' AND '.join(where) if where else ''))
+        rows = pd.DataFrame(conn.execute(' UNION ALL '.join(selects), params).fetchall(), columns=['lastTradeMonth', 'date'] + names)
+        
+        # v1 and v2 tables store dates differently, convert per contract
+        for lastTradeMonth, contractRows in rows.groupby('lastTradeMonth', sort=False):
+            frame = {'lastTradeMonth': lastTradeMonth, 'date': _fromDateKey(contractRows['date'].to_numpy(), layouts[lastTradeMonth]).to_numpy()}
+            for name in names:
+                frame[name] = pd.to_numeric(contractRows[name], errors='coerce').to_numpy(dtype='float64')
+            frames.append(pd.DataFrame(frame))
+    
+    if not frames:
+        return pd.DataFrame({'lastTradeMonth': pd.Series(dtype=str), 'date': pd.Series(dtype='datetime64[ns]'), **{name: pd.Series(dtype='float64') for name in names}})
+    return pd.concat(frames, ignore_index=True).drop_duplicates(['lastTradeMonth', 'date'])
+
+"""
+    Returns values of many (lastTradeMonth, date) cells of symbol's futures contracts in one query 
+    inputs:
+        symbol: str
+        lastTradeMonths: YYYYMM, one per date, or a single YYYYMM for all dates 
+        dates: datetimes, one per lastTradeMonth, or a single date for all contracts 
+        column: str, column we want from the db tables 
+        interval: str
+    outputs:
+        pd.Series of values in the order of the inputs, NaN where the contract has no bar on that date 
+"""
+def futures_getValues(conn, symbol, lastTradeMonths, dates, column='close', interval='1day'):
+    cells = pd.DataFrame({'lastTradeMonth': lastTradeMonths, 'date': dates} if np.ndim(lastTradeMonths) or np.ndim(dates) else {'lastTradeMonth': [lastTradeMonths], 'date': [dates]})
+    cells['lastTradeMonth'] = cells['lastTradeMonth'].astype(str)
+    cells['date'] = pd.to_datetime(cells['date'])
+    if cells.empty:
+        return pd.Series(dtype='float64')
+    
+    values = _readFutures(conn, symbol, cells['lastTradeMonth'].unique(), column=column, interval=interval, start=cells['date'].min(), end=cells['date'].max())
+    return cells.merge(values, on=['lastTradeMonth', 'date'], how='left')['value'].rename(column)
+
 """
     Returns value of a specified cell for the target futures contract
     inputs:
@@ -268,15 +1350,145 @@ def listSymbols(conn):
         targetColumn: str, column we want from the db table 
         targetDate: str as YYYY-MM-DD, date of the column we want
     outputs:
-        value of the target cell
+        value of the target cell, NaN if the contract has no bar on targetDate 
 """
 def futures_getCellValue(conn, symbol, interval='1day', lastTradeMonth='202308', targetColumn='close', targetDate='2023-07-21'):
-    # construct tablename
-    tableName = symbol+'_'+str(lastTradeMonth)+'_'+interval
-    targetDate = '2023-07-21 00:00:00'
-    # run sql query to get cell value 
-    sqlStatement = 'SELECT '+targetColumn+' FROM '+tableName+' WHERE date = \''+targetDate+'\''
-
-    value = pd.read_sql(sqlStatement, conn)
-    # return val 
-    return value[targetColumn][0]
\ No newline at end of file
+    return futures_getValues(conn, symbol, [lastTradeMonth], [targetDate], column=targetColumn, interval=interval).iloc[0]
+
+"""
+Returns the term structure of symbol from the stored futures bars, read in one batched query 
+    month1 is the nearest contract that still trades on each date (lastTradeMonth on or after the date's month and 
+    bars up to at least that date), month2 the next one, and so on 
+
+Params
+===========
+dates - [list] optional, dates to build the term structure for; defaults to every date the front contracts have bars 
+numMonths - [int] number of contracts per date 
+outputs: dataframe indexed by date with columns month1..monthN, NaN where a contract has no bar on that date 
+"""
+def futures_getTermStructure(conn, symbol, dates=None, numMonths=8, column='close', interval='1day'):
+    catalog = getFuturesCatalog(conn, symbol=symbol, interval=interval)
+    if catalog.empty:
+        return pd.DataFrame(columns=['month%d'%(i + 1) for i in range(numMonths)])
+    
+    values = _readFutures(conn, symbol, catalog['lastTradeMonth'], column=column, interval=interval,
+        start=None if dates is None else pd.to_datetime(dates).min(), end=None if dates is None else pd.to_datetime(dates).max())
+    dates = pd.DatetimeIndex(sorted(values['date'].unique()) if dates is None else pd.to_datetime(dates)).rename('date')
+    
+    # rank the contracts trading on each date: expiry month not yet passed and last stored bar on or after the date
+    months = catalog['lastTradeMonth'].to_numpy()
+    lastDates = catalog['lastDate'].to_numpy()
+    live = (months[None, :] >= dates.strftime('%Y%m').to_numpy()[:, None]) & (lastDates[None, :] >= dates.to_numpy()[:, None])
+    rank = np.cumsum(live, axis=1)
+    
+    termStructure = pd.DataFrame(index=dates)
+    lookup = values.set_index(['lastTradeMonth', 'date'])['value']
+    for n in range(1, numMonths + 1):
+        # index of the nth live contract per date, -1 if there are fewer than n
+        contract = np.where((rank == n) & live, np.arange(len(months))[None, :], -1).max(axis=1) if len(months) else np.full(len(dates), -1)
+        keys = pd.MultiIndex.from_arrays([np.where(contract >= 0, months[contract], ''), dates])
+        termStructure['month%d'%(n)] = lookup.reindex(keys).to_numpy()
+    return termStructure
+
+"""
+One time migration: canonicalizes v1 dates, dedups every ohlc table and adds the unique date index that saveHistoryToDB upserts against
+    tables indexed before dates were canonicalized are rewritten too 
+"""
+def migrateUniqueDateIndex(conn):
+    for tablename in _listOhlcTables(conn):
+        if _getTableLayout(conn, tablename) == 2:
+            continue
+        if _hasUniqueDateIndex(conn, tablename):
+            numRewritten = _canonicalizeDates(conn, tablename)
+            if numRewritten:
+                conn.commit()
+                print('%s: rewrote %s dates to the canonical format'%(tablename, numRewritten))
+            continue
+        numRecords = conn.execute('SELECT COUNT(*) FROM "%s"'%(tablename)).fetchone()[0]
+        _createDateIndex(conn, tablename)
+        conn.commit()
+        numDuplicates = numRecords - conn.execute('SELECT COUNT(*) FROM "%s"'%(tablename)).fetchone()[0]
+        print('%s: removed %s duplicates, added unique date index'%(tablename, numDuplicates))
+
+"""
+Converts v1 ohlc tables to the v2 layout in place 
+    dates become int64 epoch seconds (the INTEGER PRIMARY KEY), ohlc REAL, volume INTEGER. 
+    symbol and interval are dropped from the rows; the lookup table keeps them. 
+    Each table is converted in its own transaction so an interrupted migration can be re-run.
+
+Params
+==========
+tablename - [str] optional, only convert this table 
+vacuum - [bool] reclaim the freed pages once all tables are converted 
+"""
+def migrateToSchemaV2(conn, tablename=None, vacuum=False):
+    tablenames = [tablename] if tablename else _listOhlcTables(conn)
+    
+    for tablename in tablenames:
+        tableColumns = [col[1] for col in conn.execute('PRAGMA table_info("%s")'%(tablename)).fetchall()]
+        if _getTableLayout(conn, tablename) == 2 or not set(['date', 'open', 'high', 'low', 'close']).issubset(tableColumns):
+            continue # already converted, or not an ohlc table
+        
+        symbol, interval = _parseTableName(tablename)
+        history = _formatpxHistory(pd.read_sql('SELECT * FROM "%s"'%(tablename), conn), interval)
+        
+        tmpTablename = '%s__v2'%(tablename)
+        conn.execute('DROP TABLE IF EXISTS "%s"'%(tmpTablename))
+        _createTableV2(conn, tmpTablename)
+        _upsertHistory(conn, tmpTablename, history)
+        conn.execute('DROP TABLE "%s"'%(tablename))
+        conn.execute('ALTER TABLE "%s" RENAME TO "%s"'%(tmpTablename, tablename))
+        conn.execute('DELETE FROM \'00-lookup_tableVersions\' WHERE name = ?', (tmpTablename,))
+        _bumpTableVersion(conn, tablename)
+
+        # derived rows are keyed on the old text dates, rebuild them against the new keys
+        if _tableExists(conn, _derivedTablename(tablename)):
+            conn.execute('DROP TABLE "%s"'%(_derivedTablename(tablename)))
+            _updateDerived(conn, tablename)
+
+        # make sure the catalog knows symbol and interval, since the rows no longer carry them
+        if len(history) > 0 and _tableExists(conn, '00-lookup_symbolRecords'):
+            if conn.execute('SELECT 1 FROM \'00-lookup_symbolRecords\' WHERE name = ?', (tablename,)).fetchone() is None:
+                _updateLookup_symbolRecords(conn, tablename, earliestTimestamp='')
+        conn.commit()
+        print('%s: converted %s records to v2'%(tablename, len(history)))
+    
+    if vacuum:
+        conn.commit()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)') # in WAL mode the file only shrinks once checkpointed
+
+"""
+Builds (or rebuilds) the derived column side table of every ohlc table, or just tablename 
+    needed once for tables saved before derived columns were materialized 
+"""
+def migrateDerivedColumns(conn, tablename=None):
+    tablenames = [tablename] if tablename else _listOhlcTables(conn)
+    for tablename in tablenames:
+        tableColumns = [col[1] for col in conn.execute('PRAGMA table_info("%s")'%(tablename)).fetchall()]
+        if not set(['date', 'high', 'low', 'close']).issubset(tableColumns):
+            continue # not an ohlc table
+        conn.execute('DROP TABLE IF EXISTS "%s"'%(_derivedTablename(tablename)))
+        _updateDerived(conn, tablename)
+        _bumpTableVersion(conn, tablename)
+        conn.commit()
+        print('%s: built derived columns'%(tablename))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Local DB maintenance')
+    parser.add_argument('command', choices=['migrate-unique-dates', 'migrate-v2', 'build-derived', 'build-futures-catalog'])
+    parser.add_argument('--db', default=dbname_index, help='path to the sqlite db')
+    parser.add_argument('--table', default=None, help='only migrate this table')
+    parser.add_argument('--vacuum', action='store_true', help='reclaim free pages after migrating')
+    args = parser.parse_args()
+
+    with sqlite_connection(args.db) as conn:
+        if args.command == 'migrate-unique-dates':
+            migrateUniqueDateIndex(conn)
+        elif args.command == 'migrate-v2':
+            migrateToSchemaV2(conn, tablename=args.table, vacuum=args.vacuum)
+        elif args.command == 'build-derived':
+            migrateDerivedColumns(conn, tablename=args.table)
+        elif args.command == 'build-futures-catalog':
+            migrateFuturesCatalog(conn)
@@ -20,7 +20,7 @@ import momentumPlots as momoPlots
      helper function to list all the unique symbols in the db
 """
 def listSymbols():
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         symbols = db.listSymbols(conn)
         lookup = db.getLookup_symbolRecords(conn)
 
@@ -48,7 +48,7 @@ else:
 
 
 ### load data for momentum plots
-with db.sqlite_connection(config.dbname_stock) as conn:
+with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
     pxHistory = db.getPriceHistory(conn, symbol, '1day')
     pxHistory_30mins = db.getPriceHistory(conn, symbol, '30mins')
     pxHistory_5mins = db.getPriceHistory(conn, symbol, '5mins')
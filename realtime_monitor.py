@@ -9,6 +9,7 @@ import config
 
 from interface import interface_ibkr as ib
 from interface import interface_localDB as db
+from interface.interface_barStore import BarStore
 from strategy_implementation import strategy_vix3m_vix_ratio as vv
 
 import ffn
@@ -31,7 +32,7 @@ ibkrThrottleTime = 10 # minimum seconds to wait between api requests to ibkr
 def _calc_ntile(pxhistory, numBuckets, colname, rollingWindow=252):
 
     if rollingWindow > 0:
-        pxhistory['%s_ntile' % colname] = pxhistory[colname].rolling(rollingWindow).apply(lambda x: pd.qcut(x, numBuckets, labels=False, duplicates='drop').iloc[-1], raw=False)
+        pxhistory['%s_ntile' % colname] = indicators.rolling_ntile(pxhistory[colname], rollingWindow, numBuckets)
     else:
         pxhistory['%s_ntile' % colname] = pd.qcut(pxhistory[colname], numBuckets, labels=False, duplicates='drop')
     
@@ -48,10 +49,10 @@ def _calc_zscore(pxhistory, colname, rollingWindow=252, rescale = False):
     if rollingWindow == 0:
         pxhistory['%s_zscore'%(colname)] = pxhistory[colname] - pxhistory[colname].mean() / pxhistory[colname].std()
     else: 
-        pxhistory['%s_zscore'%(colname)] = pxhistory[colname].rolling(rollingWindow).apply(lambda x: (x[-1] - x.mean()) / x.std(), raw=True)
+        pxhistory['%s_zscore'%(colname)] = indicators.rolling_zscore(pxhistory[colname].to_numpy(dtype='float64'), rollingWindow)
     
     if rescale:
-        pxhistory['%s_zscore'%(colname)] = ffn.rescale(pxhistory['%s_zscore'%(colname)])
+        pxhistory['%s_zscore'%(colname)] = indicators.rescale(pxhistory['%s_zscore'%(colname)].to_numpy(dtype='float64'))
     
     return pxhistory
 
@@ -67,6 +68,12 @@ def plot_realtime_monitor_vix3m_vix_ratio():
     ax3_twin = ax[1,1].twinx()
 
     vix3m_vix_ratio_object.draw_lineplot(ax[1,0], y='vix3m_vix_ratio', y_alt ='vix3m_vix_ratio_decile', n_periods_to_plot=60, plot_title='VIX3M/VIX Ratio')
+    
+    # one connection for the life of the monitor, reconnected by the session if it drops
+    session = ib.getSession('realtime_monitor')
+    # subscribe once, new 1min bars are streamed into each symbol's ring buffer and persisted to its bar store,
+    # so a restart picks up from the stored bars instead of re-downloading the full lookback
+    streams = {s: ib.BarStream(s, interval='1 min', lookback='7 D', capacity=12000, store=BarStore(s, '1min')) for s in (symbol, symbol2)}
     # vix3m_vix_ratio_object.draw_lineplot(ax[1,1], y='vix3m_vix_ratio_ma_long_vix3m_vix_ratio_ma_short_crossover', y_alt ='vix3m_vix_ratio_ma_long_vix3m_vix_ratio_ma_short_crossover_decile' , n_periods_to_plot=60, plot_title='VIX3M/VIX Ratio Crossover')
 
 
@@ -87,13 +94,14 @@ def plot_realtime_monitor_vix3m_vix_ratio():
         # p2 = Ticker(con2)
         # p2.last = np.random.randint(12, 15)
 
-        ## get data from ib 
-        ibkr = ib.setupConnection() 
-        symbol_bars = ib.getBars(ibkr, symbol = symbol, interval = '1 min', lookback = '7 D')
-        symbol2_bars = ib.getBars(ibkr, symbol = symbol2, interval = '1 min', lookback = '7 D')
-        ibkr.sleep(1)
-        ibkr.disconnect()
-        # print length of bars 
+        ## get data from the streams, (re)subscribing if the connection dropped 
+        ibkr = session.ensureConnected()
+        if not all([stream.ensureStarted(ibkr) for stream in streams.values()]):
+            return # ibkr unavailable, keep the last plot and try again next cycle
+        symbol_bars = streams[symbol].buffer.to_frame()
+        symbol2_bars = streams[symbol2].buffer.to_frame()
+        if symbol_bars.empty or symbol2_bars.empty:
+            return
 
         ## format the returned data 
         symbol_bars.set_index('date', inplace=True)
@@ -190,7 +198,11 @@ def plot_realtime_monitor_vix3m_vix_ratio():
         while True: 
             now = datetime.now() 
             seconds_to_next_minute = 60 - now.second
-            time.sleep(seconds_to_next_minute)
+            # ib.sleep keeps the event loop running so streamed bars arrive while we wait
+            if session.ib.isConnected():
+                session.ib.sleep(seconds_to_next_minute)
+            else:
+                time.sleep(seconds_to_next_minute)
             animate(1) 
 
     # animate the plot 
@@ -10,6 +10,7 @@ import config
 import pandas as pd 
 import seaborn as sns
 from interface import interface_localDB as db
+from core import indicators
 
 from utils import utils_strategyAnalyzer as sa
 
@@ -35,7 +36,7 @@ class Strategy:
 
     # load underlying history from db 
     def _load_underlying_pxhistory(self):
-        with db.sqlite_connection(config.dbname_stock) as conn:
+        with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
             return db.getPriceHistory(conn, self.symbol, '1day')
 
     """
@@ -110,7 +111,7 @@ class Strategy:
         #    self.signal_df['%s_decile'%(self.signal_column_name)] = pd.qcut(self.signal_df['%s_normalized'%(self.signal_column_name)], 10, labels=False)
         
         ## add column '%s_decile'%(self.signal_column_name) that is the rolling decile of the signal
-        self.signal_df['%s_decile'%(self.signal_column_name)] = self.signal_df[self.signal_column_name].rolling(decile_num_rolling).apply(lambda x: pd.qcut(x, 10, labels=False)[-1], raw=True)
+        self.signal_df['%s_decile'%(self.signal_column_name)] = indicators.rolling_ntile(self.signal_df[self.signal_column_name], decile_num_rolling, 10)
         
         # calculate the heatmap 
         heatmap = sa.bucketAndCalcSignalReturns(self.signal_df, signal_colname, maxperiod_fwdreturns=maxperiod_fwdreturns)
@@ -25,7 +25,7 @@ from utils import utils as utils
 def strategy_ycs(startMonth = 7, endMonth = 11):
 
     # get price history
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         history = db.getPriceHistory(conn, 'YCS', '1day', withpctChange=False)
 
     ## add date columns for easier selection 
@@ -100,7 +100,7 @@ def plotResults_ycs(history, returns, returns2, returns_merged):
     ax.legend([baseline, julyToNov, combined, janToMarch], ['history', 'july to nov', 'combined', 'jan to march'])
     
 # get price history
-with db.sqlite_connection(config.dbname_stock) as conn:
+with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
     history = db.getPriceHistory(conn, 'YCS', '1day', withpctChange=False)
     ## add cumsum
     history['cumsum'] = history['logReturn'].cumsum()
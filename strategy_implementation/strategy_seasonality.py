@@ -30,7 +30,7 @@ from interface import interface_localDB as db
 def strategy_monthToMonth(symbol, startMonth, endMonth, direction=1):
 
     # get price history
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         try: 
             history = db.getPriceHistory(conn, symbol, '1day', withpctChange=False)
         except:
@@ -93,18 +93,17 @@ def strategy_monthToMonth(symbol, startMonth, endMonth, direction=1):
 """
 def strategy_dayOfMonthSeasonality(symbol, startDay, endDay, direction=1): 
     # get price history
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         try: 
-            history = db.getPriceHistory(conn, symbol, '1day', withpctChange=False)
+            history = db.getPriceHistory(conn, symbol, '1day', withpctChange=False, derived=['businessDayOfMonth'])
         except:
             print(f'ERROR: Could not retrieve price history for {symbol}')
             exit()
 
     ## add date columns for easier selection 
     history['month'] = history['date'].dt.month
-    history['day'] = history['date'].dt.day
-    # convert day to business day of month 
-    history['day'] = history.apply(lambda x: utils.calculate_business_day_of_month(x), axis=1)
+    # business day of month is materialized with the bars 
+    history['day'] = history.pop('businessDayOfMonth')
     history['year'] = history['date'].dt.year
     
     # make a list dates to open and close trades 
@@ -142,7 +141,7 @@ def plotResults(returns = [], benchmark='SPY'):#, returns2=pd.DataFrame(), retur
     if benchmark == '':
         benchmark = returns[0]['symbol'][0]
     history_underlying = pd.DataFrame()
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         try: 
             history = db.getPriceHistory(conn, benchmark, '1day', withpctChange=False)
             if benchmark != returns[0]['symbol'][0]:
@@ -1,5 +1,7 @@
+import config
 from core import strategy as st
 from core import indicators
+from interface import interface_localDB as db
 from backtests import bt_vix3m_vix_ratio as btsts 
 
 import ffn 
@@ -37,12 +39,16 @@ class StrategyVixAndVol(st.Strategy):
         
         self.symbol = 'VIX'
         self.interval = interval
-        self.pxhistory = self._load_pxhistory(symbol=self.symbol, interval=self.interval)
         self.signal_name = signal_name
+        
+        # load vix, vvix and vix3m together 
+        with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
+            pxhistories = db.getPriceHistories(conn, [self.symbol, 'VVIX', 'VIX3M'], self.interval)
+        self.pxhistory = pxhistories[self.symbol]
 
         ## Nested strategies
-        self.vvix = st.Strategy(name='vvix', symbol='VVIX', signal_name='close', interval=self.interval)
-        self.vix3m = st.Strategy(name='vix3m', symbol='VIX3M', signal_name='close', interval=self.interval)
+        self.vvix = st.Strategy(name='vvix', symbol='VVIX', signal_name='close', interval=self.interval, pxhistory=pxhistories['VVIX'])
+        self.vix3m = st.Strategy(name='vix3m', symbol='VIX3M', signal_name='close', interval=self.interval, pxhistory=pxhistories['VIX3M'])
         self.pxhistory = pd.merge(self.pxhistory, self.vix3m.pxhistory[['date', 'close']], on='date', how='inner', suffixes=('', '_vix3m'))
         
         ## vix3m/vix ratio and associated calcs
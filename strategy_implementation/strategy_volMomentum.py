@@ -13,13 +13,12 @@ import pandas as pd
 import seaborn as sns
 
 sys.path.append('..')
-from utils import utils
-import momentum as momo
+from core import indicators
 
 def strategy_volMom(symbol, interval, topPercentile = 0.998, momoPeriods=[3, 6, 12, 24, 48, 96], fwdReturns = [1, 5, 10, 15, 20, 25, 30]):
     # get price history for vix
     symbol = 'VIX'
-    with db.sqlite_connection(config.dbname_stock) as conn:
+    with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
         try: 
             vix = db.getPriceHistory(conn, symbol, interval, withpctChange=False)
             print(vix.tail(50))
@@ -28,23 +27,13 @@ def strategy_volMom(symbol, interval, topPercentile = 0.998, momoPeriods=[3, 6,
             print(f'ERROR: Could not retrieve price history for {symbol}')
             exit()
     
-    # add momentum factor columns 
-    for period in momoPeriods:
-        vix = momo.calcMomoFactor(vix, period)
-        vix.rename(columns={'momo': 'momo%s'%(period)}, inplace=True)
-        vix.rename(columns={'lagmomo': 'lagmomo%s'%(period)}, inplace=True)
-    
-    # add forward returns columns
-    _n=1
-    for period in fwdReturns:
-        vix['fwdReturns%s'%(_n)] = vix['close'].pct_change(period).shift(-period)
-        _n+=1
-    
-    # calcLogReturns with lag = [1, 3, 5, 10, 15, 20, 25, 30]
+    # add momentum factor, forward returns (fwdReturns1..n) and log returns (logReturn<lag>) columns in one go
     logReturnLags = [1, 3, 5, 10, 15, 20, 25, 30]
-    for lag in logReturnLags:
-        vix = utils.calcLogReturns(vix, 'close', lag=lag)
-        vix.rename(columns={'logReturn': 'logReturn%s'%(lag)}, inplace=True)
+    vix.reset_index(drop=True, inplace=True)
+    vix = pd.concat([vix,
+                     indicators.return_matrix(vix['close'], momoPeriods, kind='momentum').frame(),
+                     indicators.return_matrix(vix['close'], fwdReturns, kind='fwdReturns', labels=['fwdReturns%s'%(n) for n in range(1, len(fwdReturns)+1)]).frame(),
+                     indicators.return_matrix(vix['close'], logReturnLags, kind='logReturns').frame()], axis=1)
     
     print(vix.head(50))
     exit()
@@ -0,0 +1,123 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('ib_insync')
+
+from ib_insync import Contract, ContractDetails
+
+from interface import interface_ibkr as ib
+
+
+class _StubIB:
+    """ answers contract detail lookups from a list of canned answers, one per request """
+    def __init__(self, details=(), headTimestamp=None):
+        self.details = list(details)
+        self.headTimestamp = headTimestamp
+        self.requests = 0
+
+    def reqContractDetails(self, contract):
+        self.requests += 1
+        return self.details.pop(0)
+
+    def reqHeadTimeStamp(self, contract, useRTH=False, whatToShow='TRADES', formatDate=1):
+        self.requests += 1
+        return self.headTimestamp
+
+
+class _StubReplayIB(_StubIB):
+    isReplay = True
+
+
+@pytest.fixture(autouse=True)
+def contractCache(tmp_path, monkeypatch):
+    cache = ib.ContractCache(dbname=str(tmp_path / 'contractCache.db'))
+    monkeypatch.setattr(ib, '_contractCache', cache)
+    return cache
+
+
+def _details(symbol):
+    return [ContractDetails(contract=Contract(conId=1, symbol=symbol, secType='STK', exchange='SMART', currency='USD'))]
+
+
+def test_empty_details_are_not_cached(contractCache):
+    ibkr = _StubIB(details=[[], _details('IBM')])
+    assert ib.getContractDetails(ibkr, 'IBM') == []
+    # the failed lookup is asked again instead of being served as "no such contract" for a week
+    assert ib.getContractDetails(ibkr, 'IBM')[0].contract.symbol == 'IBM'
+    assert ib.getContractDetails(ibkr, 'IBM')[0].contract.symbol == 'IBM'
+    assert ibkr.requests == 2
+    assert contractCache.stats['hits'] == 1
+
+
+def test_replay_sessions_bypass_the_cache(contractCache):
+    replay = _StubReplayIB(details=[[]], headTimestamp=pd.Timestamp('2024-01-02 09:30'))
+    assert ib.getContractDetails(replay, 'IBM') == []
+    assert ib.getEarliestTimeStamp(replay, ib.Stock('IBM', 'SMART', 'USD')) == pd.Timestamp('2024-01-02 09:30')
+
+    # a live session afterwards still asks IBKR
+    live = _StubIB(details=[_details('IBM')], headTimestamp=pd.Timestamp('1990-01-02 09:30'))
+    assert ib.getContractDetails(live, 'IBM')[0].contract.symbol == 'IBM'
+    assert ib.getEarliestTimeStamp(live, ib.Stock('IBM', 'SMART', 'USD')) == pd.Timestamp('1990-01-02 09:30')
+    assert live.requests == 2
+    assert contractCache.stats == {'hits': 0, 'requests': 2}
+
+
+class _Event(list):
+    def __iadd__(self, handler):
+        self.append(handler)
+        return self
+
+
+class _HangingIB:
+    """ connects fine but never answers a ping, the way a half-open socket behaves """
+    def __init__(self, connectFailures=0):
+        self.disconnectedEvent = _Event()
+        self.RequestTimeout = 0
+        self.connectFailures = connectFailures
+        self.connected = False
+        self.pingTimeouts = []
+        self.sleeps = []
+
+    def connect(self, host, port, clientId=1, timeout=4):
+        if self.connectFailures:
+            self.connectFailures -= 1
+            raise ConnectionRefusedError('refused')
+        self.connected = True
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def reqCurrentTime(self):
+        self.pingTimeouts.append(self.RequestTimeout)
+        raise asyncio.TimeoutError()
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+
+
+def test_heartbeat_timeout_counts_as_disconnected():
+    session = ib.IBKRSession(clientId=9001, heartbeatTimeout=2, ibFactory=_HangingIB)
+    try:
+        assert session.ensureConnected() is session.ib
+        session._lastHeartbeat = 0 # idle long enough to be pinged
+        assert session.heartbeat() is False
+        assert session.ib.pingTimeouts == [2]
+        assert session.ib.RequestTimeout == 0 # restored for regular requests
+        assert not session.ib.isConnected()
+    finally:
+        session.close()
+
+
+def test_reconnect_backoff_waits_on_the_ib_loop(monkeypatch):
+    monkeypatch.setattr(ib.time, 'sleep', lambda secs: pytest.fail('time.sleep blocks the event loop'))
+    session = ib.IBKRSession(clientId=9101, maxAttempts=3, ibFactory=lambda: _HangingIB(connectFailures=2))
+    try:
+        assert session.ensureConnected() is session.ib
+        assert session.ib.sleeps == [1, 2]
+    finally:
+        session.close()
@@ -0,0 +1,141 @@
+import asyncio
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('ib_insync')
+
+from interface import interface_ibkrFetcher as fetcher
+from interface import interface_localDB as db
+from interface.interface_ibkrReplay import ReplayIB
+
+
+@pytest.fixture
+def dbname(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'dir_pxHistoryCache', str(tmp_path / 'pxHistoryCache'))
+    dbname = str(tmp_path / 'history.db')
+    dates = pd.date_range('2024-01-02 09:30', periods=600, freq='min')
+    closes = 15 + np.random.default_rng(0).normal(0, 0.1, len(dates)).cumsum()
+    with sqlite3.connect(dbname) as conn:
+        pd.DataFrame({'date': dates.strftime('%Y-%m-%d %H:%M:%S'), 'open': closes, 'high': closes, 'low': closes, 'close': closes,
+                      'volume': 0.0, 'symbol': 'VIX', 'interval': '1min'}).to_sql('VIX_index_1min', conn, index=False)
+    return dbname
+
+
+def _replay(dbname, **kwargs):
+    kwargs.setdefault('enforcePacing', False)
+    return ReplayIB(dbname, start='2024-01-03 09:00', **kwargs).connect()
+
+
+def _fastPacing():
+    """ pacing scaled down so retries of the same request don't wait out IBKR's 15s cooldown """
+    return fetcher.PacingGuard(identicalCooldown=0.05, maxPerContract=100, contractWindow=0.05)
+
+
+def _request(minute, endDate='2024-01-02 %02d:%02d'):
+    return fetcher.BarRequest('VIX', '1800 S', '1 min', endDate=endDate%(10 + minute // 60, minute % 60))
+
+
+def test_identical_requests_wait_for_the_cooldown(dbname):
+    ibkr = _replay(dbname)
+    ibkr._pacing = fetcher.PacingGuard(identicalCooldown=0.5, maxPerContract=100, contractWindow=0.1)
+    answers = []
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxRetries=0, onResult=lambda request, bars, error: answers.append(bars),
+                                                  pacing=fetcher.PacingGuard(identicalCooldown=0.6, maxPerContract=100, contractWindow=0.1))
+    historicalFetcher.submit(_request(0))
+    historicalFetcher.submit(_request(0))
+    started = time.monotonic()
+    historicalFetcher.run()
+
+    assert time.monotonic() - started >= 0.6
+    assert ibkr.stats['violations'] == 0
+    assert [len(bars) for bars in answers] == [30, 30]
+
+
+def test_identical_requests_without_cooldown_violate_pacing(dbname):
+    ibkr = _replay(dbname)
+    ibkr._pacing = fetcher.PacingGuard(identicalCooldown=0.5, maxPerContract=100, contractWindow=0.1)
+    answers = []
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxRetries=0, onResult=lambda request, bars, error: answers.append((bars, error)),
+                                                  pacing=fetcher.PacingGuard(identicalCooldown=0, maxPerContract=100, contractWindow=0.1))
+    historicalFetcher.submit(_request(0))
+    historicalFetcher.submit(_request(0))
+    historicalFetcher.run()
+
+    assert ibkr.stats['violations'] == 1
+    assert sorted(bars is None for bars, _ in answers) == [False, True]
+    assert any(isinstance(error, fetcher.HistoricalDataError) and error.code == 162 for _, error in answers)
+
+
+def test_bursts_per_contract_are_spread_over_the_window(dbname):
+    ibkr = _replay(dbname)
+    ibkr._pacing = fetcher.PacingGuard(identicalCooldown=0, maxPerContract=5, contractWindow=0.5)
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxInFlight=12, maxRetries=0,
+                                                  pacing=fetcher.PacingGuard(identicalCooldown=0, maxPerContract=5, contractWindow=0.6))
+    for i in range(12):
+        historicalFetcher.submit(_request(i * 30))
+    started = time.monotonic()
+    results = historicalFetcher.run()
+
+    # 12 requests at 5 per window take two full windows
+    assert time.monotonic() - started >= 1.2
+    assert ibkr.stats['violations'] == 0
+    assert all(bars is not None and len(bars) == 30 for bars in results.values())
+
+
+def test_transient_errors_are_retried(dbname):
+    ibkr = _replay(dbname, pacingViolationRate=0.5, seed=3)
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, retryDelay=0.01, maxRetries=20, pacing=_fastPacing())
+    for i in range(8):
+        historicalFetcher.submit(_request(i * 30))
+    results = historicalFetcher.run()
+
+    assert ibkr.stats['violations'] > 0
+    assert len(results) == 8
+    assert all(bars is not None and len(bars) == 30 for bars in results.values())
+    assert max(request.attempts for request in results) > 1
+
+
+def test_no_data_is_an_empty_frame_not_a_failure(dbname):
+    ibkr = _replay(dbname)
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, retryDelay=0.01, pacing=_fastPacing())
+    request = fetcher.BarRequest('VIX', '1800 S', '1 min', endDate='2023-06-01 10:00')
+    historicalFetcher.submit(request)
+    results = historicalFetcher.run()
+
+    assert results[request] is not None and results[request].empty
+    assert request.attempts == 1
+
+
+def test_timeouts_are_retried_then_reported(dbname):
+    ibkr = _replay(dbname, latency=0.3)
+    errors = []
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, retryDelay=0.01, maxRetries=1, timeout=0.1, pacing=_fastPacing(),
+                                                  onResult=lambda request, bars, error: errors.append(error))
+    request = _request(0)
+    historicalFetcher.submit(request)
+    results = historicalFetcher.run()
+
+    assert results[request] is None
+    assert isinstance(errors[0], asyncio.TimeoutError)
+    assert request.attempts == 2
+    assert ibkr.stats['timeouts'] == 2
+
+
+def test_failing_callback_does_not_cancel_other_requests(dbname):
+    ibkr = _replay(dbname, latency=0.05)
+    failing = _request(0)
+    def _onResult(request, bars, error):
+        if request == failing:
+            raise ValueError('callback failed')
+    historicalFetcher = fetcher.HistoricalFetcher(ibkr, maxInFlight=4, onResult=_onResult, pacing=_fastPacing())
+    for i in range(6):
+        historicalFetcher.submit(_request(i * 30))
+    results = historicalFetcher.run()
+
+    assert len(results) == 6
+    assert all(bars is not None and len(bars) == 30 for bars in results.values())
+    assert list(historicalFetcher.callbackErrors) == [failing]
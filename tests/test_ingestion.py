@@ -0,0 +1,41 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('ib_insync')
+
+from interface import interface_ibkr as ib
+from interface import interface_ingestion as ingestion
+
+
+class _FailingHeadTimestampIB:
+    """ ib_insync answers a failed reqHeadTimeStamp with [] instead of raising """
+    def reqHeadTimeStamp(self, contract, useRTH=False, whatToShow='TRADES', formatDate=1):
+        return []
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(ib, '_contractCache', ib.ContractCache(dbname=str(tmp_path / 'contractCache.db')))
+    conn = sqlite3.connect(str(tmp_path / 'history.db'))
+    conn.execute("CREATE TABLE '00-lookup_symbolRecords' (name, symbol, interval, firstRecordDate, numMissingBusinessDays)")
+    conn.execute("INSERT INTO '00-lookup_symbolRecords' VALUES ('VIX_index_1day', 'VIX', '1day', '2024-01-10 00:00:00', 5)")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_empty_head_timestamp_falls_back_to_lookup_table(conn):
+    request = ingestion.fetcher.BarRequest('VIX', '1 D', '1 day')
+    earliest = ingestion._getEarliestTimestamp(_FailingHeadTimestampIB(), conn, 'VIX_index_1day', request)
+
+    assert earliest == pd.Timestamp('2024-01-10') - pd.offsets.BDay(5)
+    # the estimate is usable for planning, an empty DatetimeIndex used to abort the backfill here
+    chunks = ingestion.planBackfill(conn, 'VIX_index_1day', earliest, now='2024-02-01')
+    assert chunks and chunks[-1][1] == earliest
+
+
+def test_empty_head_timestamp_without_lookup_record(conn):
+    request = ingestion.fetcher.BarRequest('VIX3M', '1 D', '1 day')
+    assert ingestion._getEarliestTimestamp(_FailingHeadTimestampIB(), conn, 'VIX3M_index_1day', request) is None
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from interface import interface_localDB as db
+
+
+@pytest.fixture
+def dbname(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'dir_pxHistoryCache', str(tmp_path / 'pxHistoryCache'))
+    dbname = str(tmp_path / 'history.db')
+    with sqlite3.connect(dbname) as conn:
+        conn.execute('CREATE TABLE VIX_index_1day (date TEXT, open REAL, high REAL, low REAL, close REAL, volume REAL, symbol TEXT, interval TEXT)')
+        rows = [('2024-01-02 00:00:00-05:00', 1.0), ('2024-01-03 00:00:00', 2.0), ('2024-01-03 00:00:00', 2.0), ('2024-01-04 00:00:00', 3.0)]
+        conn.executemany("INSERT INTO VIX_index_1day VALUES (?, ?, ?, ?, ?, 0, 'VIX', '1day')", [(date, close, close, close, close) for date, close in rows])
+    yield dbname
+    db.closeConnections()
+
+
+def test_filtered_reads_do_not_migrate_v1_tables(dbname):
+    with db.sqlite_connection(dbname) as conn:
+        pxHistory = db.getPriceHistoryWithTablename(conn, 'VIX_index_1day', start='2024-01-03', useCache=False)
+        assert pxHistory['close'].tolist() == [2.0, 3.0]
+
+        assert not db._hasUniqueDateIndex(conn, 'VIX_index_1day')
+        dates = [row[0] for row in conn.execute('SELECT date FROM VIX_index_1day ORDER BY ROWID')]
+        assert dates == ['2024-01-02 00:00:00-05:00', '2024-01-03 00:00:00', '2024-01-03 00:00:00', '2024-01-04 00:00:00']
+
+
+def test_migration_canonicalizes_and_indexes(dbname):
+    with db.sqlite_connection(dbname) as conn:
+        db.migrateUniqueDateIndex(conn)
+        assert db._hasUniqueDateIndex(conn, 'VIX_index_1day')
+        dates = [row[0] for row in conn.execute('SELECT date FROM VIX_index_1day ORDER BY date')]
+        assert dates == ['2024-01-02 00:00:00', '2024-01-03 00:00:00', '2024-01-04 00:00:00']
+
+
+def test_session_id_follows_the_session_open(dbname):
+    dates = ['2024-01-07 18:00:00', '2024-01-07 23:00:00', '2024-01-08 09:00:00', '2024-01-08 16:00:00', '2024-01-08 18:00:00']
+    with db.sqlite_connection(dbname) as conn:
+        conn.execute('CREATE TABLE ES_202403_1hour (date TEXT, open REAL, high REAL, low REAL, close REAL, volume REAL, symbol TEXT, interval TEXT)')
+        conn.executemany("INSERT INTO ES_202403_1hour VALUES (?, 1, 1, 1, 1, 0, 'ES', '1hour')", [(date,) for date in dates])
+        pxHistory = db.getPriceHistoryWithTablename(conn, 'ES_202403_1hour', useCache=False, derived=['sessionId'])
+
+    # Globex opens at 18:00, the Sunday evening bars belong to Monday's session 
+    monday, tuesday = (pd.Timestamp(day).value // 86400_000_000_000 for day in ('2024-01-08', '2024-01-09'))
+    assert pxHistory['sessionId'].tolist() == [monday, monday, monday, monday, tuesday]
+
+
+@pytest.mark.parametrize('align', ['inner', 'outer'])
+def test_no_symbols_return_an_empty_frame(dbname, align):
+    with db.sqlite_connection(dbname) as conn:
+        assert db.getPriceHistories(conn, [], '1day', asFrame=True, align=align).empty
+        assert db.getPriceHistories(conn, [], '1day') == {}
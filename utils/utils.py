@@ -1,4 +1,3 @@
-import math
 import pandas as pd 
 import numpy as np
 
@@ -150,28 +149,71 @@ def aggregate_by_timestamp(history, targetCol):
 """
 def calcLogReturns(history, colName, lag=1, direction=1):
     # calculate log returns 
-    if direction == 1:
-        history['%s_logReturn'%(colName)] = (history[colName].apply(lambda x: math.log(x)) - history[colName].shift(lag).apply(lambda x: math.log(x))).round(5)
-    elif direction == -1:
+    logs = np.log(history[colName].astype('float64'))
+    history['%s_logReturn'%(colName)] = (logs - logs.shift(lag)).round(5)
+    if direction == -1:
         print('Error in utils.py > calcLogReturns')
         # exit()
-        history['%s_logReturn'%(colName)] = (history[colName].apply(lambda x: math.log(x)) - history[colName].shift(lag).apply(lambda x: math.log(x))).round(5)
         history['%s_logReturn'%(colName)] = history['%s_logReturn'%(colName)] * -1  
     return history.reset_index(drop=True)
 
+"""
+    Returns the business day of the month (1 = first business day) for each date, NaN for weekends and holidays 
+    inputs:
+        - dates: series or array of datetimes, intraday timestamps count as their calendar day
+        - holidays: list of dates to skip
+    output:
+        - np array of float
+"""
+def calcBusinessDayOfMonth(dates, holidays=[]):
+    days = pd.to_datetime(np.asarray(dates)).to_numpy(dtype='datetime64[D]')
+    monthStarts = days.astype('datetime64[M]').astype('datetime64[D]')
+    holidays = np.asarray(pd.to_datetime(holidays).to_numpy(dtype='datetime64[D]'))
+    
+    # +1 because we want the count to start from 1
+    businessDayOfMonth = np.busday_count(monthStarts, days, holidays=holidays) + 1
+    return np.where(np.is_busday(days, holidays=holidays), businessDayOfMonth, np.nan)
+
 # Function to calculate business days of the month
 def calculate_business_day_of_month(row, holidays=[]):
-    # Start and end of month
-    start_of_month = row['date'].replace(day=1)
-    end_of_month = start_of_month + pd.offsets.MonthEnd(1)
+    return calcBusinessDayOfMonth([row['date']], holidays=holidays)[0]
+
+"""
+    Returns derived per-bar columns of ohlc history, the single definition used by the local db and analysis modules 
+    inputs:
+        - history: dataframe with date, high, low, close, sorted by date 
+        - prevClose: [optional] close of the bar before the first row, so a tail can be computed on its own 
+        - sessionStart: [optional] session open as a Timedelta from midnight, e.g. 18:00 for Globex; None for midnight sessions 
+    output:
+        - dataframe with close_logReturn, pctChange, trueRange, sessionId, businessDayOfMonth 
+            sessionId: date of the bar's session as days since epoch, shared by every bar of the session; 
+            a session that opens after noon belongs to the next day's date, same as the 1day bars 
+"""
+def calcDerivedColumns(history, prevClose=None, sessionStart=None):
+    close = history['close'].to_numpy(dtype='float64')
+    prev = np.empty_like(close)
+    if len(close):
+        prev[0] = np.nan if prevClose is None else prevClose
+        prev[1:] = close[:-1]
     
-    # Generate business days for the month, excluding weekends and optionally holidays
-    business_days = pd.bdate_range(start=start_of_month, end=end_of_month, freq='B', holidays=holidays)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        derived = pd.DataFrame({
+            'close_logReturn': np.round(np.log(close) - np.log(prev), 5), 
+            'pctChange': close / prev - 1, 
+        }, index=history.index)
     
-    # Calculate business day of the month
-    business_day_of_month = np.where(business_days == row['date'])[0] + 1  # +1 because we want the count to start from 1
-    return business_day_of_month[0] if business_day_of_month.size > 0 else np.nan
-
+    if 'high' in history.columns and 'low' in history.columns:
+        high = history['high'].to_numpy(dtype='float64')
+        low = history['low'].to_numpy(dtype='float64')
+        # first bar without a previous close falls back to high - low 
+        derived['trueRange'] = np.fmax(high, prev) - np.fmin(low, prev)
+    
+    day = np.int64(86400) * 1_000_000_000
+    offset = np.int64(pd.Timedelta(sessionStart).value) % day if sessionStart is not None else np.int64(0)
+    nanos = pd.to_datetime(history['date']).to_numpy(dtype='datetime64[ns]').view('int64')
+    derived['sessionId'] = (nanos - offset) // day + (1 if offset >= day // 2 else 0)
+    derived['businessDayOfMonth'] = calcBusinessDayOfMonth(nanos.view('datetime64[ns]'))
+    return derived
 
 """
     For timeseries data with gaps (e.g., only has business days), this function returns the closest date in pxHistory to the targetDay 
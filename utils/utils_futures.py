@@ -2,7 +2,12 @@
 Util functionsion specific to dealing with futures contracts 
 """
 
-import interface_localDB as db
+import hashlib
+import json
+import os
+import config
+from interface import interface_localDB as db
+import numpy as np
 import pandas as pd
 
 """
@@ -24,34 +29,17 @@ def getRawTermstructure(conn, symbol, lookback=100, numMonths=8):
     # expiryString: current date in format YYYYMM + 1 month 
     expiryString = (pd.to_datetime('today') + pd.DateOffset(months=1)).strftime('%Y%m')
 
-    # get the lookup table
-    lookupTable = db.getLookup_symbolRecords(conn)
+    # select the stored contracts where lastTradeMonth is between currentdate in format YYYYMM + 1 month, and currentdate + numMonths months 
+    catalog = db.getFuturesCatalog(conn, symbol=symbol, interval='1day')
+    catalog = catalog[(catalog['lastTradeMonth'] >= expiryString) & (catalog['lastTradeMonth'] <= (pd.to_datetime('today') + pd.DateOffset(months=numMonths)).strftime('%Y%m'))]
 
-    # select just the records where lastTradeMonth is between currentdate in format YYYYMM + 1 month, and currentdate + numMonths months 
-    lookupTable = lookupTable[(lookupTable['lastTradeMonth'] >= expiryString) & (lookupTable['lastTradeMonth'] <= (pd.to_datetime('today') + pd.DateOffset(months=numMonths)).strftime('%Y%m'))].reset_index(drop=True)
+    ## read the closes of every contract in one query, one column per contract 
+    closes = db._readFutures(conn, symbol, catalog['lastTradeMonth'], column='close', interval='1day')
+    ts = closes.pivot(index='date', columns='lastTradeMonth', values='value')
+    ts.columns = ['close_' + lastTradeMonth for lastTradeMonth in ts.columns]
 
-    ts = pd.DataFrame()
-
-    ## iterate through the lookup table getting px history for each contract 
-    for index, row in lookupTable.iterrows():
-        if ts.empty:
-            ts = db.getPriceHistoryWithTablename(conn, row['name'])
-            # drop all columns other than date and close, rename the close column to close_lastTradeMonth
-            ts = ts[['date', 'close']].rename(columns={'close': 'close_' + row['lastTradeMonth']})
-        else:
-            record = db.getPriceHistoryWithTablename(conn, row['name'])
-            # join record with ts on 'date' and only include the 'close' column renaming it to close_lastTradeMonth 
-            record = record[['date', 'close']].rename(columns={'close': 'close_' + row['lastTradeMonth']})
-            ts = ts.merge(record, on='date', how='left')
-    
     # drop rows in ts where any of the columns has a NaN value
-    ts = ts.dropna(axis=0, how='any').reset_index(drop=True)
-
-    # convert date column to datetime
-    #ts['date'] = pd.to_datetime(ts['date'])
-
-    # make sure tzinfo is set to US/Eastern
-    #ts['date'] = ts['date'].dt.tz_localize('US/Eastern')
+    ts = ts.dropna(axis=0, how='any').reset_index()
 
     return ts
 
@@ -77,4 +65,285 @@ def getContango(ts, startMonth=1, endMonth=None):
 
 
     
-    return ts
\ No newline at end of file
+    return ts
+
+_ohlcv = ['open', 'high', 'low', 'close', 'volume']
+
+"""
+    Returns the expiry of every contract in the catalog as datetime64, in catalog order 
+        expired contracts (no bar on the latest date any contract has) expire on their last stored bar 
+        live contracts get the median offset between expiry and the start of the contract month seen on the expired ones, 
+        e.g. about 17 days for VX, negative for NG which expires the month before 
+    Inputs:
+        catalog: db.getFuturesCatalog for one symbol and interval
+        expiries: optional dict {YYYYMM: date} that overrides the estimates
+"""
+def _estimateExpiries(catalog, expiries=None):
+    monthStart = pd.to_datetime(catalog['lastTradeMonth'], format='%Y%m').to_numpy()
+    lastDate = catalog['lastDate'].dt.normalize().to_numpy()
+    expired = (catalog['lastDate'] < catalog['lastDate'].max()).to_numpy()
+    offset = np.median(lastDate[expired] - monthStart[expired]) if expired.any() else np.timedelta64(14, 'D')
+    estimate = np.where(expired, lastDate, np.maximum(monthStart + offset, lastDate))
+    
+    if expiries:
+        override = catalog['lastTradeMonth'].map({str(month): pd.Timestamp(date) for month, date in expiries.items()})
+        estimate = np.where(override.notna(), override.to_numpy(dtype='datetime64[ns]'), estimate)
+    return estimate.astype('datetime64[ns]')
+
+"""
+    Returns the date each contract stops being held under the expiry or calendar rule, as datetime64 in catalog order 
+        expiry: rollDays business days before the contract's expiry 
+        calendar: schedule[YYYYMM] or schedule(YYYYMM), contracts without a date fall back to the expiry rule 
+"""
+def _scheduledRollDates(catalog, expiryDates, roll, rollDays, schedule):
+    rollDates = (pd.DatetimeIndex(expiryDates) - pd.offsets.BDay(rollDays)).to_numpy()
+    if roll == 'calendar':
+        scheduled = [schedule(month) if callable(schedule) else schedule.get(month) for month in catalog['lastTradeMonth']]
+        scheduled = pd.to_datetime(pd.Series(scheduled, dtype=object)).to_numpy(dtype='datetime64[ns]')
+        rollDates = np.where(np.isnat(scheduled), rollDates, scheduled)
+    return rollDates
+
+"""
+    Returns the first date each contract is out-traded by the next one, NaT if that hasn't happened 
+        the roll takes effect on the bar after the crossover, so no bar uses volume it couldn't have known 
+"""
+def _volumeRollDates(bars, months, fromDate=None):
+    volume = bars.pivot(index='date', columns='lastTradeMonth', values='volume').reindex(columns=months)
+    dates = volume.index.to_numpy()
+    crossDates = np.full(len(months), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if len(dates) < 2 or len(months) < 2:
+        return crossDates
+    
+    # compare each contract with the next; the crossover bar itself needs a following bar to roll on
+    crossed = volume.to_numpy()[:-1, 1:] > volume.to_numpy()[:-1, :-1]
+    if fromDate is not None:
+        crossed &= (dates[1:] >= np.datetime64(fromDate))[:, None]
+    first = crossed.argmax(axis=0)
+    crossDates[:-1] = np.where(crossed.any(axis=0), dates[first + 1], np.datetime64('NaT'))
+    return crossDates
+
+"""
+    Returns the gap at every roll of a stitched series: date of the first bar on the new contract, 
+        diff = new - old and ratio = new / old, both measured on the last bar before the roll 
+        (or on the roll bar itself if the new contract has no bar the day before) 
+"""
+def _rollGaps(series, bars):
+    months = series['lastTradeMonth'].to_numpy()
+    rolls = np.flatnonzero(months[1:] != months[:-1]) + 1
+    if len(rolls) == 0:
+        return pd.DataFrame({'date': pd.Series(dtype='datetime64[ns]'), 'diff': pd.Series(dtype='float64'), 'ratio': pd.Series(dtype='float64')})
+    
+    closes = bars.set_index(['lastTradeMonth', 'date'])['close']
+    dates, close = series['date'].to_numpy(), series['close'].to_numpy()
+    newBefore = closes.reindex(pd.MultiIndex.from_arrays([months[rolls], dates[rolls - 1]])).to_numpy()
+    oldAfter = closes.reindex(pd.MultiIndex.from_arrays([months[rolls - 1], dates[rolls]])).to_numpy()
+    
+    before = ~np.isnan(newBefore)
+    new = np.where(before, newBefore, close[rolls])
+    old = np.where(before, close[rolls - 1], oldAfter)
+    measured = ~np.isnan(new) & ~np.isnan(old) & (old != 0)
+    return pd.DataFrame({
+        'date': dates[rolls],
+        'diff': np.where(measured, new - old, 0.0),
+        'ratio': np.where(measured, new / np.where(measured, old, 1), 1.0)})
+
+"""
+    Back-adjusts ohlc before every roll so the series has no roll gaps; the latest prices stay unadjusted 
+        difference: adds the later gaps, ratio: multiplies by the later ratios 
+"""
+def _backAdjust(series, gaps, adjust):
+    if adjust == 'none' or gaps.empty:
+        return series
+    # rows before a roll date carry that roll's gap
+    later = np.searchsorted(gaps['date'].to_numpy(), series['date'].to_numpy(), side='right')
+    series = series.copy()
+    if adjust == 'difference':
+        shift = np.append(np.cumsum(gaps['diff'].to_numpy()[::-1])[::-1], 0.0)[later]
+        for col in ['open', 'high', 'low', 'close']:
+            series[col] = series[col] + shift
+    else:
+        factor = np.append(np.cumprod(gaps['ratio'].to_numpy()[::-1])[::-1], 1.0)[later]
+        for col in ['open', 'high', 'low', 'close']:
+            series[col] = series[col] * factor
+    return series
+
+"""
+    Returns the cache key for a continuous series, None if it can't be cached (callable schedule) 
+"""
+def _continuousCacheKey(symbol, interval, position, roll, rollDays, schedule, expiries):
+    if callable(schedule):
+        return None
+    params = json.dumps([position, roll, rollDays, schedule, expiries], sort_keys=True, default=str)
+    return '%s_continuous_%s@%s'%(symbol, interval, hashlib.md5(params.encode()).hexdigest()[:12])
+
+"""
+    Returns (meta, unadjusted series) of a cached continuous series, (None, None) if there is none 
+"""
+def _readContinuousCache(conn, cacheKey):
+    cachePath = db._getCachePath(conn, cacheKey)
+    if cachePath is None:
+        return None, None
+    try:
+        with open(os.path.join(cachePath, 'continuous.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    series = db._readCachedHistory(conn, cacheKey, meta['stamps'])
+    if series is None:
+        return None, None
+    return meta, series.astype({'lastTradeMonth': str})
+
+def _writeContinuousCache(conn, cacheKey, meta, series):
+    db._writeCachedHistory(conn, cacheKey, meta['stamps'], series)
+    cachePath = db._getCachePath(conn, cacheKey)
+    if cachePath is None:
+        return
+    try:
+        tmpfile = os.path.join(cachePath, 'continuous.json.%s'%(os.getpid()))
+        with open(tmpfile, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmpfile, os.path.join(cachePath, 'continuous.json'))
+    except OSError as e:
+        print('Could not cache %s: %s'%(cacheKey, e))
+
+"""
+    Returns the earliest date a cached continuous series has to be rebuilt from, None if it is up to date 
+        tables that only changed at their tail (new or overwritten last bars) restart at their previous last bar, 
+        new tables or tables with older history than before at their first bar, moved roll dates at the roll 
+"""
+def _continuousRestart(meta, catalog, stamps, months, scheduledRolls):
+    if set(meta['stamps']) - set(stamps):
+        return pd.Timestamp.min # a contract was removed
+    restart = pd.Timestamp.max
+    for name, firstDate in zip(catalog['name'], catalog['firstDate']):
+        if meta['stamps'].get(name) == stamps[name]:
+            continue
+        previousFirst = meta['firstDates'].get(name)
+        if previousFirst is None or firstDate < pd.Timestamp(previousFirst):
+            restart = min(restart, firstDate)
+        else:
+            restart = min(restart, pd.Timestamp(meta['lastDates'][name]))
+    for month, rollDate in zip(months, pd.DatetimeIndex(scheduledRolls)):
+        previous = meta['scheduledRolls'].get(month)
+        if previous is not None and pd.Timestamp(previous) != rollDate:
+            restart = min(restart, rollDate, pd.Timestamp(previous))
+    return None if restart == pd.Timestamp.max else restart
+
+"""
+    Returns a continuous series stitched from symbol's symbol_YYYYMM_interval tables 
+    Inputs:
+        conn: database connection object
+        symbol: str, e.g. 'VX', 'NG', 'CL'
+        interval: str
+        position: 1 for the front month, 2 for the second month, ...
+        roll: 'expiry'   - roll rollDays business days before the contract expires 
+              'volume'   - roll on the bar after the next contract trades more volume (no open interest is stored), 
+                           or by the expiry rule if that comes first 
+              'calendar' - roll on schedule[YYYYMM] (dict or function of YYYYMM), expiry rule where it has no date 
+        adjust: 'none' | 'difference' | 'ratio' back-adjustment of ohlc at the rolls 
+        expiries: optional dict {YYYYMM: expiry date}; by default expiries are estimated from the stored bars, see _estimateExpiries 
+        useCache: keep the unadjusted series in the px history cache and only rebuild it from the first date that changed 
+    Outputs:
+        dataframe with columns (date, open, high, low, close, volume, lastTradeMonth) 
+"""
+def getContinuousSeries(conn, symbol, interval='1day', position=1, roll='expiry', rollDays=5, schedule=None, adjust='none', expiries=None, useCache=config.use_pxHistoryCache):
+    if roll not in ('expiry', 'volume', 'calendar'):
+        raise ValueError('Unsupported roll rule: %s'%(roll))
+    if adjust not in ('none', 'difference', 'ratio'):
+        raise ValueError('Unsupported adjustment: %s'%(adjust))
+    if roll == 'calendar' and schedule is None:
+        raise ValueError('The calendar roll needs a schedule')
+    
+    catalog = db.getFuturesCatalog(conn, symbol=symbol, interval=interval)
+    if catalog.empty:
+        return pd.DataFrame(columns=['date'] + _ohlcv + ['lastTradeMonth'])
+    months = catalog['lastTradeMonth'].to_numpy()
+    scheduledRolls = _scheduledRollDates(catalog, _estimateExpiries(catalog, expiries), roll, rollDays, schedule)
+    
+    cacheKey = _continuousCacheKey(symbol, interval, position, roll, rollDays, schedule, expiries) if useCache else None
+    stamps = {name: db._getTableStamp(conn, name) for name in catalog['name']} if cacheKey else {}
+    meta, cached = _readContinuousCache(conn, cacheKey) if cacheKey else (None, None)
+    restart = pd.Timestamp.min if meta is None else _continuousRestart(meta, catalog, stamps, months, scheduledRolls)
+    
+    if restart is None:
+        series, gaps = cached, pd.DataFrame(meta['gaps'], columns=['date', 'diff', 'ratio']).astype({'date': 'datetime64[ns]'})
+        return _backAdjust(series, gaps, adjust)
+    
+    # read from a little before the restart, so the bar before it is there to measure roll gaps and crossovers
+    windowStart = None if restart == pd.Timestamp.min else restart - pd.Timedelta(days=14)
+    readMonths = months if windowStart is None else months[(catalog['lastDate'] >= windowStart).to_numpy()]
+    bars = db._readFutures(conn, symbol, readMonths, column=_ohlcv, interval=interval, start=windowStart)
+    
+    rollDates = scheduledRolls.copy()
+    kept = np.zeros(len(months), dtype=bool)
+    if windowStart is not None:
+        # contracts that rolled before the restart keep their roll date
+        previous = pd.to_datetime(pd.Series([meta['rolls'].get(month) for month in months], dtype=object)).to_numpy(dtype='datetime64[ns]')
+        kept = ~np.isnat(previous) & (previous < np.datetime64(restart))
+        rollDates = np.where(kept, previous, rollDates)
+    if roll == 'volume':
+        crossDates = _volumeRollDates(bars, months, fromDate=None if windowStart is None else restart)
+        rollDates = np.where(~kept & ~np.isnat(crossDates) & (crossDates < rollDates), crossDates, rollDates)
+    rollDates = np.maximum.accumulate(rollDates)
+    
+    # the held contract on each date is the position-th one that hasn't rolled yet; dates it has no bar on drop out
+    dates = np.unique(bars['date'].to_numpy())
+    held = np.searchsorted(rollDates, dates, side='right') + position - 1
+    dates, held = dates[held < len(months)], held[held < len(months)]
+    series = pd.DataFrame({'date': dates, 'lastTradeMonth': months[held]}).merge(bars, on=['date', 'lastTradeMonth'], how='inner')
+    series = series[['date'] + _ohlcv + ['lastTradeMonth']].sort_values('date')
+    gaps = _rollGaps(series, bars)
+    
+    if windowStart is not None:
+        series = pd.concat([cached[cached['date'] < restart], series[series['date'] >= restart]], ignore_index=True)
+        previousGaps = pd.DataFrame(meta['gaps'], columns=['date', 'diff', 'ratio']).astype({'date': 'datetime64[ns]'})
+        gaps = pd.concat([previousGaps[previousGaps['date'] < restart], gaps[gaps['date'] >= restart]], ignore_index=True)
+    series = series.reset_index(drop=True)
+    
+    if cacheKey:
+        _writeContinuousCache(conn, cacheKey, {
+            'stamps': stamps,
+            'firstDates': dict(zip(catalog['name'], catalog['firstDate'].astype(str))),
+            'lastDates': dict(zip(catalog['name'], catalog['lastDate'].astype(str))),
+            'scheduledRolls': dict(zip(months, pd.DatetimeIndex(scheduledRolls).astype(str))),
+            'rolls': dict(zip(months, pd.DatetimeIndex(rollDates).astype(str))),
+            'gaps': [[str(date), diff, ratio] for date, diff, ratio in zip(gaps['date'], gaps['diff'], gaps['ratio'])]}, series)
+    return _backAdjust(series, gaps, adjust)
+
+"""
+    Returns a constant maturity series: close interpolated between the two contracts that expire around date + days 
+    Inputs:
+        conn: database connection object
+        symbol: str
+        days: calendar days to maturity, e.g. 30 
+        start, end: optional date bounds 
+        expiries: optional dict {YYYYMM: expiry date}, see _estimateExpiries 
+    Outputs:
+        dataframe with columns (date, close, frontMonth, backMonth, weight), weight is the back month's share 
+        dates where a contract in the pair has no bar drop out 
+"""
+def getConstantMaturitySeries(conn, symbol, days=30, interval='1day', start=None, end=None, expiries=None):
+    catalog = db.getFuturesCatalog(conn, symbol=symbol, interval=interval)
+    columns = ['date', 'close', 'frontMonth', 'backMonth', 'weight']
+    if len(catalog) < 2:
+        return pd.DataFrame(columns=columns)
+    months = catalog['lastTradeMonth'].to_numpy()
+    expiryDates = _estimateExpiries(catalog, expiries)
+    
+    closes = db._readFutures(conn, symbol, months, column='close', interval=interval, start=start, end=end)
+    closes = closes.pivot(index='date', columns='lastTradeMonth', values='value').reindex(columns=months)
+    dates, close = closes.index.to_numpy(), closes.to_numpy()
+    
+    # the back contract is the first one expiring on or after the target date, the front the one before it; 
+    # while the target comes before the first live expiry, the series is the front contract
+    target = dates + np.timedelta64(days, 'D')
+    front = np.maximum(np.searchsorted(expiryDates, target, side='left') - 1, np.searchsorted(expiryDates, dates, side='left'))
+    valid = front + 1 < len(months)
+    front = np.minimum(front, len(months) - 2)
+    back = front + 1
+    
+    weight = np.clip((target - expiryDates[front]) / (expiryDates[back] - expiryDates[front]), 0, 1)
+    rows = np.arange(len(dates))
+    value = close[rows, front] * (1 - weight) + close[rows, back] * weight
+    series = pd.DataFrame({'date': dates, 'close': value, 'frontMonth': months[front], 'backMonth': months[back], 'weight': weight})
+    return series[valid & ~np.isnan(value)].reset_index(drop=True)
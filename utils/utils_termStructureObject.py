@@ -1,8 +1,8 @@
 import pandas as pd
 import seaborn as sns
-import sqlite3
 import config
 import utils
+from interface import interface_localDB as db
 
 class TermStructure:
     def __init__(self, symbol, interval, symbol_underlying):
@@ -19,8 +19,7 @@ class TermStructure:
     def get_raw_term_structure(self):
         symbol = self.symbol.upper()
         tablename = f'{symbol}_{self.interval}'
-        #with db.sqlite_connection(config.dbname_stock) as conn:
-        with sqlite3.connect(self.dbPath_termStructure) as conn:
+        with db.sqlite_connection(self.dbPath_termStructure, readonly=True) as conn:
             ts_raw = pd.read_sql(f'SELECT * FROM {tablename}', conn)
         ts_raw['date'] = pd.to_datetime(ts_raw['date'])
         ts_raw['symbol'] = symbol
@@ -28,14 +27,8 @@ class TermStructure:
         return ts_raw.sort_index(axis=0)
 
     def get_underlying_pxhistory(self):
-        # set type 
-        if self.symbol_underlying in config._indexList:
-            type = 'index'
-        else:
-            type = 'stock'
-        with sqlite3.connect(config.dbname_stock) as conn:
-            underlying_pxhistory = pd.read_sql(f'SELECT * FROM {self.symbol_underlying}_{type}_{self.interval}', conn)
-        underlying_pxhistory['date'] = pd.to_datetime(underlying_pxhistory['date'])
+        with db.sqlite_connection(config.dbname_stock, readonly=True) as conn:
+            underlying_pxhistory = db.getPriceHistory(conn, self.symbol_underlying, self.interval, withpctChange=False)
         underlying_pxhistory.set_index('date', inplace=True)
         return underlying_pxhistory.sort_index(axis=0)
 